@@ -1,7 +1,8 @@
 import logging
-import lzma
 import math
 import os.path
+import random
+import shutil
 import zlib
 from datetime import datetime
 from typing import Optional, Union
@@ -29,10 +30,17 @@ from bounce.util.data_handling import (
     sample_continuous,
     sample_numerical,
 )
+from bounce.util.point_index import PointIndex
 from bounce.util.printing import BColors
+from bounce.util.results import ResultsLog, TrStateLog
 
 from envs.params import BOUNCE_PARAM as bp
 
+CHECKPOINT_FILE = "checkpoint.pt"
+"""
+the name of the checkpoint file in the results directory
+"""
+
 class Bounce:
     """
     Bounce class: implements the Bounce algorithm.
@@ -247,6 +255,7 @@ class Bounce:
         """
         the function values at the input points
         """
+        self._open_logs()
 
         # tr local data
         self._reset_local_data()
@@ -267,6 +276,8 @@ class Bounce:
             0, self.benchmark.representation_dim, dtype=self.dtype
         )
         self.fx_tr = torch.empty(0, dtype=self.dtype)
+        # the points of x_tr in [0, 1]^d, which are never proposed again
+        self.x_tr_index = PointIndex()
 
     def _adjust_number_bins_on_split(self):
         """
@@ -356,12 +367,7 @@ class Bounce:
         for parameter_type in self.benchmark.unique_parameter_types:
             # find number of parameters of type parameter_type
             bins_of_type: list[Bin] = self.random_embedding.bins_of_type(parameter_type)
-            indices_of_type = torch.concat(
-                [
-                    self.random_embedding.bins_and_indices_of_type(parameter_type)[i][1]
-                    for i in range(len(bins_of_type))
-                ]
-            )
+            indices_of_type = self.random_embedding.indices_of_type(parameter_type)
             match parameter_type:
                 case ParameterType.BINARY:
                     _x_init = sample_binary(
@@ -433,7 +439,10 @@ class Bounce:
 
         """
 
-        self.sample_init()
+        if self._n_evals == 0:
+            # Not resumed from a checkpoint
+            self.sample_init()
+            self.save_checkpoint()
 
         while self._n_evals <= self.maximum_number_evaluations:
             axus = self.random_embedding
@@ -521,9 +530,7 @@ class Bounce:
                 # Scale the function values
                 ##########--------CUSTOMED--------##########
                 ## TODO: Unifying data types; numerical and continuous
-                continuous_type = axus.bins_and_indices_of_type(ParameterType.CONTINUOUS) + \
-                                    axus.bins_and_indices_of_type(ParameterType.NUMERICAL) 
-                continuous_indices = torch.tensor([ i for ( _, i ) in continuous_type])
+                continuous_indices = axus.continuous_indices
                 # continuous_indices = torch.tensor(
                 #     [
                 #         i
@@ -546,6 +553,7 @@ class Bounce:
                         x_bests=x_best,  # expects [-1, 1],
                         acquisition_function=acquisition_function,
                         sampler=sampler,
+                        x_index=self.x_tr_index,
                     )
                     x_best = x_best.reshape(-1, axus.target_dim)
                     true_center = x[fx.argmin()]
@@ -681,6 +689,7 @@ class Bounce:
                     # move data to higher-dimensional space
                     self.x_tr = join_data(self.x_tr, index_mapping)
                     self.x_global = join_data(self.x_global, index_mapping)
+                    self.x_tr_index = PointIndex((self.x_tr + 1) / 2)
                     
                     logging.info(f"✅ splitted x_tr shape : {self.x_tr.shape}")
                     print(f"✅ splitted x_tr shape : {self.x_tr.shape}")
@@ -714,17 +723,7 @@ class Bounce:
                     self.trust_region.reset()
 
                     self.sample_init()
-            with lzma.open(os.path.join(self.results_dir, f"results.csv.xz"), "w") as f:
-                np.savetxt(
-                    f,
-                    np.hstack(
-                        (
-                            self.x_up_global.detach().cpu().numpy(),
-                            self.fx_global.detach().cpu().numpy().reshape(-1, 1),
-                        )
-                    ),
-                    delimiter=",",
-                )
+            self.save_checkpoint()
         
         # self.benchmark.env.calculate_improvement_from_default(best_fx=best_fx)
 
@@ -773,6 +772,8 @@ class Bounce:
                 xs_down.detach().cpu(),
             )
         )
+        # index the new points as they are passed to the candidate generation, i.e., in [0, 1]^d
+        self.x_tr_index.add((self.x_tr[len(self.x_tr_index):] + 1) / 2)
         self.x_up_tr = torch.vstack(
             (
                 self.x_up_tr,
@@ -823,13 +824,105 @@ class Bounce:
                 xs_up.detach().cpu(),
             )
         )
+        self._results_log.append(
+            np.hstack(
+                (
+                    xs_up.detach().cpu().numpy(),
+                    fxs.detach().cpu().numpy().reshape(-1, 1),
+                )
+            )
+        )
+
+    _checkpoint_exclude = ("benchmark", "evaluator", "results_dir", "_results_log", "_tr_state_log")
+    """
+    the attributes that are not saved in checkpoints because they hold connections to the clusters or the paths of
+    the results directory, which may have moved when the run is resumed
+    """
+
+    def _open_logs(self):
+        """
+        Open the logs in the results directory, e.g., again after resuming from a checkpoint.
+
+        Returns:
+            None
+
+        """
+        self._results_log = ResultsLog(
+            os.path.join(self.results_dir, "results"), n_columns=self.benchmark.representation_dim + 1
+        )
+        """
+        the global observations on disk, one row [x_up, fx] per evaluation, see `bounce.util.results.read_results`
+        """
+        self._tr_state_log = TrStateLog(os.path.join(self.results_dir, "tr_state.jsonl"))
+        """
+        the trust region states on disk, see `save_tr_state`
+        """
+
+    def save_checkpoint(self):
+        """
+        Save the full state of the optimizer (observations, embedding, trust region, budgets, and random states) to
+        the results directory. The previous checkpoint is replaced atomically, so a crash while saving never corrupts
+        it.
+
+        Returns:
+            None
+
+        """
+        self._tr_state_log.flush()
+        state = {k: v for k, v in self.__dict__.items() if k not in self._checkpoint_exclude}
+        state["_random_states"] = {
+            "torch": torch.get_rng_state(),
+            "numpy": np.random.get_state(),
+            "random": random.getstate(),
+        }
+        path = os.path.join(self.results_dir, CHECKPOINT_FILE)
+        torch.save(state, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, results_dir: str):
+        """
+        Restore the state of the optimizer from the checkpoint in results_dir. `run` then continues where the
+        checkpointed run stopped without benchmarking the evaluated configurations again, and the results are written
+        to results_dir.
+
+        Args:
+            results_dir: the results directory of the run to resume
+
+        Returns:
+            None
+
+        """
+        path = os.path.join(results_dir, CHECKPOINT_FILE)
+        assert os.path.exists(path), f"No checkpoint in {results_dir}"
+        state = torch.load(path)
+        assert (
+            state["x_up_global"].shape[-1] == self.benchmark.representation_dim
+        ), "The checkpoint belongs to a different benchmark"
+        random_states = state.pop("_random_states")
+
+        # The constructor created a new results directory, which is not needed anymore
+        if os.path.abspath(self.results_dir) != os.path.abspath(results_dir) and not os.path.exists(
+            os.path.join(self.results_dir, CHECKPOINT_FILE)
+        ):
+            shutil.rmtree(self.results_dir)
+
+        self.__dict__.update(state)
+        self.results_dir = results_dir
+        self._open_logs()
+        # Drop the rows appended after the checkpoint was saved, they are evaluated again
+        self._results_log.truncate(len(self.fx_global))
+        torch.set_rng_state(random_states["torch"])
+        np.random.set_state(random_states["numpy"])
+        random.setstate(random_states["random"])
+        logging.info(f"⏯ Resuming from {path} after {self._n_evals} evaluations")
 
     def save_tr_state(
         self,
         tr_state: dict[str, Union[float, np.ndarray]],
     ):
         """
-        Save the trust region state to disk.
+        Record the trust region state. The states are written to tr_state.jsonl in the results directory with the
+        next checkpoint.
 
         Args:
             tr_state: the trust region state
@@ -838,6 +931,4 @@ class Bounce:
             None
 
         """
-        for key, value in tr_state.items():
-            with lzma.open(os.path.join(self.results_dir, f"{key}.csv.xz"), "a") as f:
-                np.savetxt(f, value, delimiter=",")
+        self._tr_state_log.append(tr_state, iteration=self._n_evals)
@@ -1,23 +1,233 @@
 import logging
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import numpy as np
 import torch
 from botorch.acquisition import ExpectedImprovement, qExpectedImprovement
 from botorch.models import SingleTaskGP
+from botorch.models.utils import gpt_posterior_settings
 from botorch.optim import optimize_acqf
+from botorch.optim.initializers import initialize_q_batch
 from botorch.sampling import SobolQMCNormalSampler
 from gpytorch.kernels import MaternKernel
+from torch.quasirandom import SobolEngine
 
 from bounce.kernel.categorical_mixture import MixtureKernel
-from bounce.neighbors import hamming_distance, hamming_neighbors_within_tr
+from bounce.neighbors import (
+    hamming_distance,
+    hamming_neighbors_within_tr,
+    hamming_neighbors_within_tr_batch,
+)
+from bounce.util.point_index import PointIndex
 from bounce.projection import AxUS
 from bounce.trust_region import TrustRegion
 from bounce.util.benchmark import ParameterType
 
 from envs.params import NOISE_PARAM as n
-from nsbo.acquisition import get_best_x
+from envs.params import CANDIDATE_PARAM as cp
+from nsbo.acquisition import PosteriorCache, get_best_x
+
+
+class CandidatePool:
+    """
+    Decides how many discrete candidates are sampled around the center of the trust region.
+
+    Without a latency budget, the number of candidates follows the TuRBO paper and only depends on the
+    dimensionality. With a budget, the time it took to sample and score the previous pools is used to size the next
+    pool to the budget, so a slow acquisition function (e.g., a large GP) gets fewer candidates and a fast one more.
+    """
+
+    def __init__(
+        self,
+        latency_budget: Optional[float] = cp["latency_budget"],
+        min_candidates: int = cp["min_candidates"],
+        max_candidates: int = cp["max_candidates"],
+    ):
+        """
+
+        Args:
+            latency_budget: the seconds to spend on sampling and scoring one pool, the TuRBO rule is used if None
+            min_candidates: the minimum pool size with a latency budget
+            max_candidates: the maximum pool size with a latency budget
+        """
+        assert latency_budget is None or latency_budget > 0, "The latency budget must be positive"
+        assert 0 < min_candidates <= max_candidates, "min_candidates must be in (0, max_candidates]"
+        self.latency_budget = latency_budget
+        self.min_candidates = min_candidates
+        self.max_candidates = max_candidates
+        # exponential moving average of the seconds per candidate
+        self._seconds_per_candidate: Optional[float] = None
+
+    def size(self, target_dim: int) -> int:
+        """
+
+        Args:
+            target_dim: the dimensionality of the trust region
+
+        Returns:
+            the number of candidates to sample
+
+        """
+        # define the number of candidates as in the TuRBO paper
+        n_candidates = min(5000, max(2000, 200 * target_dim))
+        if self.latency_budget is None or self._seconds_per_candidate is None:
+            return n_candidates
+        n_candidates = int(self.latency_budget / max(self._seconds_per_candidate, 1e-9))
+        return int(np.clip(n_candidates, self.min_candidates, self.max_candidates))
+
+    def record(self, n_candidates: int, seconds: float):
+        """
+        Record how long sampling and scoring a pool took.
+
+        Args:
+            n_candidates: the number of candidates scored, after adding the spray points and removing the pending ones
+            seconds: the time it took
+
+        Returns:
+            None
+
+        """
+        if n_candidates == 0:
+            return
+        seconds_per_candidate = seconds / n_candidates
+        if self._seconds_per_candidate is None:
+            self._seconds_per_candidate = seconds_per_candidate
+        else:
+            self._seconds_per_candidate = 0.5 * self._seconds_per_candidate + 0.5 * seconds_per_candidate
+
+
+class AcquisitionOptimizer:
+    """
+    Optimizes the acquisition function over the continuous parameters from several restarts.
+
+    The restarts are chosen among Sobol raw samples as in `optimize_acqf`, but the raw samples are drawn once per
+    proposal (see `reset`) and reused by all interleaved steps, only rescaled to the current bounds. The restarts can be
+    optimized in parallel threads. The time spent on each step is logged and kept in `timings` until the next `reset`.
+
+    The settings of gpytorch are process-global and restored on exit of their context managers, so threads entering
+    and leaving them concurrently (e.g., in `model.posterior`) could switch them for each other. The posterior settings
+    are therefore entered once on the calling thread, in the threads they are already set and not switched again.
+    """
+
+    def __init__(
+        self,
+        num_restarts: int = cp["num_restarts"],
+        raw_samples: int = cp["raw_samples"],
+        n_workers: int = cp["restart_workers"],
+    ):
+        """
+
+        Args:
+            num_restarts: the number of restarts
+            raw_samples: the number of raw samples to choose the restarts from
+            n_workers: the number of threads optimizing the restarts, the restarts are split evenly among them
+        """
+        assert 0 < num_restarts <= raw_samples, "num_restarts must be in (0, raw_samples]"
+        assert n_workers > 0, "n_workers must be positive"
+        self.num_restarts = num_restarts
+        self.raw_samples = raw_samples
+        self.n_workers = n_workers
+        self.timings: list[dict[str, float]] = []
+        self._unit_raw_samples: Optional[torch.Tensor] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def reset(self):
+        """
+        Draw new raw samples on the next call and forget the timings, e.g., for the next proposal.
+
+        Returns:
+            None
+
+        """
+        self._unit_raw_samples = None
+        self.timings.clear()
+
+    def _raw_samples(self, bounds: torch.Tensor, fixed_features: dict[int, float]) -> torch.Tensor:
+        n_dims = bounds.shape[-1]
+        if self._unit_raw_samples is None or self._unit_raw_samples.shape[-1] != n_dims:
+            self._unit_raw_samples = SobolEngine(dimension=n_dims, scramble=True).draw(self.raw_samples)
+        unit = self._unit_raw_samples.to(bounds)
+        x_raw = bounds[0] + (bounds[1] - bounds[0]) * unit
+        for i, value in fixed_features.items():
+            x_raw[:, i] = value
+        return x_raw.unsqueeze(1)
+
+    def optimize(
+        self,
+        acquisition_function,
+        bounds: torch.Tensor,
+        fixed_features: Optional[dict[int, float]] = None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Find the maximizer of the acquisition function.
+
+        Args:
+            acquisition_function: the acquisition function
+            bounds: the lower and upper bounds, shape (2, d)
+            fixed_features: the values of the parameters that are not optimized, by index
+
+        Returns:
+            the maximizer, shape (1, d), and its acquisition value
+
+        """
+        with gpt_posterior_settings():
+            return self._optimize(acquisition_function, bounds, fixed_features or dict())
+
+    def _optimize(
+        self,
+        acquisition_function,
+        bounds: torch.Tensor,
+        fixed_features: dict[int, float],
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        start_time = time.perf_counter()
+        x_raw = self._raw_samples(bounds, fixed_features)
+        with torch.no_grad():
+            y_raw = acquisition_function(x_raw)
+        initial_conditions = initialize_q_batch(X=x_raw, Y=y_raw, n=self.num_restarts)
+        scoring_time = time.perf_counter() - start_time
+
+        def optimize_restarts(restarts: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+            return optimize_acqf(
+                acq_function=acquisition_function,
+                bounds=bounds,
+                q=1,
+                num_restarts=len(restarts),
+                fixed_features=fixed_features,
+                batch_initial_conditions=restarts,
+                return_best_only=False,
+            )
+
+        chunks = initial_conditions.tensor_split(min(self.n_workers, len(initial_conditions)))
+        if len(chunks) == 1:
+            results = [optimize_restarts(chunks[0])]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.n_workers)
+            results = list(self._executor.map(optimize_restarts, chunks))
+        candidates = torch.cat([c for c, _ in results])
+        values = torch.cat([v.reshape(-1) for _, v in results])
+        best = values.argmax()
+
+        timing = {
+            "scoring": scoring_time,
+            "optimizing": time.perf_counter() - start_time - scoring_time,
+        }
+        self.timings.append(timing)
+        logging.info(
+            f"⏱ Acquisition optimization: {len(initial_conditions)} restarts from {len(x_raw)} raw samples, "
+            f"{timing['scoring']:.2f}s scoring and {timing['optimizing']:.2f}s optimizing"
+        )
+        return candidates[best], values[best]
+
+    def __getstate__(self):
+        # the thread pool cannot be pickled, it is recreated on demand
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        return state
+
 
 def create_candidates_discrete(
     x_scaled: torch.Tensor,
@@ -33,6 +243,11 @@ def create_candidates_discrete(
     sampler: Optional[SobolQMCNormalSampler] = None,
     noise_mode: bool = False,
     effective: bool = True,
+    x_pending: Optional[torch.Tensor] = None,
+    x_index: Optional[PointIndex] = None,
+    n_local_search_starts: int = cp["local_search_starts"],
+    candidate_pool: Optional[CandidatePool] = None,
+    posterior_cache: Optional[PosteriorCache] = None,
 ) -> tuple[torch.Tensor, torch.Tensor, dict]:
     """
     Create candidate points for the next batch.
@@ -51,16 +266,25 @@ def create_candidates_discrete(
         sampler: The sampler to use for the acquisition function
         noise_free: If in the noise-free case, center is the best solution from observations, 
                     otherwise in the presence of noise, center is the smallest posterior mean from observations.
+        x_pending: The points that are proposed but not evaluated yet, should be in [0, 1]^d. They are never returned.
+        x_index: The index of the points in x_scaled, built from x_scaled if None
+        n_local_search_starts: The number of best candidates to start the local search from
+        candidate_pool: Decides the number of candidates, the TuRBO rule if None
+        posterior_cache: Reuses the posterior at x_scaled across calls with the same model
 
     Returns:
         The candidate points, the function values at the candidate points, the new GP hyperparameters, and the new trust region state
 
     """
 
+    # Points that must not be proposed again
+    x_excluded = PointIndex(x_scaled) if x_index is None else x_index.copy()
+    pending_index = PointIndex(x_pending)
+    if x_pending is not None:
+        x_excluded.add(x_pending)
+
     # Get the indices of the continuous parameters
-    continuous_type = axus.bins_and_indices_of_type(ParameterType.CONTINUOUS) +\
-                        axus.bins_and_indices_of_type(ParameterType.NUMERICAL)
-    indices_not_to_optimize = torch.tensor([i for b, i in continuous_type])
+    indices_not_to_optimize = axus.continuous_indices
     # indices_not_to_optimize = torch.tensor(
     #     [i for b, i in axus.bins_and_indices_of_type(ParameterType.CONTINUOUS)]
     # )
@@ -75,6 +299,7 @@ def create_candidates_discrete(
             fxs=fx_scaled,
             noisy=True,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
         # model.eval()
         # model.likelihood.eval()
@@ -90,6 +315,7 @@ def create_candidates_discrete(
             fxs=fx_scaled,
             noisy=False,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
         # x_centers = torch.clone(x_scaled[fx_scaled.argmin(), :]).detach()
         
@@ -101,8 +327,8 @@ def create_candidates_discrete(
             x_bests[:, indices_not_to_optimize] + 1
         ) / 2
 
-    # define the number of candidates as in the TuRBO paper
-    n_candidates = min(5000, max(2000, 200 * axus.target_dim))
+    if candidate_pool is None:
+        candidate_pool = CandidatePool(latency_budget=None)
 
     x_batch_return = torch.zeros(
         (batch_size, axus.target_dim), dtype=x_scaled.dtype, device=x_scaled.device
@@ -140,6 +366,8 @@ def create_candidates_discrete(
 
             return -_acquisition_function(x.unsqueeze(1))
 
+        start_time = time.perf_counter()
+        n_candidates = candidate_pool.size(axus.target_dim)
         x_candidates = sample_initial_points_discrete(
             x_center=x_centers[batch_index],
             axus=axus,
@@ -156,60 +384,66 @@ def create_candidates_discrete(
             )
             x_candidates = torch.vstack((x_candidates, x_spray))
 
+        x_candidates = x_candidates[~pending_index.contains(x_candidates)]
+
         # Evaluate the acquisition function for all candidates
         with torch.no_grad():
             candidate_acquisition_values = ts(x_candidates, batch_index=batch_index)
+        candidate_pool.record(len(x_candidates), time.perf_counter() - start_time)
         # Find the top k candidates with the highest acquisition function value
         top_k_candidate_indices = torch.topk(
             candidate_acquisition_values,
-            k=min(3, len(candidate_acquisition_values)),
+            k=min(n_local_search_starts, len(candidate_acquisition_values)),
             largest=False,
         )[1]
-        # Start local search
+        # Start local search from each top candidate. The searches are advanced in lockstep, so the neighbors of all
+        # searches that are still improving are evaluated in one call of the acquisition function per step.
+        x_starts = x_candidates[top_k_candidate_indices, :].clone()
+        start_values = candidate_acquisition_values[top_k_candidate_indices].clone()
+        improving = torch.ones(len(x_starts), dtype=torch.bool, device=x_starts.device)
+
         best_posterior_value = torch.inf
         x_best = None
+        if len(start_values) > 0:
+            best_posterior_value = start_values.min().item()
+            x_best = x_starts[start_values.argmin()].unsqueeze(0)
 
-        for top_index in top_k_candidate_indices:
-            x_candidate = x_candidates[top_index, :].clone().unsqueeze(0)
-
-            posterior_value_k = candidate_acquisition_values[top_index].item()
-
-            if posterior_value_k < best_posterior_value:
-                best_posterior_value = posterior_value_k
-                x_best = x_candidate
-            while True:
-                x_start_neighbors = hamming_neighbors_within_tr(
-                    x_center=x_centers[batch_index],
-                    x=x_candidate,
-                    tr_length=trust_region.length_discrete,
-                    axus=axus,
-                )
-
-                # remove rows from x_start_neighbors that are already in self.x (which is a 2d tensor of shape (n, d))
-                for x_eval in x_scaled.to(device=device):
-                    x_start_neighbors = x_start_neighbors[
-                        ~torch.all(x_start_neighbors == x_eval, dim=1)
-                    ]
+        while torch.any(improving):
+            searches = torch.nonzero(improving).squeeze(1)
+            x_start_neighbors, origins = hamming_neighbors_within_tr_batch(
+                x_center=x_centers[batch_index],
+                x=x_starts[searches],
+                tr_length=trust_region.length_discrete,
+                axus=axus,
+            )
 
-                if x_start_neighbors.numel() == 0:
-                    # no neighbors left, continue with next top candidate
-                    break
+            # remove rows from x_start_neighbors that are already in self.x (which is a 2d tensor of shape (n, d))
+            # or that are pending
+            not_excluded = ~x_excluded.contains(x_start_neighbors)
+            x_start_neighbors = x_start_neighbors[not_excluded]
+            origins = searches[origins[not_excluded]]
 
+            if x_start_neighbors.numel() > 0:
                 with torch.no_grad():
                     neighbors_acq_val = ts(x_start_neighbors, batch_index=batch_index)
 
-                if (
-                    len(neighbors_acq_val) > 0
-                    and torch.min(neighbors_acq_val) < posterior_value_k
-                ):
-                    x_candidate = x_start_neighbors[torch.argmin(neighbors_acq_val)]
-                    posterior_value_k = torch.min(neighbors_acq_val).item()
+            for search in searches.tolist():
+                own = origins == search
+                if not torch.any(own):
+                    # no neighbors left, this search is done
+                    improving[search] = False
+                    continue
+                own_acq_val = neighbors_acq_val[own]
+                if torch.min(own_acq_val) < start_values[search]:
+                    x_starts[search] = x_start_neighbors[own][torch.argmin(own_acq_val)]
+                    start_values[search] = torch.min(own_acq_val)
                 else:
-                    # could not find a better neighbor, continue with next top candidate
-                    break
-                if posterior_value_k < best_posterior_value:
-                    best_posterior_value = posterior_value_k
-                    x_best = x_candidate.unsqueeze(0)
+                    # could not find a better neighbor, this search is done
+                    improving[search] = False
+                    continue
+                if start_values[search].item() < best_posterior_value:
+                    best_posterior_value = start_values[search].item()
+                    x_best = x_starts[search].clone().unsqueeze(0)
         if x_best is None:
             warnings.warn(
                 "Could not find a better point than the center of the trust region"
@@ -239,6 +473,7 @@ def create_candidates_discrete(
             fxs=fx_scaled,
             noisy=True,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
         
         tr_state = {
@@ -253,6 +488,7 @@ def create_candidates_discrete(
             fxs=fx_scaled,
             noisy=False,
             effective=effective,
+            posterior_cache=posterior_cache,
             )        
         tr_state = {
             # "center": x_scaled[fx_scaled.argmin(), :].detach().cpu().numpy().reshape(1, -1),
@@ -282,6 +518,8 @@ def create_candidates_continuous(
     sampler: Optional[SobolQMCNormalSampler] = None,
     noise_mode: bool = False,
     effective: bool = True,
+    posterior_cache: Optional[PosteriorCache] = None,
+    acquisition_optimizer: Optional[AcquisitionOptimizer] = None,
 ) -> tuple[torch.Tensor, torch.Tensor, dict]:
     """
     Create candidate points for the next batch.
@@ -299,11 +537,15 @@ def create_candidates_continuous(
         batch_size: int
         noise_free: If in the noise-free case, center is the best solution from observations, 
                     otherwise in the presence of noise, center is the smallest posterior mean from observations.
+        posterior_cache: Reuses the posterior at x_scaled across calls with the same model
+        acquisition_optimizer: Optimizes the acquisition function, 10 restarts from 512 raw samples if None
 
     Returns:
         The candidate points, the function values at the candidate points, the new GP hyperparameters, and the new trust region state
 
     """
+    if acquisition_optimizer is None:
+        acquisition_optimizer = AcquisitionOptimizer(num_restarts=10, raw_samples=512, n_workers=1)
 
     if indices_to_optimize is None:
         indices_to_optimize = torch.arange(axus.target_dim)
@@ -322,6 +564,7 @@ def create_candidates_continuous(
             fxs=fx_scaled,
             noisy=True,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
     else:
         x_centers = get_best_x(
@@ -330,6 +573,7 @@ def create_candidates_continuous(
             fxs=fx_scaled,
             noisy=False,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
 
     # repeat x_centers batch_size many times
@@ -407,16 +651,12 @@ def create_candidates_continuous(
         #     # )
 
         # EI-based acquisition function
-        x_cand_down = optimize_acqf(
-            acq_function=_acquisition_function,
+        x_cand_down = acquisition_optimizer.optimize(
+            acquisition_function=_acquisition_function,
             bounds=torch.stack([tr_lb, tr_ub], dim=0),
-            q=1,
             fixed_features={
                 i: x_center[i].item() for i in indices_not_to_optimize.tolist()
             },
-            num_restarts=10,
-            # raw_samples=20,
-            raw_samples=512,
         )
         x_cand_down, y_cand_down = x_cand_down
         x_cand_downs[batch_index, :] = x_cand_down
@@ -430,6 +670,7 @@ def create_candidates_continuous(
             fxs=fx_scaled,
             noisy=True,
             effective=effective,
+            posterior_cache=posterior_cache,
             )
         tr_state = {
             # "center": x_scaled[posterior.mean.argmax(), :].detach().cpu().numpy().reshape(1, -1),
@@ -445,6 +686,7 @@ def create_candidates_continuous(
             fxs=fx_scaled,
             noisy=False,
             effective=effective,
+            posterior_cache=posterior_cache,
             )  
         tr_state = {
             # "center": x_scaled[fx_scaled.argmin(), :].detach().cpu().numpy().reshape(1, -1),
@@ -490,33 +732,24 @@ def sample_initial_points_discrete(
     
     # copy x_center n_initial_points times
     x_cand = torch.repeat_interleave(x_center.unsqueeze(0), n_initial_points, dim=0)
+    rows = torch.arange(n_initial_points, device=x_cand.device).unsqueeze(1)
 
     for parameter_type in discrete_parameter_types:
         if axus.n_bins_of_type(parameter_type) == 0:
             # No parameters of this type
             continue
         if parameter_type == ParameterType.BINARY:
-            indices = torch.tensor(
-                [i for b, i in axus.bins_and_indices_of_type(parameter_type)]
-            )
-            # draw min(tr_length, len(indices)) indices for each candidate
-            indices_for_cand = torch.tensor(
-                np.array(
-                    [
-                        np.random.choice(
-                            indices, min(tr_length - 1, len(indices)), replace=False
-                        )
-                        for _ in range(n_initial_points)
-                    ]
-                ),
-                dtype=torch.long,
-                device=x_cand.device,
-            )
+            indices = axus.indices_of_type(parameter_type).to(device=x_cand.device)
+            # draw min(tr_length - 1, len(indices)) indices for each candidate, the first indices of a random
+            # permutation per candidate
+            n_indices = int(min(tr_length - 1, len(indices)))
+            permutations = torch.rand(n_initial_points, len(indices), device=x_cand.device).argsort(dim=1)
+            indices_for_cand = indices[permutations[:, :n_indices]]
             # draw values for each index
             values_for_cand = torch.randint(
                 0,
                 2,
-                (n_initial_points, len(indices_for_cand[0])),
+                (n_initial_points, n_indices),
                 dtype=x_cand.dtype,
                 device=x_cand.device,
             )
@@ -524,34 +757,26 @@ def sample_initial_points_discrete(
             x_cand = x_cand.scatter_(1, indices_for_cand, values_for_cand)
         elif parameter_type == ParameterType.CATEGORICAL:
             indicess = [i for b, i in axus.bins_and_indices_of_type(parameter_type)]
-            if len(indicess) > tr_length:
-                index_setss = [
-                    np.random.choice(
-                        np.arange(len(indicess)),
-                        min(tr_length, len(indicess)),
-                        replace=False,
-                    )
-                    for _ in range(n_initial_points)
-                ]
-                for i, index_sets in enumerate(index_setss):
-                    index_sets = [indicess[i] for i in index_sets]
-                    # set x_cand to 0 for each index
-                    x_cand[i, torch.cat(index_sets)] = 0
-                    if True:  # else:
-                        # this is the expensive part
-                        for indices in index_sets:
-                            # set one index to 1
-                            x_cand[i, np.random.choice(indices)] = 1
+            n_bins = len(indicess)
+            # draw min(tr_length, n_bins) bins for each candidate
+            if n_bins > tr_length:
+                permutations = torch.rand(n_initial_points, n_bins, device=x_cand.device).argsort(dim=1)
+                bins_for_cand = torch.zeros(n_initial_points, n_bins, dtype=torch.bool, device=x_cand.device)
+                bins_for_cand[rows, permutations[:, : int(tr_length)]] = True
             else:
-                for indices in indicess:
-                    # set x_cand to 0 for each index
-                    x_cand[:, indices] = 0
-                    # sample n_initial_points indices
-                    indices_for_cand = np.random.choice(indices, n_initial_points)
-                    # set one index to 1
-                    x_cand[torch.arange(n_initial_points), indices_for_cand] = 1
-            pass
-
+                bins_for_cand = torch.ones(n_initial_points, n_bins, dtype=torch.bool, device=x_cand.device)
+            # set x_cand to 0 for each index of the drawn bins
+            bin_sizes = torch.tensor([len(i) for i in indicess], device=x_cand.device)
+            bin_of_index = torch.repeat_interleave(torch.arange(n_bins, device=x_cand.device), bin_sizes)
+            all_indices = torch.concat(indicess).to(device=x_cand.device)
+            x_cand[:, all_indices] = torch.where(bins_for_cand[:, bin_of_index], 0, x_cand[:, all_indices])
+            # set one random index of each drawn bin to 1
+            bin_starts = torch.cumsum(bin_sizes, dim=0) - bin_sizes
+            categories = torch.minimum(
+                (torch.rand(n_initial_points, n_bins, device=x_cand.device) * bin_sizes).long(), bin_sizes - 1
+            )
+            indices_for_cand = all_indices[bin_starts + categories]
+            x_cand[rows.expand_as(indices_for_cand)[bins_for_cand], indices_for_cand[bins_for_cand]] = 1
         elif parameter_type == ParameterType.ORDINAL:
             raise NotImplementedError("Ordinal parameters are not supported yet")
         else:
@@ -1,5 +1,11 @@
+import atexit
+import copy
 import logging
-from typing import Optional
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
 
 import gpytorch
 import numpy as np
@@ -57,13 +63,11 @@ def get_gp(
 
     assert not discrete_ard, "ARD for discrete parameters is not supported yet"
     assert continuous_ard, "ARD for continuous parameters is always used"
-    continuous_type = axus.bins_and_indices_of_type(ParameterType.CONTINUOUS) +\
-                        axus.bins_and_indices_of_type(ParameterType.NUMERICAL)
-    continuous_dims = np.array([ i.item() for ( _, i ) in continuous_type])
+    continuous_dims = axus.continuous_indices.numpy()
     # continuous_dims = np.asarray(
     #     [i.item() for b, i in axus.bins_and_indices_of_type(ParameterType.CONTINUOUS)]
     # )
-    discrete_dims = np.setdiff1d(np.arange(axus.target_dim), continuous_dims)
+    discrete_dims = axus.discrete_indices.numpy()
 
     if len(discrete_dims) == 0:
         kernel = gpytorch.kernels.MaternKernel(
@@ -128,6 +132,8 @@ def fit_mll(
     train_fx: Tensor,
     max_cholesky_size: int = 1000,
     use_scipy_lbfgs: bool = True,
+    n_restarts: int = p["mll_restarts"],
+    n_workers: int = p["mll_workers"],
 ) -> None:
     """
     Fit the GP model. If the LBFGS optimizer fails, use the Adam optimizer.
@@ -138,11 +144,25 @@ def fit_mll(
         train_fx: the function values at the input points
         max_cholesky_size: the maximum size of the Cholesky decomposition
          use_scipy_lbfgs: whether to use the scipy LBFGS optimizer, otherwise use the Adam optimizer
+        n_restarts: the number of starting points of the fit, see `fit_mll_multistart`
+        n_workers: the number of processes fitting the starting points in parallel
 
     Returns:
         None
 
     """
+    if n_restarts > 1:
+        fit_mll_multistart(
+            fit=fit_mll,
+            model=model,
+            train_x=train_x,
+            train_fx=train_fx,
+            n_restarts=n_restarts,
+            n_workers=n_workers,
+            max_cholesky_size=max_cholesky_size,
+            use_scipy_lbfgs=use_scipy_lbfgs,
+        )
+        return
     # Set model to training mode
     model.train()
     model.likelihood.train()
@@ -177,3 +197,131 @@ def fit_mll(
 
     model.eval()
     model.likelihood.eval()
+
+
+def sample_hyperparameters_from_priors(model: SingleTaskGP) -> None:
+    """
+    Set every hyperparameter that has a prior to a sample of its prior, clamped to the constraint of the parameter.
+
+    Args:
+        model: the GP model
+
+    Returns:
+        None
+
+    """
+    for name, module, prior, closure, setting_closure in model.named_priors():
+        value = prior.sample(closure(module).shape)
+        # e.g., "covar_module.outputscale_prior" constrains "raw_outputscale"
+        parameter = name.rsplit(".", 1)[-1].removesuffix("_prior")
+        constraint = getattr(module, f"raw_{parameter}_constraint", None)
+        if constraint is not None:
+            lower = torch.as_tensor(constraint.lower_bound, dtype=value.dtype)
+            upper = torch.as_tensor(constraint.upper_bound, dtype=value.dtype)
+            margin = 1e-4 * torch.clamp(upper - lower, max=1.0)
+            value = torch.minimum(torch.maximum(value, lower + margin), upper - margin)
+        setting_closure(module, value)
+
+
+def fit_mll_multistart(
+    fit: Callable,
+    model: SingleTaskGP,
+    train_x: Tensor,
+    train_fx: Tensor,
+    n_restarts: int,
+    n_workers: int,
+    **fit_kwargs,
+) -> None:
+    """
+    Fit the GP model from several starting points and keep the fit with the highest marginal likelihood.
+
+    The first starting point are the current hyperparameters of the model (e.g., warm-started from the last fit), the
+    others are drawn from the priors of the hyperparameters (see `GP_PARAM`). The starting points are fitted in
+    parallel in a pool of processes, which is created and warmed up once and kept for the following fits. With
+    fewer than two starting points or cores per fit, the starting points are fitted one after another in this process
+    as the pool would not pay off.
+
+    Args:
+        fit: the single-start fitting function, e.g., `fit_mll`
+        model: the GP model, set to the best fit
+        train_x: the input points
+        train_fx: the function values at the input points
+        n_restarts: the number of starting points
+        n_workers: the maximal number of processes, 1 fits the starting points one after another in this process
+        **fit_kwargs: passed to fit
+
+    Returns:
+        None
+
+    """
+    starts = [copy.deepcopy(model) for _ in range(n_restarts)]
+    for start in starts[1:]:
+        sample_hyperparameters_from_priors(start)
+
+    jobs = [(fit, start, train_x, train_fx, fit_kwargs) for start in starts]
+    n_workers = min(n_workers, n_restarts, os.cpu_count() or 1)
+    if n_workers > 1:
+        results = list(_get_fitting_pool(n_workers).map(_fit_start, jobs))
+    else:
+        results = [_fit_start(job) for job in jobs]
+
+    best = int(np.nanargmax([value for _, value in results]))
+    model.load_state_dict(results[best][0])
+    logging.info(
+        f"🎲 Best of {n_restarts} GP fits: start {best} with marginal log likelihood {results[best][1]:.3f}"
+    )
+    model.eval()
+    model.likelihood.eval()
+
+
+def _fit_start(job: tuple) -> tuple[dict, float]:
+    fit, model, train_x, train_fx, fit_kwargs = job
+    try:
+        fit(model=model, train_x=train_x, train_fx=train_fx, n_restarts=1, **fit_kwargs)
+        model.train()
+        model.likelihood.train()
+        mll = ExactMarginalLogLikelihood(model.likelihood, model)
+        with torch.no_grad():
+            value = mll(model(*model.train_inputs), model.train_targets).item()
+    except Exception:
+        logging.exception("⚠ Failed to fit GP from one of the starting points")
+        value = float("nan")
+    model.eval()
+    model.likelihood.eval()
+    return model.state_dict(), value
+
+
+_FITTING_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _init_fitting_worker() -> None:
+    # Only torch and this module are set up in the workers, the entry point of the run is imported without running it
+    torch.set_num_threads(1)
+
+
+def _warm_up_fitting_worker(_: int) -> int:
+    return os.getpid()
+
+
+def _get_fitting_pool(n_workers: int) -> ProcessPoolExecutor:
+    # Spawned once and reused, forked processes can hang in the thread pools of torch
+    global _FITTING_POOL
+    if _FITTING_POOL is None or _FITTING_POOL._max_workers != n_workers:
+        if _FITTING_POOL is not None:
+            _FITTING_POOL.shutdown()
+        _FITTING_POOL = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_fitting_worker,
+        )
+        # Start all workers now so that the imports in the spawned processes are not paid by the first fit only
+        then = time.time()
+        list(_FITTING_POOL.map(_warm_up_fitting_worker, range(n_workers)))
+        logging.info(f"🏊 Started {n_workers} processes for fitting the GP in {time.time() - then:.2f} seconds")
+    return _FITTING_POOL
+
+
+@atexit.register
+def _shutdown_fitting_pool() -> None:
+    if _FITTING_POOL is not None:
+        _FITTING_POOL.shutdown(cancel_futures=True)
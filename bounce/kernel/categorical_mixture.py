@@ -1,4 +1,5 @@
-from typing import Optional
+import math
+from typing import Optional, Union
 
 import numpy as np
 import torch
@@ -7,7 +8,80 @@ from gpytorch.kernels import Kernel, MaternKernel
 from gpytorch.priors import Prior
 
 
+def _dims_index(dims: list[int]) -> Union[slice, torch.Tensor]:
+    """
+    The index selecting some dimensions of the last axis of an input.
+
+    Args:
+        dims: the dimensions
+
+    Returns:
+        a slice if the dimensions are consecutive, such that indexing returns a view, otherwise the dimensions as a tensor
+
+    """
+    if len(dims) > 0 and list(dims) == list(range(dims[0], dims[0] + len(dims))):
+        return slice(dims[0], dims[0] + len(dims))
+    return torch.as_tensor(dims, dtype=torch.long)
+
+
+class _Matern52Mixture(torch.autograd.Function):
+    """
+    The mixture (1 - λ) (k_d + k_c) + λ k_d k_c of two Matérn 5/2 kernels, computed from the lengthscale-scaled
+    distances in one pass. The backward pass uses the closed-form derivative of the Matérn 5/2 kernel,
+    dk/dr = -5/3 r (1 + √5 r) exp(-√5 r), instead of differentiating through every elementwise operation.
+    """
+
+    @staticmethod
+    def forward(ctx, discrete_distance: torch.Tensor, continuous_distance: torch.Tensor, lamda: torch.Tensor):
+        exp_discrete = torch.exp(-math.sqrt(5) * discrete_distance)
+        exp_continuous = torch.exp(-math.sqrt(5) * continuous_distance)
+        k_discrete = _matern52_polynomial(discrete_distance).mul_(exp_discrete)
+        k_continuous = _matern52_polynomial(continuous_distance).mul_(exp_continuous)
+        ctx.save_for_backward(discrete_distance, continuous_distance, lamda, exp_discrete, exp_continuous)
+        return (k_discrete + k_continuous).mul_(1 - lamda).add_(k_discrete.mul_(k_continuous).mul_(lamda))
+
+    @staticmethod
+    @torch.autograd.function.once_differentiable
+    def backward(ctx, grad_output: torch.Tensor):
+        discrete_distance, continuous_distance, lamda, exp_discrete, exp_continuous = ctx.saved_tensors
+        k_discrete = _matern52_polynomial(discrete_distance).mul_(exp_discrete)
+        k_continuous = _matern52_polynomial(continuous_distance).mul_(exp_continuous)
+        grad_discrete = grad_continuous = grad_lamda = None
+        if ctx.needs_input_grad[0]:
+            grad_discrete = grad_output * (1 - lamda + lamda * k_continuous) * _matern52_derivative(
+                discrete_distance, exp_discrete
+            )
+        if ctx.needs_input_grad[1]:
+            grad_continuous = grad_output * (1 - lamda + lamda * k_discrete) * _matern52_derivative(
+                continuous_distance, exp_continuous
+            )
+        if ctx.needs_input_grad[2]:
+            grad_lamda = (grad_output * (k_discrete * k_continuous - k_discrete - k_continuous)).sum_to_size(
+                lamda.shape
+            )
+        return grad_discrete, grad_continuous, grad_lamda
+
+
+def _matern52_polynomial(distance: torch.Tensor) -> torch.Tensor:
+    # 1 + √5 r + 5/3 r²
+    return torch.addcmul(distance.mul(math.sqrt(5)).add_(1), distance, distance, value=5.0 / 3.0)
+
+
+def _matern52_derivative(distance: torch.Tensor, exp_component: torch.Tensor) -> torch.Tensor:
+    # -5/3 r (1 + √5 r) exp(-√5 r)
+    return distance.mul(math.sqrt(5)).add_(1).mul_(distance).mul_(exp_component).mul_(-5.0 / 3.0)
+
+
 class MixtureKernel(Kernel):
+    """
+    The mixture of a kernel on the discrete and a kernel on the continuous dimensions,
+    (1 - λ) (k_d + k_c) + λ k_d k_c, optionally multiplied by a kernel on fidelity dimensions.
+
+    The discrete kernel has a single lengthscale, so its distance matrix does not depend on the hyperparameters. The
+    distance matrix of the training inputs is computed once and reused across the evaluations of the marginal
+    log-likelihood, and both kernels are evaluated densely in one pass instead of as lazy kernel tensors.
+    """
+
     has_lengthscale = True
 
     def __init__(
@@ -21,6 +95,8 @@ class MixtureKernel(Kernel):
         continuous_lengthscale_constraint: Interval = None,
         discrete_ard: bool = False,
         continuous_ard: bool = True,
+        fidelity_dims: Optional[list[int]] = None,
+        fidelity_lengthscale_prior: Prior = None,
         **kwargs
     ):
         super(MixtureKernel, self).__init__(has_lengthscale=True, **kwargs)
@@ -38,6 +114,21 @@ class MixtureKernel(Kernel):
         self.discrete_dims_np = np.asarray(discrete_dims)
         self.continuous_dims_np = np.asarray(continuous_dims)
 
+        # Optional fidelity dimensions (e.g., the workload size). The mixture kernel is multiplied by a kernel on
+        # them, so observations at different fidelities are correlated but not identical.
+        self.fidelity_dims = fidelity_dims if fidelity_dims is not None else []
+        assert (
+            len(set(self.fidelity_dims).intersection(set(discrete_dims) | set(continuous_dims))) == 0
+        ), "Fidelity dims must be disjoint from discrete and continuous dims."
+        self.fidelity_dims_np = np.asarray(self.fidelity_dims)
+
+        self._discrete_index = _dims_index(discrete_dims)
+        self._continuous_index = _dims_index(continuous_dims)
+        self._fidelity_index = _dims_index(self.fidelity_dims)
+        # the training inputs and the distance matrix of their discrete dimensions
+        self._cached_x: Optional[torch.Tensor] = None
+        self._cached_discrete_distance: Optional[torch.Tensor] = None
+
         self.register_parameter("raw_lamda", torch.nn.Parameter(torch.ones(1)))
         self.register_constraint("raw_lamda", Interval(0, 1))
 
@@ -53,6 +144,15 @@ class MixtureKernel(Kernel):
             lengthscale_constraint=continuous_lengthscale_constraint,
             lengthscale_prior=continuous_lengthscale_prior,
         )
+        self.fidelity_kernel = (
+            MaternKernel(
+                nu=2.5,
+                ard_num_dims=len(self.fidelity_dims),
+                lengthscale_prior=fidelity_lengthscale_prior,
+            )
+            if len(self.fidelity_dims) > 0
+            else None
+        )
 
     @property
     def lamda(self):
@@ -81,6 +181,72 @@ class MixtureKernel(Kernel):
             else:
                 self.fixed_lamda = value
 
+    @staticmethod
+    def _select(x: torch.Tensor, index: Union[slice, torch.Tensor]) -> torch.Tensor:
+        if isinstance(index, slice):
+            return x[..., index]
+        return x.index_select(-1, index.to(device=x.device))
+
+    def _discrete_distance(self, x1: torch.Tensor, x2: torch.Tensor, diag: bool) -> torch.Tensor:
+        """
+        The lengthscale-scaled distances of the discrete dimensions. The unscaled distance matrix of the training
+        inputs, i.e., x1 is x2 and no gradient w.r.t. the inputs is needed, does not depend on the hyperparameters and
+        is cached as long as the inputs do not change.
+
+        Args:
+            x1: the first inputs, all dimensions
+            x2: the second inputs, all dimensions
+            diag: whether to only compute the diagonal
+
+        Returns:
+            the scaled distances
+
+        """
+        lengthscale = self.discrete_kernel.lengthscale
+        cacheable = x1 is x2 and not diag and not x1.requires_grad and not self.discrete_ard
+        if cacheable:
+            cached = self._cached_x
+            if not (
+                cached is not None
+                and cached.shape == x1.shape
+                and cached.dtype == x1.dtype
+                and cached.device == x1.device
+                and torch.equal(cached, x1)
+            ):
+                x_discrete = self._select(x1, self._discrete_index)
+                self._cached_discrete_distance = self.discrete_kernel.covar_dist(x_discrete, x_discrete).detach()
+                self._cached_x = x1.detach().clone()
+            return self._cached_discrete_distance / lengthscale
+        x1_discrete = self._select(x1, self._discrete_index) / lengthscale
+        x2_discrete = x1_discrete if x1 is x2 else self._select(x2, self._discrete_index) / lengthscale
+        return self.discrete_kernel.covar_dist(x1_discrete, x2_discrete, diag=diag)
+
+    def _continuous_distance(self, x1: torch.Tensor, x2: torch.Tensor, diag: bool) -> torch.Tensor:
+        """
+        The lengthscale-scaled distances of the continuous dimensions, as in gpytorch's MaternKernel.
+
+        Args:
+            x1: the first inputs, continuous dimensions
+            x2: the second inputs, continuous dimensions
+            diag: whether to only compute the diagonal
+
+        Returns:
+            the scaled distances
+
+        """
+        lengthscale = self.continuous_kernel.lengthscale
+        mean = x1.reshape(-1, x1.size(-1)).mean(0)[(None,) * (x1.dim() - 1)]
+        x1_scaled = (x1 - mean).div(lengthscale)
+        x2_scaled = x1_scaled if x1 is x2 else (x2 - mean).div(lengthscale)
+        return self.continuous_kernel.covar_dist(x1_scaled, x2_scaled, diag=diag)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the cache is rebuilt on the first evaluation
+        state["_cached_x"] = None
+        state["_cached_discrete_distance"] = None
+        return state
+
     def forward(
         self,
         x1: torch.Tensor,
@@ -90,17 +256,17 @@ class MixtureKernel(Kernel):
         x2_continuous: Optional[torch.Tensor] = None,
         **params
     ) -> torch.Tensor:
-        if x1_continuous is None and x2_continuous is None:
+        # the fidelity dimensions are only part of the full inputs
+        full_inputs = x1_continuous is None and x2_continuous is None
+        if full_inputs:
             assert x1.shape[-1] == len(self.discrete_dims) + len(
                 self.continuous_dims
-            ), "Input dimension mismatch. Expected {}, got {}.".format(
-                len(self.discrete_dims) + len(self.continuous_dims), x1.shape[-1]
+            ) + len(self.fidelity_dims), "Input dimension mismatch. Expected {}, got {}.".format(
+                len(self.discrete_dims) + len(self.continuous_dims) + len(self.fidelity_dims), x1.shape[-1]
             )
-
-            x1_discrete = x1[..., self.discrete_dims_np]
-            x2_discrete = x2[..., self.discrete_dims_np]
-            x1_continuous = x1[..., self.continuous_dims_np]
-            x2_continuous = x2[..., self.continuous_dims_np]
+            discrete_distance = self._discrete_distance(x1, x2, diag=diag)
+            x1_continuous = self._select(x1, self._continuous_index)
+            x2_continuous = x1_continuous if x1 is x2 else self._select(x2, self._continuous_index)
         else:
             assert x1.shape[1] == len(
                 self.discrete_dims
@@ -122,14 +288,15 @@ class MixtureKernel(Kernel):
             ), "Input dimension mismatch. Expected {}, got {}.".format(
                 len(self.continuous_dims), x2_continuous.shape[1]
             )
-            x1_discrete = x1
-            x2_discrete = x2
-
-        k_discrete = self.discrete_kernel(x1_discrete, x2_discrete, diag=diag, **params)
-        k_continuous = self.continuous_kernel(
-            x1_continuous, x2_continuous, diag=diag, **params
-        )
+            discrete_distance = self.discrete_kernel.covar_dist(
+                x1 / self.discrete_kernel.lengthscale, x2 / self.discrete_kernel.lengthscale, diag=diag
+            )
 
-        return (1 - self.lamda) * (
-            k_discrete + k_continuous
-        ) + self.lamda * k_discrete * k_continuous
+        continuous_distance = self._continuous_distance(x1_continuous, x2_continuous, diag=diag)
+        lamda = torch.as_tensor(self.lamda, dtype=continuous_distance.dtype, device=continuous_distance.device)
+        k_mixture = _Matern52Mixture.apply(discrete_distance, continuous_distance, lamda.reshape(-1))
+        if self.fidelity_kernel is not None and full_inputs:
+            x1_fidelity = self._select(x1, self._fidelity_index)
+            x2_fidelity = x1_fidelity if x1 is x2 else self._select(x2, self._fidelity_index)
+            k_mixture = k_mixture * self.fidelity_kernel.forward(x1_fidelity, x2_fidelity, diag=diag, **params)
+        return k_mixture
@@ -40,3 +40,81 @@ def test_call():
 
     # Check that the kernel can be called with a single input.
     kern(x)
+
+
+def test_call_with_fidelity():
+    kern = MixtureKernel(
+        discrete_dims=[0, 1], continuous_dims=[2, 3], fidelity_dims=[4], lamda=0.5
+    )
+
+    x = torch.rand(10, 5)
+    k = kern(x, x).to_dense()
+    assert k.shape == (10, 10)
+
+    # At the same fidelity, the fidelity kernel is 1 and the mixture kernel is recovered.
+    kern_without_fidelity = MixtureKernel(
+        discrete_dims=[0, 1], continuous_dims=[2, 3], lamda=0.5
+    )
+    x[:, 4] = 1.0
+    assert torch.allclose(
+        kern(x, x).to_dense(), kern_without_fidelity(x[:, :4], x[:, :4]).to_dense()
+    )
+
+    with pytest.raises(AssertionError):
+        # Fidelity dims must be disjoint from the other dims.
+        MixtureKernel(discrete_dims=[0, 1], continuous_dims=[2, 3], fidelity_dims=[3])
+
+
+def _reference_mixture(kern, x1, x2, diag=False):
+    k_discrete = kern.discrete_kernel(x1[..., :2], x2[..., :2], diag=diag).to_dense()
+    k_continuous = kern.continuous_kernel(x1[..., 2:], x2[..., 2:], diag=diag).to_dense()
+    return (1 - kern.lamda) * (k_discrete + k_continuous) + kern.lamda * k_discrete * k_continuous
+
+
+def test_forward_matches_separate_kernels():
+    kern = MixtureKernel(discrete_dims=[0, 1], continuous_dims=[2, 3], lamda=0.3)
+    kern.discrete_kernel.lengthscale = 0.7
+    x1 = torch.cat((torch.randint(0, 2, (10, 2)) * 2.0 - 1, torch.rand(10, 2)), dim=1)
+    x2 = torch.cat((torch.randint(0, 2, (6, 2)) * 2.0 - 1, torch.rand(6, 2)), dim=1)
+
+    assert torch.allclose(kern(x1).to_dense(), _reference_mixture(kern, x1, x1), atol=1e-6)
+    assert torch.allclose(kern(x1, x2).to_dense(), _reference_mixture(kern, x1, x2), atol=1e-6)
+    assert torch.allclose(
+        kern(x1, x1.flip(0), diag=True), _reference_mixture(kern, x1, x1.flip(0), diag=True), atol=1e-6
+    )
+
+
+def test_discrete_distance_is_cached_for_the_training_inputs():
+    kern = MixtureKernel(discrete_dims=[0, 2], continuous_dims=[1, 3], lamda=0.5)
+    x = torch.cat((torch.randint(0, 2, (8, 2)) * 2.0 - 1, torch.rand(8, 2)), dim=1)[:, [0, 2, 1, 3]]
+
+    k = kern(x).to_dense()
+    cached = kern._cached_discrete_distance
+    assert cached is not None
+
+    # the cache survives a change of the hyperparameters and is used for equal inputs
+    kern.discrete_kernel.lengthscale = 2.0
+    k_new = kern(x.clone()).to_dense()
+    assert kern._cached_discrete_distance is cached
+    assert not torch.allclose(k, k_new)
+    reference = MixtureKernel(discrete_dims=[0, 2], continuous_dims=[1, 3], lamda=0.5)
+    reference.load_state_dict(kern.state_dict())
+    reference._cached_x = None
+    assert torch.allclose(k_new, reference(x, x.clone()).to_dense(), atol=1e-6)
+
+    # new inputs replace the cache
+    kern(x[:5]).to_dense()
+    assert kern._cached_discrete_distance.shape == (5, 5)
+
+
+def test_gradient_through_inputs_and_lengthscale():
+    kern = MixtureKernel(discrete_dims=[0, 1], continuous_dims=[2, 3], lamda=0.5)
+    x_train = torch.cat((torch.randint(0, 2, (8, 2)) * 2.0 - 1, torch.rand(8, 2)), dim=1)
+    x = torch.rand(3, 4, requires_grad=True)
+
+    kern(x, x_train).to_dense().sum().backward()
+    assert x.grad is not None and torch.all(torch.isfinite(x.grad))
+
+    kern(x_train).to_dense().sum().backward()
+    assert kern.discrete_kernel.raw_lengthscale.grad is not None
+    assert kern.continuous_kernel.raw_lengthscale.grad is not None
@@ -28,6 +28,68 @@ def hamming_distance(
     return torch.sum(x != y, dim=1)
 
 
+def hamming_neighbors_within_tr_batch(
+    x: torch.Tensor,
+    x_center: torch.Tensor,
+    tr_length: torch.Tensor,
+    axus: AxUS,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Find the neighbors of a batch of points that are within Hamming distance 1 and still in the trust region
+
+    All binary flips and categorical swaps of all points are written in one pass: every point is copied once per
+    binary and categorical dimension, and the flipped or swapped dimension of each copy is set through index tables.
+    A categorical swap is only a neighbor if the dimension is inactive in the point.
+
+    Args:
+        x: The points to compute the neighbors for, shape (n, d)
+        x_center: The center of the trust region, shape (d,)
+        tr_length: The length of the trust region
+        axus: The AxUS embedding
+
+    Returns:
+        The neighbors, shape (m, d), and the index of the point each neighbor belongs to, shape (m,). The neighbors of
+        one point are unique, but different points can share neighbors.
+    """
+    if len(x.shape) == 1:
+        x = x.unsqueeze(0)
+    assert len(x.shape) == 2, "x must be a matrix"
+    if axus.n_bins_of_type(ParameterType.ORDINAL) > 0:
+        raise NotImplementedError("Ordinal parameters are not supported yet")
+    n_points, n_dims = x.shape
+    point_indices = torch.arange(n_points, device=x.device)
+
+    neighbors = [torch.zeros((0, n_dims), dtype=x.dtype, device=x.device)]
+    origins = [torch.zeros(0, dtype=torch.long, device=x.device)]
+
+    binary_indices = axus.indices_of_type(ParameterType.BINARY).to(device=x.device)
+    if len(binary_indices) > 0:
+        copies = torch.arange(len(binary_indices), device=x.device)
+        flips = x.unsqueeze(1).repeat(1, len(binary_indices), 1)
+        flips[:, copies, binary_indices] = 1 - flips[:, copies, binary_indices]
+        neighbors.append(flips.reshape(-1, n_dims))
+        origins.append(point_indices.repeat_interleave(len(binary_indices)))
+
+    categorical_indices = axus.indices_of_type(ParameterType.CATEGORICAL).to(device=x.device)
+    if len(categorical_indices) > 0:
+        copies = torch.arange(len(categorical_indices), device=x.device)
+        # the bin of every dimension
+        bins = torch.bucketize(torch.arange(n_dims), axus.bin_offsets, right=True).to(device=x.device) - 1
+        same_bin = bins[categorical_indices].unsqueeze(1) == bins.unsqueeze(0)
+        swaps = x.unsqueeze(1).repeat(1, len(categorical_indices), 1)
+        swaps = swaps.masked_fill(same_bin.unsqueeze(0), 0)
+        swaps[:, copies, categorical_indices] = 1
+        inactive = x[:, categorical_indices] == 0
+        neighbors.append(swaps[inactive])
+        origins.append(point_indices.unsqueeze(1).expand_as(inactive)[inactive])
+
+    neighbors = torch.vstack(neighbors)
+    origins = torch.concat(origins)
+    # remove the neighbors that are not within the trust region
+    in_tr = hamming_distance(neighbors, x_center) <= tr_length
+    return neighbors[in_tr], origins[in_tr]
+
+
 def hamming_neighbors_within_tr(
     x: torch.Tensor,
     x_center: torch.Tensor,
@@ -46,65 +108,16 @@ def hamming_neighbors_within_tr(
     Returns:
         The neighbors of the points in x that are within Hamming distance 1 and still the trust region
     """
-    x = torch.clone(x)
     if len(x.shape) == 2:
         x = x.squeeze()
     assert len(x.shape) == 1, "x must be a vector"
-    
-    ##########--------CUSTOMED--------##########
-    discrete_parameter_types = [
-        pt for pt in ParameterType if pt != ParameterType.CONTINUOUS and pt != ParameterType.NUMERICAL
-    ]
-    #########################################
-    
-    neighbors_for_type = dict()
-
-    for parameter_type in discrete_parameter_types:
-        if axus.n_bins_of_type(parameter_type) == 0:
-            # No parameters of this type
-            continue
-        if parameter_type == ParameterType.BINARY:
-            indices = torch.tensor(
-                [i for b, i in axus.bins_and_indices_of_type(parameter_type)]
-            )
-            diagonal = torch.zeros_like(x)
-            diagonal[indices] = 1
-            diag_nonzero = diagonal != 0
-
-            type_neighbors = torch.abs(torch.diag(diagonal) - x.unsqueeze(0))[
-                diag_nonzero, :
-            ]
-        elif parameter_type == ParameterType.CATEGORICAL:
-            indicess = [i for b, i in axus.bins_and_indices_of_type(parameter_type)]
-            type_neighbors = torch.zeros((0, len(x)), device=x.device)
-            for indices in indicess:
-                # find inactive indices
-                inactive_indices = [i for i in indices if x[i] == 0]
-                # create len(inactive_index) copies of x
-                x_copies = torch.repeat_interleave(
-                    x.unsqueeze(0), len(inactive_indices), dim=0
-                )
-                x_copies[:, indices] = 0
-                for i, inactive_index in enumerate(inactive_indices):
-                    x_copies[i, inactive_index] = 1
-                # vstack x_copies to type_neighbors
-                type_neighbors = torch.vstack((type_neighbors, x_copies))
-        elif parameter_type == ParameterType.ORDINAL:
-            raise NotImplementedError("Ordinal parameters are not supported yet")
-        else:
-            raise ValueError(f"Unknown parameter type {parameter_type}")
-
-        # add type_neighbors to neighbors_for_type
-        neighbors_for_type[parameter_type] = type_neighbors
-
-    # stack all neighbors
-    neighbors = torch.vstack(
-        [type_neighbors for type_neighbors in neighbors_for_type.values()]
+
+    neighbors, _ = hamming_neighbors_within_tr_batch(
+        x=x.unsqueeze(0),
+        x_center=x_center,
+        tr_length=tr_length,
+        axus=axus,
     )
     # remove duplicates
     neighbors = torch.unique(neighbors, dim=0)
-    # remove the original point
-    neighbors = neighbors[torch.any(neighbors != x, dim=1), :]
-    # remove the neighbors that are not within the trust region
-    neighbors = neighbors[hamming_distance(neighbors, x_center) <= tr_length, :]
     return neighbors
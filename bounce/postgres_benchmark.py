@@ -5,6 +5,7 @@ from envs.postgres import PostgresEnv
 import torch
 import logging
 from statistics import mean
+from typing import Callable, Optional
 
 class PostgresTuning(Benchmark):
     def __init__(self, env: PostgresEnv):
@@ -20,6 +21,11 @@ class PostgresTuning(Benchmark):
         super().__init__(parameters=parameters, noise_std=None)
 
         self.flip = False
+        
+        self.last_failed = torch.zeros(1, 0, dtype=torch.bool)
+        """
+        whether the runs of the last call failed (e.g., invalid configurations), same shape as the results
+        """
 
             
     def _define_parameters(self) -> list:
@@ -136,11 +142,19 @@ class PostgresTuning(Benchmark):
     def get_results(self) -> float:
         return self.env.get_results()
 
-    def __call__(self, x: torch.Tensor, repeat:int, load:bool=True) -> torch.Tensor:
+    def __call__(
+        self,
+        x: torch.Tensor,
+        repeat:int,
+        load:bool=True,
+        stop_rule: Optional[Callable[[list[float]], bool]] = None,
+    ) -> torch.Tensor:
         """
         Minimizing results
         Args:
             x (torch.Tensor): generated configuration candidates. [num, n_features]
+            stop_rule (Callable, optional): called with the results of a configuration after each repetition. If it
+                returns True, the remaining repetitions are skipped and recorded as NaN.
 
         Returns:
             torch.Tensor: _description_
@@ -152,6 +166,7 @@ class PostgresTuning(Benchmark):
             repeat = False
         
         res = []
+        failed = []
         cnt = 0
         
         if len(x) > 1:
@@ -162,10 +177,11 @@ class PostgresTuning(Benchmark):
             self.save_configuration_file(x_)           
             if repeat:
                 self.apply_configuration()
-                for _ in range(BENCHMARKING_REPETITION):
+                for r in range(BENCHMARKING_REPETITION):
                     self.run_configuration(load)
                     res_ = self.get_results()
                     res.append(-res_)
+                    failed.append(self.env.fail_conf_flag)
                     load = False
                     cnt += 1
                     logging.info(f"👌👌 [{cnt}/{len(x)}] Results:{res_:.3f} !!!!!!!!!!!!!!!")
@@ -173,15 +189,22 @@ class PostgresTuning(Benchmark):
                         logging.info("DEBUGGING MODE, skipping restart postgresql service.")
                     else:
                         self.env._restart_postgres()
+                    if r < BENCHMARKING_REPETITION - 1 and stop_rule is not None and stop_rule(res[-(r + 1):]):
+                        logging.info(f"🏳 Stop repeating the configuration after {r + 1} runs")
+                        res += [float('nan')] * (BENCHMARKING_REPETITION - r - 1)
+                        failed += [False] * (BENCHMARKING_REPETITION - r - 1)
+                        break
             else:                    
                 self.apply_and_run_configuration(load)
                 res_ = self.get_results()
                 res.append(-res_) # Higher tps is better, so add the minus symbol.
+                failed.append(self.env.fail_conf_flag)
                 cnt += 1
                 logging.info(f"👌👌 [{cnt}/{len(x)}] Results:{res_:.3f} !!!!!!!!!!!!!!!")
             
         # if len(x) > 1:
         if len(x) == BENCHMARKING_REPETITION:
             logging.info(f"👌 Results:{res}   MEAN: {mean(res)}")
-            
+        
+        self.last_failed = torch.tensor(failed, dtype=torch.bool).unsqueeze(0)
         return torch.tensor(res).unsqueeze(0)
\ No newline at end of file
@@ -264,6 +264,8 @@ class AxUS:
         """
         # find indices for every parameter type
         self.bins = []
+        self._projection = None
+        self._index = None
         parameter_type_indices = dict()
         bins_per_type = dict()
         for parameter_type in ParameterType:
@@ -335,10 +337,81 @@ class AxUS:
         logging.info(f"Total number of bins: {len(self.bins)}")
         print(f"Total number of bins: {len(self.bins)}")
 
+    def _build_projection(self) -> dict[str, torch.Tensor]:
+        """
+        Builds the projection operator of the current bins, see `project_up`.
+
+        Continuous, numerical, and binary parameters are copies of their bin with a random sign, which is a sparse
+        matrix with one signed entry per parameter. A categorical parameter is set to the category given by a lookup
+        table indexed by the active category of its bin.
+
+        Returns:
+            the operator: the sparse signed matrix (input_dim x target_dim), the value of every input dimension
+            before the categories are set (-1 for categorical dimensions, 0 otherwise), for every categorical bin the
+            position of each target dimension in its bin and whether the target dimension belongs to it
+            (target_dim x n_categorical_bins), and for every categorical parameter its bin and the offset of its
+            lookup table in the concatenated lookup tables
+
+        """
+        rows, cols, values = [], [], []
+        base = torch.zeros(self.input_dim, dtype=torch.float64)
+        bin_position = torch.zeros(self.target_dim, 0, dtype=torch.float64)
+        bin_membership = torch.zeros(self.target_dim, 0, dtype=torch.float64)
+        tables, table_bins, table_offsets = [], [], []
+
+        target_start = 0
+        for bin in self.bins:
+            n_dims = bin.dims_required
+            match bin.parameter_type:
+                case ParameterType.CONTINUOUS | ParameterType.NUMERICAL | ParameterType.BINARY:
+                    for parameter in bin.parameters:
+                        rows.append(self.parameter_indices(parameter).item())
+                        cols.append(target_start)
+                        values.append(1 if self.low_sequency else parameter.random_sign)
+                case ParameterType.CATEGORICAL:
+                    position = torch.zeros(self.target_dim, 1, dtype=torch.float64)
+                    position[target_start : target_start + n_dims, 0] = torch.arange(n_dims, dtype=torch.float64)
+                    membership = torch.zeros(self.target_dim, 1, dtype=torch.float64)
+                    membership[target_start : target_start + n_dims, 0] = 1
+                    bin_position = torch.hstack((bin_position, position))
+                    bin_membership = torch.hstack((bin_membership, membership))
+                    for parameter in bin.parameters:
+                        indices = self.parameter_indices(parameter)
+                        base[indices] = -1
+                        # same mapping from the active category of the bin to the category of the parameter as in
+                        # `Bin.project_up`
+                        k = torch.arange(n_dims)
+                        v = torch.ceil(k * parameter.dims_required / n_dims).to(dtype=torch.long)
+                        v = (v + (0 if self.low_sequency else parameter.random_sign)) % parameter.dims_required
+                        table_bins.append(bin_position.shape[1] - 1)
+                        table_offsets.append(sum(len(t) for t in tables))
+                        tables.append(indices[v])
+                case ParameterType.ORDINAL:
+                    raise NotImplementedError("ordinal parameters not yet implemented")
+            target_start += n_dims
+
+        matrix = torch.sparse_coo_tensor(
+            torch.tensor([rows, cols], dtype=torch.long).reshape(2, -1),
+            torch.tensor(values, dtype=torch.float64),
+            size=(self.input_dim, self.target_dim),
+        ).coalesce()
+        return {
+            "matrix": matrix,
+            "base": base,
+            "bin_position": bin_position,
+            "bin_membership": bin_membership,
+            "table": torch.concat(tables) if tables else torch.zeros(0, dtype=torch.long),
+            "table_bins": torch.tensor(table_bins, dtype=torch.long),
+            "table_offsets": torch.tensor(table_offsets, dtype=torch.long),
+        }
+
     def project_up(self, x: torch.Tensor) -> torch.Tensor:
         """
-        Projects a tensor of shape (n_samples, dims_required_for_bin) to a tensor of shape
-        (n_samples, sum(bins_required_for_parameter(p) for p in parameters))
+        Projects a tensor of shape (dims_required_for_bin, n_samples) to a tensor of shape
+        (sum(bins_required_for_parameter(p) for p in parameters), n_samples)
+
+        The projection operator is built once per embedding (i.e., after every split), so projecting a batch is one
+        sparse matrix product plus one scatter for the categorical parameters.
 
         Returns:
             the projected tensor
@@ -348,25 +421,83 @@ class AxUS:
             x = x.unsqueeze(1)
         # assert x is 2d
         assert len(x.shape) == 2, "x must be 2d"
-        x = x.t()
         # assert x has the correct number of dimensions
         assert (
-            x.shape[1] == self.target_dim
+            x.shape[0] == self.target_dim
         ), "x must have the correct number of dimensions"
-        # define output tensor
-        output = torch.zeros((x.shape[0], self.input_dim), dtype=x.dtype)
-        # fill output tensor
-        input_start = 0
-        for bin in self.bins:
-            input_end = input_start + bin.dims_required
-            indices = torch.concat([self.parameter_indices(p) for p in bin.parameters])
-            bp = bin.project_up(
-                x[:, input_start:input_end], low_sequency=self.low_sequency
-            )
-            output[:, indices] = bp
-            input_start = input_end
+        if self._projection is None:
+            self._projection = self._build_projection()
+        projection = self._projection
+
+        # (n_samples, input_dim)
+        output = (
+            torch.sparse.mm(projection["matrix"].to(dtype=x.dtype), x).t() + projection["base"].to(dtype=x.dtype)
+        )
+        if len(projection["table"]) > 0:
+            active = (x.t() != -1).to(dtype=torch.float64)
+            n_active = active @ projection["bin_membership"]
+            # assert only one non-``zero'' index per sample
+            assert torch.all(
+                n_active.max(dim=0).values == 1
+            ), "Exactly one non-``zero'' index per sample is required"
+            # the active category of every categorical bin
+            k = (active @ projection["bin_position"]).to(dtype=torch.long)
+            # the category of every categorical parameter
+            categories = projection["table"][projection["table_offsets"] + k[:, projection["table_bins"]]]
+            output[torch.arange(output.shape[0]).unsqueeze(1), categories] = 1
         return output.t()
 
+    def _build_index(self) -> dict:
+        """
+        Builds the index structures of the current bins, see `_get_index`.
+
+        Returns:
+            the index structures
+
+        """
+        bin_offsets = torch.tensor([0] + [b.dims_required for b in self.bins], dtype=torch.long).cumsum(dim=0)
+        bin_indices = [
+            torch.arange(start, end) for start, end in zip(bin_offsets[:-1].tolist(), bin_offsets[1:].tolist())
+        ]
+        bins_and_indices = {parameter_type: [] for parameter_type in ParameterType}
+        for bin, indices in zip(self.bins, bin_indices):
+            bins_and_indices[bin.parameters[0].type].append((bin, indices))
+        indices_of_type = {
+            parameter_type: torch.concat([i for _, i in b_i]) if len(b_i) > 0 else torch.zeros(0, dtype=torch.long)
+            for parameter_type, b_i in bins_and_indices.items()
+        }
+        ##########--------CUSTOMED--------##########
+        ## numerical parameters are modeled as continuous parameters
+        continuous_indices = torch.concat(
+            (indices_of_type[ParameterType.CONTINUOUS], indices_of_type[ParameterType.NUMERICAL])
+        )
+        #########################################
+        continuous_mask = torch.zeros(self.target_dim, dtype=torch.bool)
+        continuous_mask[continuous_indices] = True
+        return {
+            "bin_offsets": bin_offsets,
+            "bin_indices": bin_indices,
+            "bins_and_indices": bins_and_indices,
+            "indices_of_type": indices_of_type,
+            "continuous_indices": continuous_indices,
+            "continuous_mask": continuous_mask,
+            "discrete_indices": torch.nonzero(~continuous_mask).squeeze(1),
+            "discrete_mask": ~continuous_mask,
+        }
+
+    def _get_index(self) -> dict:
+        """
+        Returns the index structures of the current bins. They are built once per embedding, i.e., after every split,
+        instead of on every access.
+
+        Returns:
+            the index structures
+
+        """
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
     @property
     def bin_indices(self) -> list[torch.Tensor]:
         """
@@ -375,13 +506,57 @@ class AxUS:
             a list of tensors containing the indices of the parameters in each bin
 
         """
-        bin_indices = []
-        start = 0
-        for bin in self.bins:
-            end = start + bin.dims_required
-            bin_indices.append(torch.arange(start, end))
-            start = end
-        return bin_indices
+        return list(self._get_index()["bin_indices"])
+
+    @property
+    def bin_offsets(self) -> torch.Tensor:
+        """
+
+        Returns:
+            the index of the first dimension of each bin and the target dimensionality, shape (n_bins + 1,)
+
+        """
+        return self._get_index()["bin_offsets"]
+
+    @property
+    def continuous_indices(self) -> torch.Tensor:
+        """
+
+        Returns:
+            the indices of the continuous and numerical bins, continuous bins first
+
+        """
+        return self._get_index()["continuous_indices"]
+
+    @property
+    def discrete_indices(self) -> torch.Tensor:
+        """
+
+        Returns:
+            the sorted indices of the dimensions that are not in a continuous or numerical bin
+
+        """
+        return self._get_index()["discrete_indices"]
+
+    @property
+    def continuous_mask(self) -> torch.Tensor:
+        """
+
+        Returns:
+            a boolean mask of the dimensions in a continuous or numerical bin, shape (target_dim,)
+
+        """
+        return self._get_index()["continuous_mask"]
+
+    @property
+    def discrete_mask(self) -> torch.Tensor:
+        """
+
+        Returns:
+            a boolean mask of the dimensions that are not in a continuous or numerical bin, shape (target_dim,)
+
+        """
+        return self._get_index()["discrete_mask"]
 
     def n_bins_of_type(self, parameter_type: ParameterType) -> int:
         """
@@ -394,7 +569,7 @@ class AxUS:
             the number of bins of that type
 
         """
-        return sum([1 for b in self.bins if b.parameters[0].type == parameter_type])
+        return len(self._get_index()["bins_and_indices"][parameter_type])
 
     def bins_of_type(self, parameter_type: ParameterType) -> list[Bin]:
         """
@@ -407,7 +582,7 @@ class AxUS:
             a list of bins
 
         """
-        return [b for b in self.bins if b.parameters[0].type == parameter_type]
+        return [b for b, _ in self._get_index()["bins_and_indices"][parameter_type]]
 
     def bins_and_indices_of_type(
         self, parameter_type: ParameterType
@@ -422,11 +597,20 @@ class AxUS:
             a list of tuples containing the bins and their indices
 
         """
-        return [
-            (b, i)
-            for b, i in zip(self.bins, self.bin_indices)
-            if b.parameters[0].type == parameter_type
-        ]
+        return list(self._get_index()["bins_and_indices"][parameter_type])
+
+    def indices_of_type(self, parameter_type: ParameterType) -> torch.Tensor:
+        """
+        Returns the indices of all bins of a certain type.
+
+        Args:
+            parameter_type: the type of the parameters
+
+        Returns:
+            the concatenated indices of the bins of that type
+
+        """
+        return self._get_index()["indices_of_type"][parameter_type]
 
     def split(self, n_new_bins: int) -> dict[torch.Tensor, list[torch.Tensor]]:
         """
@@ -474,4 +658,6 @@ class AxUS:
                 indices_added += bs[_new + 1].dims_required
         self.bins = b_old + b_new
         self.n_bins = len(self.bins)
+        self._projection = None
+        self._index = None
         return index_mapping
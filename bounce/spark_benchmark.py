@@ -2,13 +2,17 @@ from bounce.benchmarks import Benchmark
 from bounce.util.benchmark import Parameter, ParameterType
 from envs.params import BENCHMARKING_REPETITION
 from envs.spark import SparkEnv
+from envs.cache import EvaluationCache
 import torch
 import logging
 from statistics import mean
+from typing import Callable, Optional
 
 class SparkTuning(Benchmark):
-    def __init__(self, env: SparkEnv):
+    def __init__(self, env: SparkEnv, cache: Optional[EvaluationCache] = None):
         self.env = env
+        # If given, completed runs are stored and reused for identical configuration files
+        self.cache = cache
         self.n_features = len(self.env.dict_data)
         logging.info(f"n_features: {self.n_features}")    
 
@@ -20,6 +24,15 @@ class SparkTuning(Benchmark):
         super().__init__(parameters=parameters, noise_std=None)
 
         self.flip = False
+        
+        self.last_censored = torch.zeros(1, 0, dtype=torch.bool)
+        """
+        whether the results of the last call were censored by early termination, same shape as the results
+        """
+        self.last_failed = torch.zeros(1, 0, dtype=torch.bool)
+        """
+        whether the runs of the last call failed (e.g., invalid configurations), same shape as the results
+        """
 
             
     def _define_parameters(self) -> list:
@@ -110,12 +123,42 @@ class SparkTuning(Benchmark):
     
     def get_results(self) -> float:
         return self.env.get_results()
+    
+    def _run(self, key: Optional[str], load: bool) -> tuple[float, bool, bool]:
+        """
+        Benchmark the applied configuration once and store the result in the cache unless the run was censored or
+        failed.
+
+        Args:
+            key: the cache key of the configuration, None if no cache is used
+            load: whether to prepare the data of the workload first
+
+        Returns:
+            the result, whether it is censored, and whether the run failed
+
+        """
+        self.run_configuration(load)
+        res_ = self.get_results()
+        censored_, failed_ = self.env.censored_flag, self.env.fail_conf_flag
+        if key is not None and not censored_ and not failed_:
+            self.cache.add(key, res_)
+        return res_, censored_, failed_
 
-    def __call__(self, x: torch.Tensor, repeat:bool=False, load:bool=True) -> torch.Tensor:
+    def __call__(
+        self,
+        x: torch.Tensor,
+        repeat:bool=False,
+        load:bool=True,
+        stop_rule: Optional[Callable[[list[float]], bool]] = None,
+        workload_size: Optional[str] = None,
+    ) -> torch.Tensor:
         """
         Minimizing results
         Args:
             x (torch.Tensor): generated configuration candidates. [num, n_features]
+            stop_rule (Callable, optional): called with the results of a configuration after each repetition. If it
+                returns True, the remaining repetitions are skipped and recorded as NaN.
+            workload_size (str, optional): if given, switch the HiBench workload size before benchmarking.
 
         Returns:
             torch.Tensor: _description_
@@ -126,7 +169,12 @@ class SparkTuning(Benchmark):
         else:
             repeat = False        
         
+        if workload_size is not None:
+            self.env.set_workload_size(workload_size)
+        
         res = []
+        censored = []
+        failed = []
         cnt = 0
         
         if len(x) > 1:
@@ -135,24 +183,56 @@ class SparkTuning(Benchmark):
             x_ = x_.squeeze()
         
             self.save_configuration_file(x_)           
+            key, cached_res = None, []
+            if self.cache is not None:
+                key = self.cache.key(self.config_path, self.env.workload, self.env.workload_size)
+                cached_res = self.cache.lookup(key)
             if repeat:
-                self.apply_configuration()
-                for _ in range(BENCHMARKING_REPETITION):
-                    self.run_configuration(load)
-                    res_ = self.get_results()
+                applied = False
+                for r in range(BENCHMARKING_REPETITION):
+                    if r < len(cached_res):
+                        res_, censored_, failed_ = cached_res[r], False, False
+                        logging.info(f"🗃 Reusing the cached result of run {r + 1}")
+                    else:
+                        if not applied:
+                            self.apply_configuration()
+                            applied = True
+                        res_, censored_, failed_ = self._run(key, load)
+                        load = False
                     res.append(res_)
-                    load = False
+                    censored.append(censored_)
+                    failed.append(failed_)
                     cnt += 1
                     logging.info(f"👌👌 [{cnt}/{len(x)}] Results:{res_:.3f} !!!!!!!!!!!!!!!")
+                    if censored_:
+                        # The configuration is hopeless, the remaining repetitions are censored as well
+                        res += [res_] * (BENCHMARKING_REPETITION - r - 1)
+                        censored += [True] * (BENCHMARKING_REPETITION - r - 1)
+                        failed += [False] * (BENCHMARKING_REPETITION - r - 1)
+                        break
+                    if r < BENCHMARKING_REPETITION - 1 and stop_rule is not None and stop_rule(res[-(r + 1):]):
+                        logging.info(f"🏳 Stop repeating the configuration after {r + 1} runs")
+                        res += [float('nan')] * (BENCHMARKING_REPETITION - r - 1)
+                        censored += [False] * (BENCHMARKING_REPETITION - r - 1)
+                        failed += [False] * (BENCHMARKING_REPETITION - r - 1)
+                        break
             else:                    
-                self.apply_and_run_configuration(load)
-                res_ = self.get_results()
+                if len(cached_res) > 0:
+                    res_, censored_, failed_ = cached_res[0], False, False
+                    logging.info("🗃 Reusing the cached result")
+                else:
+                    self.apply_configuration()
+                    res_, censored_, failed_ = self._run(key, load)
                 res.append(res_) # Higher tps is better, so add the minus symbol.
+                censored.append(censored_)
+                failed.append(failed_)
                 cnt += 1
                 logging.info(f"👌👌 [{cnt}/{len(x)}] Results:{res_:.3f} !!!!!!!!!!!!!!!")
             
         # if len(x) > 1:
         if len(x) == BENCHMARKING_REPETITION:
             logging.info(f"👌 Results:{res}   MEAN: {mean(res)}")
-            
-        return torch.tensor(res)
\ No newline at end of file
+        
+        self.last_censored = torch.tensor(censored, dtype=torch.bool).unsqueeze(0)
+        self.last_failed = torch.tensor(failed, dtype=torch.bool).unsqueeze(0)
+        return torch.tensor(res).unsqueeze(0)
\ No newline at end of file
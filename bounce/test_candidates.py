@@ -0,0 +1,172 @@
+import threading
+
+import gpytorch
+import torch
+from botorch.acquisition import ExpectedImprovement
+from botorch.models import SingleTaskGP
+
+from bounce.candidates import (
+    AcquisitionOptimizer,
+    CandidatePool,
+    create_candidates_discrete,
+    sample_initial_points_discrete,
+)
+from bounce.gaussian_process import get_gp
+from bounce.neighbors import hamming_distance
+from bounce.projection import AxUS
+from bounce.trust_region import TrustRegion
+from bounce.util.benchmark import Parameter, ParameterType
+
+
+def _axus() -> AxUS:
+    parameters = [
+        Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1) for i in range(8)
+    ] + [
+        Parameter(name=f"c{i}", type=ParameterType.CATEGORICAL, lower_bound=0, upper_bound=2 + i) for i in range(6)
+    ]
+    return AxUS(parameters=parameters, n_bins=6)
+
+
+def _center(axus: AxUS) -> torch.Tensor:
+    x_center = torch.zeros(axus.target_dim, dtype=torch.float64)
+    for b, indices in axus.bins_and_indices_of_type(ParameterType.CATEGORICAL):
+        x_center[indices[0]] = 1
+    return x_center
+
+
+def test_sampled_points_are_valid_and_in_tr():
+    torch.manual_seed(0)
+    axus = _axus()
+    x_center = _center(axus)
+    for tr_length in (2, 4, 8):
+        x_cand = sample_initial_points_discrete(
+            x_center=x_center, tr_length=tr_length, axus=axus, n_initial_points=500
+        )
+        assert len(x_cand) > 0
+        assert torch.all(hamming_distance(x_cand, x_center) <= tr_length)
+        assert torch.all(torch.any(x_cand != x_center, dim=1))
+        assert len(torch.unique(x_cand, dim=0)) == len(x_cand)
+        for b, indices in axus.bins_and_indices_of_type(ParameterType.CATEGORICAL):
+            assert torch.all(x_cand[:, indices].sum(dim=1) == 1)
+
+
+def test_candidate_pool_size():
+    pool = CandidatePool(latency_budget=None)
+    assert pool.size(5) == 2000
+    assert pool.size(100) == 5000
+
+    pool = CandidatePool(latency_budget=0.5, min_candidates=100, max_candidates=20000)
+    # without a measurement, the TuRBO rule is used
+    assert pool.size(5) == 2000
+    pool.record(n_candidates=2000, seconds=0.1)
+    assert pool.size(5) == 10000
+    pool.record(n_candidates=10000, seconds=10)
+    assert pool.size(5) == int(0.5 / (0.5 * 0.1 / 2000 + 0.5 * 10 / 10000))
+    pool.record(n_candidates=100, seconds=100)
+    assert pool.size(5) == 100
+
+
+class RecordingCandidatePool(CandidatePool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.recorded = list()
+
+    def record(self, n_candidates: int, seconds: float):
+        self.recorded.append(n_candidates)
+        super().record(n_candidates, seconds)
+
+
+def test_candidate_pool_records_the_scored_candidates():
+    torch.manual_seed(0)
+    axus = _axus()
+    x = sample_initial_points_discrete(x_center=_center(axus), tr_length=4, axus=axus, n_initial_points=100)[:10]
+    fx = (x**2).sum(dim=1)
+    model, train_x, train_fx = get_gp(axus=axus, x=x, fx=fx)
+    acquisition_function = ExpectedImprovement(model=model, best_f=(-train_fx).max())
+    scored = list()
+
+    def recording_acquisition_function(x):
+        scored.append(len(x))
+        return acquisition_function(x)
+
+    pool = RecordingCandidatePool(latency_budget=None)
+    create_candidates_discrete(
+        x_scaled=train_x,
+        fx_scaled=train_fx,
+        acquisition_function=recording_acquisition_function,
+        model=model,
+        axus=axus,
+        trust_region=TrustRegion(dimensionality=axus.target_dim, length_init_discrete=4),
+        device="cpu",
+        x_pending=x[:3],
+        candidate_pool=pool,
+    )
+
+    # the spray points are added and the pending points removed, the pool is not sampled at the requested size
+    assert pool.recorded == [scored[0]]
+    assert scored[0] != pool.size(axus.target_dim)
+
+
+def _acquisition_function() -> ExpectedImprovement:
+    torch.manual_seed(0)
+    x = torch.rand(10, 3, dtype=torch.float64)
+    fx = -((x - 0.3) ** 2).sum(dim=1, keepdim=True)
+    return ExpectedImprovement(model=SingleTaskGP(x, fx), best_f=fx.max())
+
+
+def test_raw_samples_are_reused_until_reset():
+    optimizer = AcquisitionOptimizer(num_restarts=2, raw_samples=16)
+    bounds = torch.tensor([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]], dtype=torch.float64)
+
+    x_raw = optimizer._raw_samples(bounds, fixed_features=dict())
+    assert x_raw.shape == (16, 1, 3)
+    assert torch.equal(optimizer._raw_samples(bounds, fixed_features=dict()), x_raw)
+    # rescaled to the bounds of the next interleaved step, the fixed features are set
+    shrunk = torch.tensor([[0.2, 0.2, 0.2], [0.4, 0.4, 0.4]], dtype=torch.float64)
+    x_shrunk = optimizer._raw_samples(shrunk, fixed_features={1: 0.3})
+    assert torch.allclose(x_shrunk[..., [0, 2]], 0.2 + 0.2 * x_raw[..., [0, 2]])
+    assert torch.all(x_shrunk[..., 1] == 0.3)
+
+    optimizer.reset()
+    assert not torch.equal(optimizer._raw_samples(bounds, fixed_features=dict()), x_raw)
+
+
+def test_restarts_in_threads_match_the_serial_optimization():
+    acquisition_function = _acquisition_function()
+    bounds = torch.tensor([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]], dtype=torch.float64)
+    serial = AcquisitionOptimizer(num_restarts=6, raw_samples=64, n_workers=1)
+    threaded = AcquisitionOptimizer(num_restarts=6, raw_samples=64, n_workers=3)
+    torch.manual_seed(1)
+    x_serial, value_serial = serial.optimize(acquisition_function, bounds)
+    threaded._unit_raw_samples = serial._unit_raw_samples
+    torch.manual_seed(1)
+    x_threaded, value_threaded = threaded.optimize(acquisition_function, bounds)
+
+    assert torch.allclose(x_threaded, x_serial)
+    assert torch.allclose(value_threaded, value_serial)
+    assert len(threaded.timings) == 1
+    threaded.optimize(acquisition_function, bounds)
+    assert len(threaded.timings) == 2
+    # the timings are kept for one proposal only
+    threaded.reset()
+    assert len(threaded.timings) == 0
+
+
+def test_restarts_in_threads_share_the_settings_of_the_caller():
+    acquisition_function = _acquisition_function()
+    bounds = torch.tensor([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]], dtype=torch.float64)
+    optimizer = AcquisitionOptimizer(num_restarts=6, raw_samples=64, n_workers=3)
+    settings = set()
+
+    def recording_acquisition_function(x):
+        settings.add((threading.get_ident(), gpytorch.settings.fast_pred_var.on(), gpytorch.settings.debug.on()))
+        return acquisition_function(x)
+
+    fast_pred_var, debug = gpytorch.settings.fast_pred_var.on(), gpytorch.settings.debug.on()
+    for _ in range(3):
+        optimizer.optimize(recording_acquisition_function, bounds)
+
+    assert len({thread for thread, _, _ in settings}) > 1
+    assert {(on, debugging) for _, on, debugging in settings} == {(True, False)}
+    # restored once all threads are done
+    assert (gpytorch.settings.fast_pred_var.on(), gpytorch.settings.debug.on()) == (fast_pred_var, debug)
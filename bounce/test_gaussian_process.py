@@ -0,0 +1,86 @@
+import torch
+from gpytorch import ExactMarginalLogLikelihood
+
+import bounce.gaussian_process as gp
+from bounce.gaussian_process import fit_mll_multistart, get_gp
+from bounce.projection import AxUS
+from bounce.util.benchmark import Parameter, ParameterType
+
+
+def _axus() -> AxUS:
+    parameters = [
+        Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1) for i in range(3)
+    ] + [
+        Parameter(name=f"x{i}", type=ParameterType.CONTINUOUS, lower_bound=0, upper_bound=1) for i in range(3)
+    ]
+    return AxUS(parameters=parameters, n_bins=6)
+
+
+def _no_fit(**kwargs):
+    # keeps the hyperparameters of the starting point
+    pass
+
+
+def _mll(model) -> float:
+    model.train()
+    model.likelihood.train()
+    mll = ExactMarginalLogLikelihood(model.likelihood, model)
+    with torch.no_grad():
+        value = mll(model(*model.train_inputs), model.train_targets).item()
+    model.eval()
+    model.likelihood.eval()
+    return value
+
+
+def _starts(monkeypatch, outputscales: list[float]):
+    # the starting points drawn from the priors get these outputscales, one after another
+    outputscales = iter(outputscales)
+
+    def sample(model):
+        model.covar_module.outputscale = next(outputscales)
+
+    monkeypatch.setattr(gp, "sample_hyperparameters_from_priors", sample)
+
+
+def test_multistart_keeps_the_start_with_the_best_marginal_likelihood(monkeypatch):
+    torch.manual_seed(0)
+    axus = _axus()
+    x = torch.rand(15, axus.target_dim, dtype=torch.float64)
+    x[:, axus.discrete_indices] = x[:, axus.discrete_indices].round()
+    fx = (x**2).sum(dim=1)
+    model, train_x, train_fx = get_gp(axus=axus, x=x, fx=fx)
+
+    # the first start keeps the current outputscale, the others are drawn from the priors
+    starts = [1e3, 1e-3, 1.0]
+    expected = list()
+    for outputscale in starts:
+        model.covar_module.outputscale = outputscale
+        expected.append(_mll(model))
+    model.covar_module.outputscale = starts[0]
+
+    _starts(monkeypatch, starts[1:])
+    fit_mll_multistart(fit=_no_fit, model=model, train_x=train_x, train_fx=train_fx, n_restarts=3, n_workers=1)
+
+    best = max(range(len(starts)), key=expected.__getitem__)
+    assert best != 0
+    assert model.covar_module.outputscale.item() == starts[best]
+    assert _mll(model) == max(expected)
+
+
+def test_multistart_fits_serially_without_spare_cores(monkeypatch):
+    torch.manual_seed(0)
+    axus = _axus()
+    x = torch.rand(10, axus.target_dim, dtype=torch.float64)
+    x[:, axus.discrete_indices] = x[:, axus.discrete_indices].round()
+    model, train_x, train_fx = get_gp(axus=axus, x=x, fx=x.sum(dim=1))
+
+    def no_pool(n_workers):
+        raise AssertionError("the pool was started")
+
+    monkeypatch.setattr(gp, "_get_fitting_pool", no_pool)
+    monkeypatch.setattr(gp.os, "cpu_count", lambda: 1)
+    _starts(monkeypatch, [0.5, 2.0])
+    fit_mll_multistart(fit=_no_fit, model=model, train_x=train_x, train_fx=train_fx, n_restarts=3, n_workers=4)
+    monkeypatch.setattr(gp.os, "cpu_count", lambda: 8)
+    _starts(monkeypatch, [0.5])
+    fit_mll_multistart(fit=_no_fit, model=model, train_x=train_x, train_fx=train_fx, n_restarts=1, n_workers=4)
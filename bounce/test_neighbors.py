@@ -0,0 +1,72 @@
+import torch
+
+from bounce.neighbors import (
+    hamming_distance,
+    hamming_neighbors_within_tr,
+    hamming_neighbors_within_tr_batch,
+)
+from bounce.projection import AxUS
+from bounce.util.benchmark import Parameter, ParameterType
+
+
+def _axus() -> AxUS:
+    parameters = [
+        Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1) for i in range(6)
+    ] + [
+        Parameter(name=f"c{i}", type=ParameterType.CATEGORICAL, lower_bound=0, upper_bound=2 + i) for i in range(3)
+    ]
+    return AxUS(parameters=parameters, n_bins=4)
+
+
+def _sample(axus: AxUS, n: int) -> torch.Tensor:
+    x = torch.zeros(n, axus.target_dim, dtype=torch.float64)
+    for bin, indices in zip(axus.bins, axus.bin_indices):
+        if bin.parameter_type == ParameterType.CATEGORICAL:
+            x[torch.arange(n), indices[torch.randint(len(indices), (n,))]] = 1
+        else:
+            x[:, indices] = torch.randint(2, (n, len(indices)), dtype=torch.float64)
+    return x
+
+
+def _neighbors_per_dimension(x: torch.Tensor, axus: AxUS) -> torch.Tensor:
+    neighbors = []
+    for bin, indices in zip(axus.bins, axus.bin_indices):
+        for i in indices:
+            neighbor = x.clone()
+            if bin.parameter_type == ParameterType.BINARY:
+                neighbor[i] = 1 - neighbor[i]
+            elif x[i] == 0:
+                neighbor[indices] = 0
+                neighbor[i] = 1
+            else:
+                continue
+            neighbors.append(neighbor)
+    return torch.vstack(neighbors)
+
+
+def test_batch_matches_per_dimension_neighbors():
+    torch.manual_seed(0)
+    axus = _axus()
+    x = _sample(axus, 5)
+    x_center = x[0]
+    tr_length = 3
+
+    neighbors, origins = hamming_neighbors_within_tr_batch(
+        x=x, x_center=x_center, tr_length=tr_length, axus=axus
+    )
+    for i in range(len(x)):
+        expected = _neighbors_per_dimension(x[i], axus)
+        expected = expected[hamming_distance(expected, x_center) <= tr_length]
+        assert torch.equal(
+            torch.unique(neighbors[origins == i], dim=0), torch.unique(expected, dim=0)
+        )
+        assert len(neighbors[origins == i]) == len(expected)
+        assert torch.all(hamming_distance(neighbors[origins == i], x[i]) > 0)
+
+
+def test_single_point_neighbors():
+    torch.manual_seed(1)
+    axus = _axus()
+    x = _sample(axus, 1)
+    neighbors = hamming_neighbors_within_tr(x=x, x_center=x.squeeze(), tr_length=2, axus=axus)
+    assert torch.equal(neighbors, torch.unique(_neighbors_per_dimension(x.squeeze(), axus), dim=0))
@@ -0,0 +1,90 @@
+import torch
+
+from bounce.projection import AxUS
+from bounce.util.benchmark import Parameter, ParameterType
+
+
+def _parameters() -> list[Parameter]:
+    parameters = []
+    for i in range(5):
+        parameters.append(Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1))
+    for i in range(4):
+        parameters.append(
+            Parameter(name=f"c{i}", type=ParameterType.CATEGORICAL, lower_bound=0, upper_bound=2 + i)
+        )
+    for i in range(6):
+        parameters.append(Parameter(name=f"x{i}", type=ParameterType.CONTINUOUS, lower_bound=0, upper_bound=1))
+    return parameters
+
+
+def _sample(axus: AxUS, n: int) -> torch.Tensor:
+    x = torch.zeros(n, axus.target_dim, dtype=torch.float64)
+    start = 0
+    for bin in axus.bins:
+        end = start + bin.dims_required
+        match bin.parameter_type:
+            case ParameterType.CATEGORICAL:
+                x[:, start:end] = -1
+                x[torch.arange(n), start + torch.randint(bin.dims_required, (n,))] = 1
+            case ParameterType.BINARY:
+                x[:, start:end] = torch.randint(2, (n, 1)) * 2.0 - 1
+            case _:
+                x[:, start:end] = torch.rand(n, 1) * 2 - 1
+        start = end
+    return x
+
+
+def _project_up_per_bin(axus: AxUS, x: torch.Tensor) -> torch.Tensor:
+    output = torch.zeros((x.shape[0], axus.input_dim), dtype=x.dtype)
+    start = 0
+    for bin in axus.bins:
+        end = start + bin.dims_required
+        indices = torch.concat([axus.parameter_indices(p) for p in bin.parameters])
+        output[:, indices] = bin.project_up(x[:, start:end], low_sequency=axus.low_sequency)
+        start = end
+    return output
+
+
+def test_project_up_matches_bins():
+    torch.manual_seed(0)
+    for low_sequency in (False, True):
+        axus = AxUS(parameters=_parameters(), n_bins=4, low_sequency=low_sequency)
+        x = _sample(axus, 32)
+        assert torch.equal(axus.project_up(x.T).T, _project_up_per_bin(axus, x))
+
+
+def test_project_up_after_split():
+    torch.manual_seed(1)
+    axus = AxUS(parameters=_parameters(), n_bins=3)
+    axus.project_up(_sample(axus, 4).T)
+    axus.split(2)
+    x = _sample(axus, 16)
+    assert torch.equal(axus.project_up(x.T).T, _project_up_per_bin(axus, x))
+
+
+def test_index_is_rebuilt_after_split():
+    torch.manual_seed(2)
+    axus = AxUS(parameters=_parameters(), n_bins=3)
+    for _ in range(2):
+        offsets = [0]
+        for bin in axus.bins:
+            offsets.append(offsets[-1] + bin.dims_required)
+        assert axus.bin_offsets.tolist() == offsets
+        for parameter_type in ParameterType:
+            bins_and_indices = [
+                (b, i) for b, i in zip(axus.bins, axus.bin_indices) if b.parameter_type == parameter_type
+            ]
+            assert axus.n_bins_of_type(parameter_type) == len(bins_and_indices)
+            assert all(b is b_ for (b, _), b_ in zip(bins_and_indices, axus.bins_of_type(parameter_type)))
+            if len(bins_and_indices) > 0:
+                assert torch.equal(
+                    axus.indices_of_type(parameter_type), torch.concat([i for _, i in bins_and_indices])
+                )
+        continuous = torch.concat(
+            (axus.indices_of_type(ParameterType.CONTINUOUS), axus.indices_of_type(ParameterType.NUMERICAL))
+        )
+        assert torch.equal(axus.continuous_indices, continuous)
+        assert torch.equal(torch.nonzero(axus.continuous_mask).squeeze(1), continuous.sort().values)
+        assert torch.equal(torch.nonzero(axus.discrete_mask).squeeze(1), axus.discrete_indices)
+        assert axus.continuous_mask.sum() + len(axus.discrete_indices) == axus.target_dim
+        axus.split(2)
@@ -0,0 +1,116 @@
+import functools
+from typing import Optional
+
+import torch
+
+# The rows are hashed modulo this (Mersenne) prime, so that no intermediate value overflows int64
+_PRIME = 2**31 - 1
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_weights(n_columns: int) -> torch.Tensor:
+    """
+    The weights of the columns in the row hash. They only depend on the number of columns, so that the hashes of two
+    indices with the same number of columns are comparable.
+
+    Args:
+        n_columns: the number of columns
+
+    Returns:
+        the weights, shape (n_columns,)
+
+    """
+    generator = torch.Generator().manual_seed(n_columns)
+    return torch.randint(1, _PRIME, (n_columns,), generator=generator, dtype=torch.int64)
+
+
+def hash_rows(x: torch.Tensor) -> torch.Tensor:
+    """
+    Hash the rows of a matrix from the bit patterns of their float64 values.
+
+    Args:
+        x: the rows, shape (n, d)
+
+    Returns:
+        the hashes of the rows, shape (n,). Equal rows have equal hashes.
+
+    """
+    # adding 0 turns -0.0 into 0.0, which compare equal but have different bit patterns
+    bits = (x.detach().cpu().to(dtype=torch.float64) + 0.0).contiguous().view(torch.int64)
+    return ((bits % _PRIME) * _hash_weights(x.shape[1]) % _PRIME).sum(dim=1)
+
+
+class PointIndex:
+    """
+    A hash index of a set of points, e.g., the observations in the trust region, to test which of many points are
+    already in the set in one vectorized lookup instead of comparing every point with every member.
+
+    Points with the same hash are compared exactly, so hash collisions never cause false positives.
+    """
+
+    def __init__(self, x: Optional[torch.Tensor] = None):
+        """
+
+        Args:
+            x: the initial points, shape (n, d)
+        """
+        self._hashes = torch.zeros(0, dtype=torch.int64)
+        self._rows: Optional[torch.Tensor] = None
+        if x is not None:
+            self.add(x)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, x: torch.Tensor):
+        """
+        Add points to the index.
+
+        Args:
+            x: the points, shape (n, d)
+
+        Returns:
+            None
+
+        """
+        if len(x.shape) == 1:
+            x = x.unsqueeze(0)
+        rows = x.detach().cpu().to(dtype=torch.float64)
+        self._hashes = torch.cat((self._hashes, hash_rows(rows)))
+        self._rows = rows.clone() if self._rows is None else torch.vstack((self._rows, rows))
+
+    def copy(self) -> "PointIndex":
+        """
+
+        Returns:
+            a copy of the index that can be extended without changing this index
+
+        """
+        index = PointIndex()
+        index._hashes = self._hashes.clone()
+        index._rows = None if self._rows is None else self._rows.clone()
+        return index
+
+    def contains(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Test which points are in the index.
+
+        Args:
+            x: the points, shape (n, d)
+
+        Returns:
+            a boolean mask of the points that are in the index, shape (n,)
+
+        """
+        if len(x.shape) == 1:
+            x = x.unsqueeze(0)
+        if len(self) == 0 or len(x) == 0:
+            return torch.zeros(len(x), dtype=torch.bool, device=x.device)
+        assert x.shape[1] == self._rows.shape[1], "x must have the same number of dimensions as the index"
+        hashes = hash_rows(x)
+        found = torch.isin(hashes, self._hashes)
+        # confirm the (few) hits exactly
+        rows = x.detach().cpu().to(dtype=torch.float64)
+        for i in torch.nonzero(found).squeeze(1):
+            found[i] = torch.any(torch.all(self._rows[self._hashes == hashes[i]] == rows[i], dim=1))
+        return found.to(device=x.device)
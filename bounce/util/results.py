@@ -0,0 +1,160 @@
+import json
+import os
+
+import numpy as np
+
+
+class ResultsLog:
+    """
+    An append-only binary log of fixed-width float64 rows, e.g., the evaluated points and their function values.
+
+    Every append writes only the new rows to the end of `<path>.bin`, and the number of columns is stored once in
+    `<path>.meta.json`. The whole history is read with `read_results`, which memory-maps the file instead of parsing it.
+    A row that was only partially written (e.g., the process was killed while appending) is ignored by the reader
+    and overwritten by the next append.
+    """
+
+    def __init__(self, path: str, n_columns: int):
+        """
+
+        Args:
+            path: the path of the log without extension
+            n_columns: the number of values per row
+        """
+        self.path = path
+        self.n_columns = n_columns
+        with open(f"{self.path}.meta.json", "w") as f:
+            json.dump({"dtype": "<f8", "n_columns": self.n_columns}, f)
+
+    @property
+    def n_rows(self) -> int:
+        """
+
+        Returns:
+            the number of complete rows in the log
+
+        """
+        if not os.path.exists(f"{self.path}.bin"):
+            return 0
+        return os.path.getsize(f"{self.path}.bin") // (8 * self.n_columns)
+
+    def append(self, rows: np.ndarray):
+        """
+        Append rows to the log.
+
+        Args:
+            rows: the rows, shape (n, n_columns)
+
+        Returns:
+            None
+
+        """
+        rows = np.ascontiguousarray(np.asarray(rows, dtype="<f8").reshape(-1, self.n_columns))
+        # drop a partially written row, if any
+        self.truncate(self.n_rows)
+        with open(f"{self.path}.bin", "ab") as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def truncate(self, n_rows: int):
+        """
+        Remove all rows after the first n_rows, e.g., to match a checkpoint that was saved before the last append.
+
+        Args:
+            n_rows: the number of rows to keep
+
+        Returns:
+            None
+
+        """
+        if os.path.exists(f"{self.path}.bin"):
+            with open(f"{self.path}.bin", "r+b") as f:
+                f.truncate(8 * self.n_columns * n_rows)
+
+
+def read_results(path: str) -> np.ndarray:
+    """
+    Read a results log written by `ResultsLog`.
+
+    Args:
+        path: the path of the log without extension, e.g., "results/20240101-00/results"
+
+    Returns:
+        a read-only memory map of the rows, shape (n_rows, n_columns)
+
+    """
+    with open(f"{path}.meta.json", "r") as f:
+        meta = json.load(f)
+    n_columns = meta["n_columns"]
+    size = os.path.getsize(f"{path}.bin") if os.path.exists(f"{path}.bin") else 0
+    n_rows = size // (np.dtype(meta["dtype"]).itemsize * n_columns)
+    if n_rows == 0:
+        return np.empty((0, n_columns), dtype=meta["dtype"])
+    return np.memmap(f"{path}.bin", dtype=meta["dtype"], mode="r", shape=(n_rows, n_columns))
+
+
+class TrStateLog:
+    """
+    Buffers the trust region states of a run and writes them to one JSON Lines file, one record per state.
+
+    The states are kept in memory and written in one batch by `flush`, which the optimizers call whenever they save a
+    checkpoint. The file is only ever appended to, so it can be tailed while the run is going on.
+    """
+
+    def __init__(self, path: str):
+        """
+
+        Args:
+            path: the JSON Lines file, e.g., "results/20240101-00/tr_state.jsonl"
+        """
+        self.path = path
+        self._buffer: list[str] = []
+
+    def append(self, tr_state: dict, iteration: int):
+        """
+        Buffer a trust region state.
+
+        Args:
+            tr_state: the trust region state, e.g., the center, length, lb, and ub of the trust region
+            iteration: the number of evaluations when the state was recorded
+
+        Returns:
+            None
+
+        """
+        record = {"iteration": int(iteration)}
+        for key, value in tr_state.items():
+            if hasattr(value, "detach"):
+                value = value.detach().cpu()
+            record[key] = np.asarray(value).tolist()
+        self._buffer.append(json.dumps(record))
+
+    def flush(self):
+        """
+        Write the buffered states to the file.
+
+        Returns:
+            None
+
+        """
+        if len(self._buffer) == 0:
+            return
+        with open(self.path, "a") as f:
+            f.write("\n".join(self._buffer) + "\n")
+        self._buffer = []
+
+
+def read_tr_states(path: str) -> list[dict]:
+    """
+    Read the trust region states written by `TrStateLog`.
+
+    Args:
+        path: the JSON Lines file
+
+    Returns:
+        the states in the order they were recorded
+
+    """
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
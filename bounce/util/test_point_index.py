@@ -0,0 +1,37 @@
+import torch
+
+from bounce.util.point_index import PointIndex, hash_rows
+
+
+def test_contains():
+    torch.manual_seed(0)
+    x = torch.randint(2, (20, 8), dtype=torch.float64)
+    index = PointIndex(x[:10])
+    assert len(index) == 10
+
+    found = index.contains(x)
+    expected = torch.tensor([torch.any(torch.all(x[:10] == row, dim=1)) for row in x])
+    assert torch.equal(found, expected)
+
+    index.add(x[10:])
+    assert torch.all(index.contains(x))
+
+
+def test_empty_index():
+    index = PointIndex()
+    assert not torch.any(index.contains(torch.rand(3, 2)))
+
+
+def test_copy_is_independent():
+    x = torch.rand(4, 3, dtype=torch.float64)
+    index = PointIndex(x[:2])
+    extended = index.copy()
+    extended.add(x[2:])
+    assert torch.equal(index.contains(x), torch.tensor([True, True, False, False]))
+    assert torch.all(extended.contains(x))
+
+
+def test_negative_zero_equals_zero():
+    x = torch.tensor([[0.0, 1.0]])
+    assert torch.equal(hash_rows(x), hash_rows(torch.tensor([[-0.0, 1.0]])))
+    assert PointIndex(x).contains(torch.tensor([[-0.0, 1.0]])).item()
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+from bounce.util.results import ResultsLog, TrStateLog, read_results, read_tr_states
+
+
+def test_append_and_read(tmp_path):
+    path = os.path.join(tmp_path, "results")
+    log = ResultsLog(path, n_columns=3)
+    assert read_results(path).shape == (0, 3)
+
+    rows = np.arange(6, dtype=np.float64).reshape(2, 3)
+    log.append(rows)
+    log.append(rows[0])
+    history = read_results(path)
+    assert history.shape == (3, 3)
+    assert np.all(history[:2] == rows)
+    assert np.all(history[2] == rows[0])
+    assert log.n_rows == 3
+
+
+def test_partial_row_is_ignored(tmp_path):
+    path = os.path.join(tmp_path, "results")
+    log = ResultsLog(path, n_columns=2)
+    log.append(np.array([[1.0, 2.0]]))
+    # simulate a crash while appending
+    with open(f"{path}.bin", "ab") as f:
+        f.write(np.array([3.0]).tobytes())
+    assert read_results(path).shape == (1, 2)
+
+    log.append(np.array([[4.0, 5.0]]))
+    assert np.all(read_results(path) == np.array([[1.0, 2.0], [4.0, 5.0]]))
+
+
+def test_truncate(tmp_path):
+    path = os.path.join(tmp_path, "results")
+    log = ResultsLog(path, n_columns=2)
+    log.append(np.ones((4, 2)))
+    log.truncate(1)
+    assert read_results(path).shape == (1, 2)
+
+
+def test_tr_state_log_is_written_on_flush(tmp_path):
+    path = os.path.join(tmp_path, "tr_state.jsonl")
+    log = TrStateLog(path)
+    log.append({"length": np.array([0.5]), "center": np.zeros((1, 2))}, iteration=3)
+    log.append({"length": np.array([0.25]), "center": np.ones((1, 2))}, iteration=4)
+    assert not os.path.exists(path)
+
+    log.flush()
+    log.flush()
+    states = read_tr_states(path)
+    assert [s["iteration"] for s in states] == [3, 4]
+    assert states[1]["length"] == [0.25]
+    assert states[1]["center"] == [[1.0, 1.0]]
+
+
+def test_sidecar_does_not_clash_with_json_results(tmp_path):
+    # other optimizers write their results to <name>.json in the same directory
+    path = os.path.join(tmp_path, "repeated_results")
+    ResultsLog(path, n_columns=2).append(np.ones((1, 2)))
+    assert os.path.exists(f"{path}.meta.json")
+    assert not os.path.exists(f"{path}.json")
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+import envs.params as p
+
+
+class EvaluationCache:
+    """
+    A persistent store of benchmark results, keyed by the rendered configuration file and the workload.
+
+    Different points can render to the same configuration file (e.g., continuous values are rounded to two decimals),
+    and some points are benchmarked again on purpose (e.g., the best configuration at the end of the tuning). With the
+    cache, the runs already done for a configuration are reused and only the missing repetitions are benchmarked.
+
+    Only completed runs are stored. Censored runs (early termination) depend on the cutoff at the time, and failed runs
+    may be caused by the cluster rather than the configuration, so neither is reused. The file is a JSON dictionary
+    {key: {"results": [...]}} and is replaced atomically on every update, so an interrupted tuning never leaves a
+    broken cache behind.
+    """
+
+    def __init__(self, path: str = p.EVALUATION_CACHE_PATH):
+        """
+
+        Args:
+            path: the JSON file of the cache, created on the first update
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, list]] = dict()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self._entries = json.load(f)
+            logging.info(f"🗃 Loaded {len(self._entries)} cached configurations from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(config_path: str, workload: str, workload_size: Optional[str] = None) -> str:
+        """
+        Hash a rendered configuration file. The order of the lines and surrounding whitespace do not matter.
+
+        Args:
+            config_path: the rendered configuration file, e.g., tuned.conf
+            workload: the benchmarked workload
+            workload_size: the workload size, if any
+
+        Returns:
+            the key of the configuration
+
+        """
+        with open(config_path, 'r') as f:
+            lines = sorted(
+                "=".join(part.strip() for part in line.split("=", 1)) for line in f if line.strip()
+            )
+        content = "\n".join([str(workload), str(workload_size)] + lines)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def lookup(self, key: str) -> list[float]:
+        """
+
+        Args:
+            key: the key of the configuration
+
+        Returns:
+            the cached results of the configuration, empty if it has never been run
+
+        """
+        with self._lock:
+            return list(self._entries.get(key, {"results": []})["results"])
+
+    def add(self, key: str, result: float) -> None:
+        """
+        Add the result of one completed run and write the cache to disk.
+
+        Args:
+            key: the key of the configuration
+            result: the result of the run, neither censored nor failed
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, {"results": []})
+            entry["results"].append(float(result))
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".cache-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+_CACHES: dict[str, EvaluationCache] = dict()
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(path: str = p.EVALUATION_CACHE_PATH) -> EvaluationCache:
+    """
+    Get the cache stored in a file. All benchmarks using the same file share one cache, e.g., the workers of the
+    evaluation engine.
+
+    Args:
+        path: the JSON file of the cache
+
+    Returns:
+        the cache
+
+    """
+    path = os.path.abspath(path)
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            _CACHES[path] = EvaluationCache(path=path)
+        return _CACHES[path]
@@ -0,0 +1,249 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Callable, Optional, Union
+
+import torch
+
+import envs.params as p
+
+
+class EvaluationEngine:
+    """
+    Evaluates configurations on a pool of worker clusters in parallel.
+
+    Configurations are put into a single queue and every registered worker pulls the next configuration as soon as it
+    is idle. A worker is any callable with the interface of `SparkTuning.__call__`, i.e.,
+    `worker(x, repeat=..., load=...) -> torch.Tensor`. Each worker runs in its own thread, so N workers benchmark up to
+    N configurations at the same time. Results are returned as `concurrent.futures.Future` objects. If the worker
+    records which results were censored by early termination (`last_censored`) or failed (`last_failed`), the masks
+    are attached to the future under the same names.
+
+    If a worker raises, e.g., because the connection to its cluster dropped, the configuration is recorded as failed
+    with `failure_value` instead of aborting the tuning, and the exception is attached to the future as `error`.
+    """
+
+    def __init__(self, workers: Optional[list[Callable]] = None, failure_value: float = p.FAILED_RESULT):
+        """
+
+        Args:
+            workers: the workers (benchmarks bound to one cluster each) to register
+            failure_value: the result recorded for each run of a configuration whose worker raised
+        """
+        self.failure_value = failure_value
+        self._queue = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self.workers: list[Callable] = []
+        """
+        the registered workers
+        """
+        for worker in workers or []:
+            self.register(worker)
+
+    @property
+    def n_workers(self) -> int:
+        """
+
+        Returns:
+            the number of registered workers
+
+        """
+        return len(self.workers)
+
+    def register(self, worker: Callable) -> None:
+        """
+        Register a worker and start serving the queue with it.
+
+        Args:
+            worker: a benchmark bound to one cluster
+
+        Returns:
+            None
+
+        """
+        thread = threading.Thread(
+            target=self._serve,
+            args=(worker,),
+            name=f"evaluation-worker-{len(self.workers)}",
+            daemon=True,
+        )
+        self.workers.append(worker)
+        self._threads.append(thread)
+        thread.start()
+        logging.info(f"🖥 Registered worker {len(self.workers) - 1} for parallel evaluation")
+
+    def submit(self, x: torch.Tensor, **kwargs) -> Future:
+        """
+        Put a configuration into the queue.
+
+        Args:
+            x: the configuration in the representation space, shape (representation_dim,) or (1, representation_dim)
+            **kwargs: passed to the worker, e.g., repeat and load
+
+        Returns:
+            a future holding the result of the worker
+
+        """
+        assert len(self._threads) > 0, "No worker has been registered"
+        if x.dim() == 1:
+            x = x.unsqueeze(0)
+        future = Future()
+        self._queue.put((future, x, kwargs))
+        return future
+
+    def map(self, xs: torch.Tensor, **kwargs) -> list[Future]:
+        """
+        Put several configurations into the queue.
+
+        Args:
+            xs: the configurations, shape (n, representation_dim)
+            **kwargs: passed to the worker, e.g., repeat and load
+
+        Returns:
+            one future per configuration, in the order of xs
+
+        """
+        return [self.submit(x, **kwargs) for x in xs]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop all workers after they have finished the configurations in the queue.
+
+        Args:
+            wait: whether to block until all workers have stopped
+
+        Returns:
+            None
+
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _serve(self, worker: Callable) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, x, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.worker = worker
+            future.error = None
+            try:
+                result = worker(x, **kwargs)
+            except Exception as e:
+                logging.exception("💀 Worker failed to evaluate the configuration, recording it as failed")
+                # one result per run, as returned by the worker
+                n_results = len(x) * max(1, int(kwargs.get("repeat", 1)))
+                future.error = e
+                future.last_censored = torch.zeros(1, n_results, dtype=torch.bool)
+                future.last_failed = torch.ones(1, n_results, dtype=torch.bool)
+                future.set_result(torch.full((1, n_results), float(self.failure_value)))
+            else:
+                # read in the thread of the worker, so the masks cannot be overwritten by its next call
+                future.last_censored = getattr(worker, "last_censored", None)
+                future.last_failed = getattr(worker, "last_failed", None)
+                future.set_result(result)
+
+
+def wait_first(futures: list[Future]) -> tuple[set[Future], set[Future]]:
+    """
+    Block until at least one of the futures is done.
+
+    Args:
+        futures: the pending futures
+
+    Returns:
+        the done and the not-done futures
+
+    """
+    return wait(futures, return_when=FIRST_COMPLETED)
+
+
+class FakeCluster:
+    """
+    A local stand-in for a Spark cluster. It sleeps instead of running HiBench and returns the value of a given
+    objective function, so the evaluation engine and the optimizers can be tested without remote machines.
+    """
+
+    def __init__(
+        self,
+        objective: Callable[[torch.Tensor], float],
+        delay: Union[float, Callable[[torch.Tensor], float]] = 0.0,
+    ):
+        """
+
+        Args:
+            objective: maps a configuration in the representation space to a duration
+            delay: the seconds one run takes, either fixed or as a function of the configuration
+        """
+        self.objective = objective
+        self.delay = delay
+        self.n_runs = 0
+        """
+        the number of benchmark runs done on this cluster
+        """
+
+    def __call__(
+        self,
+        x: torch.Tensor,
+        repeat: int = 1,
+        load: bool = True,
+        stop_rule: Optional[Callable[[list[float]], bool]] = None,
+        workload_size: Optional[str] = None,
+    ) -> torch.Tensor:
+        # the workload size is accepted for compatibility with SparkTuning, but the objective does not depend on it
+        repeat = max(1, int(repeat))
+        res = []
+        for x_ in x:
+            x_ = x_.squeeze()
+            for r in range(repeat):
+                time.sleep(self.delay(x_) if callable(self.delay) else self.delay)
+                res.append(float(self.objective(x_)))
+                self.n_runs += 1
+                if r < repeat - 1 and stop_rule is not None and stop_rule(res[-(r + 1):]):
+                    res += [float('nan')] * (repeat - r - 1)
+                    break
+        return torch.tensor(res).unsqueeze(0)
+
+
+def make_spark_engine(
+    workload: str,
+    workload_size: str,
+    debugging: bool = False,
+    clusters: list[dict] = p.SPARK_CLUSTERS,
+    cache=None,
+) -> EvaluationEngine:
+    """
+    Create an evaluation engine with one `SparkTuning` worker per cluster in `clusters`.
+
+    Args:
+        workload: the HiBench workload
+        workload_size: the HiBench workload size
+        debugging: whether to skip the benchmarking
+        clusters: the cluster definitions, see `envs.params.SPARK_CLUSTERS`
+        cache: the `EvaluationCache` shared by the workers, if any
+
+    Returns:
+        the evaluation engine
+
+    """
+    from bounce.spark_benchmark import SparkTuning
+    from envs.spark import SparkEnv
+
+    workers = []
+    for cluster in clusters:
+        env = SparkEnv(
+            workload=workload,
+            workload_size=workload_size,
+            debugging=debugging,
+            **cluster,
+        )
+        workers.append(SparkTuning(env=env, cache=cache))
+    return EvaluationEngine(workers)
@@ -18,6 +18,27 @@ DATA_FOLDER_PATH = os.path.join(HOME_PATH, PROJECT_NAME, 'data')
 MASTER_ADDRESS = GCP_SPARK_MASTER_ADDRESS
 MASTER_CONF_PATH = os.path.join(HOME_PATH, 'HiBench/conf')
 HIBENCH_REPORT_PATH = os.path.join(HOME_PATH, PROJECT_NAME, 'data/hibench.report')
+
+# The result recorded for runs that failed, e.g., invalid configurations or a worker that crashed
+FAILED_RESULT = 10000
+
+# Results of already benchmarked configurations (envs/cache.py), reused across tuning runs
+EVALUATION_CACHE_PATH = os.path.join(HOME_PATH, PROJECT_NAME, 'data/evaluation_cache.json')
+
+# Worker clusters for parallel evaluation (envs/engine.py).
+# Each cluster needs its own local configuration file and report file.
+# Add more dictionaries to benchmark on several Spark clusters at once, e.g.,
+# {"master_address": "spark-2-m", "master_conf_path": MASTER_CONF_PATH, "config_path": .../data/tuned_2.conf,
+#  "hibench_report_path": .../data/hibench_2.report, "remote_report_path": "HiBench/report/hibench.report"}
+SPARK_CLUSTERS = [
+    {
+        "master_address": MASTER_ADDRESS,
+        "master_conf_path": MASTER_CONF_PATH,
+        "config_path": CONF_PATH,
+        "hibench_report_path": HIBENCH_REPORT_PATH,
+        "remote_report_path": None,
+    },
+]
 # ---------------------------------------------
 
 # PostgreSQL ----------------------------------
@@ -63,11 +84,43 @@ GP_PARAM = {
             "outputscale_prior_shape" : 1.5, # 2
             "outputscale_prior_rate" : 0.5, # 0.15
             "noise_prior_shape" : 1.1, # 1.1
-            "noise_prior_rate" : 0.05 # 2
+            "noise_prior_rate" : 0.05, # 2
+            "mll_restarts" : 1, # fit the GP from this many starting points drawn from the priors, keep the best fit
+            "mll_workers" : 4, # processes fitting the starting points in parallel
             }
 
 BENCHMARKING_REPETITION = 3
 
+SURROGATE_PARAM = {
+                "refit_every" : 1, # fit the GP hyperparameters every k iterations, only condition on new points in between
+            }
+
+RACING_PARAM = {
+                "z_threshold" : 2.0, # stop repeating once the configuration is this many standard errors worse
+            }
+
+FIDELITY_PARAM = {
+                "promotion_quantile" : 0.3, # promote a screened configuration if it is in the best 30% at its size
+                "min_observations" : 3, # always promote until this many configurations are screened at a size
+            }
+
+CANDIDATE_PARAM = {
+                "local_search_starts" : 3, # hill-climb from this many of the best discrete candidates, in lockstep
+                "latency_budget" : None, # seconds per proposal for sampling and scoring discrete candidates, None: TuRBO pool size
+                "min_candidates" : 100, # pool size bounds with a latency budget
+                "max_candidates" : 20000,
+                "num_restarts" : 10, # restarts of the continuous acquisition optimization
+                "raw_samples" : 512, # Sobol points to choose the restarts from, reused by the interleaved steps of a proposal
+                "restart_workers" : 1, # threads optimizing the restarts in parallel
+                "max_interleaved_steps" : 5, # rounds of discrete and continuous optimization per proposal
+                "interleave_tolerance" : None, # stop the rounds once the proposal moves less than this (e.g., 1e-3), None: run all rounds
+            }
+
+EARLY_TERMINATION_PARAM = {
+                "cutoff_factor" : 3, # a run is killed once it takes this many times the incumbent duration
+                "min_cutoff" : 60, # seconds, runs are never killed before this
+            }
+
 def print_params():
     import logging
     logging.info("📢 Information of hyperparameters")
@@ -78,6 +131,9 @@ def print_params():
     logging.info(f"MASTER_ADDRESS : {MASTER_ADDRESS}")
     logging.info(f"MASTER_CONF_PATH : {MASTER_CONF_PATH}")
     logging.info(f"HIBENCH_REPORT_PATH : {HIBENCH_REPORT_PATH}")
+    logging.info(f"SPARK_CLUSTERS : {[c['master_address'] for c in SPARK_CLUSTERS]}")
+    logging.info(f"EVALUATION_CACHE_PATH : {EVALUATION_CACHE_PATH}")
+    logging.info(f"FAILED_RESULT : {FAILED_RESULT}")
     
     logging.info('---------------------------')
     logging.info("📌Bounce...")
@@ -94,4 +150,29 @@ def print_params():
     for k, v in GP_PARAM.items():
         logging.info(f"{k} : {v}")
     
+    logging.info('---------------------------')
+    logging.info("📌Surrogate...")
+    for k, v in SURROGATE_PARAM.items():
+        logging.info(f"{k} : {v}")
+    
+    logging.info('---------------------------')
+    logging.info("📌Racing...")
+    for k, v in RACING_PARAM.items():
+        logging.info(f"{k} : {v}")
+    
+    logging.info('---------------------------')
+    logging.info("📌Multi-fidelity...")
+    for k, v in FIDELITY_PARAM.items():
+        logging.info(f"{k} : {v}")
+    
+    logging.info('---------------------------')
+    logging.info("📌Candidates...")
+    for k, v in CANDIDATE_PARAM.items():
+        logging.info(f"{k} : {v}")
+    
+    logging.info('---------------------------')
+    logging.info("📌Early termination...")
+    for k, v in EARLY_TERMINATION_PARAM.items():
+        logging.info(f"{k} : {v}")
+    
     logging.info("================================")
\ No newline at end of file
@@ -1,9 +1,10 @@
 import os, time
-import subprocess
 import logging
 import pandas as pd
 
 import envs.params as p
+from envs.transport import get_transport, SSHTransport, LocalTransport
+from typing import Optional, Union
 from statistics import mean
 
 class PostgresEnv:
@@ -14,6 +15,7 @@ class PostgresEnv:
         workload: str = None,
         debugging: bool = False,
         remote_ip: str = None,
+        transport: Optional[Union[SSHTransport, LocalTransport]] = None,
     ):
         self.config_path=config_path
         
@@ -43,6 +45,12 @@ class PostgresEnv:
             self.remote_dbms_path = p.POSTGRES_SERVER_2_POSTGRES_PATH
             self.remote_dbms_conf_path = p.POSTGRES_SERVER_2_CONF_PATH
             self.config_path = p.CONF_TMP_PATH
+        
+        # One persistent SSH session per server, authenticated once with sshpass,
+        # unless a transport is given (e.g., a LocalTransport to run the scripts on this machine)
+        self.transport = (
+            get_transport(self.remote_ip, password=p.POSTGRES_SERVER_PASSWSD) if transport is None else transport
+        )
 
     def apply_configuration(self, config_path=None):
         if self.debugging:
@@ -68,17 +76,17 @@ class PostgresEnv:
         config_path = self.config_path if config_path is None else config_path
         
         logging.info("Applying created configuration to the remote PostgreSQL server.. 💨💨")
-        os.system(f'sshpass -p {p.POSTGRES_SERVER_PASSWSD} scp {config_path} {self.remote_ip}:{self.remote_dbms_conf_path}/add-postgres.conf')
+        self.transport.put(config_path, f'{self.remote_dbms_conf_path}/add-postgres.conf')
         self._restart_postgres()
         
     def _run_configuration(self, load:bool):       
         if self.workload == 'ycsb-a':
-            run_command = f'timeout {self.timeout} sshpass -p {p.POSTGRES_SERVER_PASSWSD} ssh {self.remote_ip} {self.remote_dbms_path}/run_workloada.sh'
+            run_command = f'{self.remote_dbms_path}/run_workloada.sh'
         elif self.workload == 'ycsb-b':
-            run_command = f'timeout {self.timeout} sshpass -p {p.POSTGRES_SERVER_PASSWSD} ssh {self.remote_ip} {self.remote_dbms_path}/run_workloadb.sh'
+            run_command = f'{self.remote_dbms_path}/run_workloadb.sh'
         
         logging.info("Running benchmark..")
-        result = subprocess.run(run_command, shell=True, capture_output=True, text=True)
+        result = self.transport.run(run_command, timeout=self.timeout, capture_output=True)
         
         self.result_logs = result.stdout
         self.result_exit_code = result.returncode
@@ -112,5 +120,5 @@ class PostgresEnv:
     
     def _restart_postgres(self):
         logging.info("Restart PostgreSQL service to apply configuration..")
-        os.system(f"sshpass -p {p.POSTGRES_SERVER_PASSWSD} ssh {self.remote_ip} 'echo {p.POSTGRES_SERVER_PASSWSD} | sudo -S systemctl restart postgresql'")
+        self.transport.run(f"echo {p.POSTGRES_SERVER_PASSWSD} | sudo -S systemctl restart postgresql")
         logging.info("Restart PostgreSQL service finished..")
\ No newline at end of file
@@ -4,6 +4,8 @@ import logging
 import pandas as pd
 
 import envs.params as p
+from envs.transport import get_transport, SSHTransport, LocalTransport
+from typing import Optional, Union
 from statistics import mean
 
 class SparkEnv:
@@ -14,10 +16,25 @@ class SparkEnv:
         workload: str = None,
         workload_size: str = None,
         alter: bool = True,
-        debugging: bool = False
+        debugging: bool = False,
+        master_address: str = p.MASTER_ADDRESS,
+        master_conf_path: str = p.MASTER_CONF_PATH,
+        hibench_report_path: str = p.HIBENCH_REPORT_PATH,
+        remote_report_path: str = None,
+        transport: Optional[Union[SSHTransport, LocalTransport]] = None,
     ):
         self.config_path=config_path
         
+        # Endpoints of the Spark cluster benchmarked by this environment.
+        # If remote_report_path is None, the report is fetched by scripts/report_transport.sh on the master node.
+        self.master_address = master_address
+        self.master_conf_path = master_conf_path
+        self.hibench_report_path = hibench_report_path
+        self.remote_report_path = remote_report_path
+        # One persistent SSH session per master node, shared by all environments of the same cluster,
+        # unless a transport is given (e.g., a LocalTransport to run the scripts on this machine)
+        self.transport = get_transport(self.master_address) if transport is None else transport
+        
         csv_data = pd.read_csv(csv_path, index_col=0)
 
         self.dict_data = csv_data.to_dict(orient='index')
@@ -32,6 +49,14 @@ class SparkEnv:
         
         self.timeout = 1000 if workload_size in ["tiny", "small", "large"] else 2000
         
+        # If set, a run is killed once it exceeds cutoff seconds and its duration is recorded as censored,
+        # i.e., the true duration is only known to be longer than the cutoff. See `set_cutoff`.
+        self.cutoff = None
+        self.censored_flag = False
+        # The time limit of the last run. The cutoff may change before the result of a censored run is read
+        # (e.g., the incumbent improved in the asynchronous mode), while the run was killed at this limit.
+        self.run_limit = None
+        
         self.start_dataproc()
         
         if self.alter:
@@ -45,8 +70,52 @@ class SparkEnv:
         HIBENCH_CONF_PATH = os.path.join(p.DATA_FOLDER_PATH, f'{workload_size}_hibench.conf')
         logging.info("Altering hibench workload scale..")
         logging.info(f"Workload ***{self.workload}*** with ***{workload_size}*** size..")
-        os.system(f'scp {HIBENCH_CONF_PATH} {p.MASTER_ADDRESS}:{p.MASTER_CONF_PATH}/hibench.conf')
+        self.transport.put(HIBENCH_CONF_PATH, f'{self.master_conf_path}/hibench.conf')
+
+
+    def set_workload_size(self, workload_size: str):
+        """
+        Switch the HiBench workload size, e.g., to screen configurations on a smaller input (multi-fidelity tuning).
+        The data of the new size is prepared by the next run with load=True.
+
+        Args:
+            workload_size: one of tiny, small, large, huge, and gigantic
+
+        Returns:
+            None
 
+        """
+        if workload_size == self.workload_size:
+            return
+        logging.info(f"🔀 Switching the workload size from {self.workload_size} to {workload_size}")
+        self.workload_size = workload_size
+        self.timeout = 1000 if workload_size in ["tiny", "small", "large"] else 2000
+        if self.alter:
+            self._alter_hibench_configuration(self.workload_size)
+
+    def set_cutoff(
+        self,
+        incumbent: float = None,
+        factor: float = p.EARLY_TERMINATION_PARAM["cutoff_factor"],
+        min_cutoff: float = p.EARLY_TERMINATION_PARAM["min_cutoff"],
+    ):
+        """
+        Set the cutoff for early termination relative to the best duration observed so far.
+
+        Args:
+            incumbent: the best duration observed so far. If None, early termination is disabled.
+            factor: a run is killed once it takes factor times the incumbent duration
+            min_cutoff: the cutoff is never shorter than this many seconds
+
+        Returns:
+            None
+
+        """
+        if incumbent is None:
+            self.cutoff = None
+        else:
+            self.cutoff = min(self.timeout, max(min_cutoff, factor * incumbent))
+            logging.info(f"✂️ Runs longer than {self.cutoff:.1f} s are terminated early (incumbent: {incumbent:.1f} s)")
 
     def apply_configuration(self, config_path=None):
         if self.debugging:
@@ -58,6 +127,7 @@ class SparkEnv:
         if self.debugging:
             start = time.time()
             logging.info(f"DEBUGGING MODE, skipping to benchmark the given configuration --> ### LOAD? {load}")
+            self.run_limit = self.cutoff
             end = time.time()
             logging.info(f"DEBUGGING MODE, [HiBench]⏱ data loading takes {end - start} s ⏱")
         else:
@@ -67,7 +137,7 @@ class SparkEnv:
         if self.debugging:
             logging.info("DEBUGGING MODE, getting results from the local report file..")
             
-            f = open(p.HIBENCH_REPORT_PATH, 'r')
+            f = open(self.hibench_report_path, 'r')
             report = f.readlines()
             f.close()
             
@@ -77,6 +147,12 @@ class SparkEnv:
             duration = report[rand_idx].split()[-3]
             tps = report[rand_idx].split()[-2]
             logging.info(f"DEBUGGING MODE, the recorded results are.. Duration: {duration} s Throughput: {tps} bytes/s")
+            
+            # Simulate the early termination
+            self.censored_flag = self.run_limit is not None and float(duration) > self.run_limit
+            if self.censored_flag:
+                logging.info(f"DEBUGGING MODE, ✂️ the run is terminated early at {self.run_limit:.1f} s")
+                return float(self.run_limit)
             return float(duration)
         else:
             return self._get_results()
@@ -85,7 +161,7 @@ class SparkEnv:
         config_path = self.config_path if config_path is None else config_path
         
         logging.info("Applying created configuration to the remote Spark server.. 💨💨")
-        os.system(f'scp {config_path} {p.MASTER_ADDRESS}:{p.MASTER_CONF_PATH}/add-spark.conf')
+        self.transport.put(config_path, f'{self.master_conf_path}/add-spark.conf')
         
     def _run_configuration(self, load:bool):
         """
@@ -95,13 +171,26 @@ class SparkEnv:
         
         if load:
             start = time.time()
-            os.system(f'timeout {self.timeout} ssh {p.MASTER_ADDRESS} "bash --noprofile --norc -c scripts/prepare_wk/load_{self.workload}.sh"')
+            self.transport.run(f'bash --noprofile --norc -c scripts/prepare_wk/load_{self.workload}.sh', timeout=self.timeout)
             end = time.time()
             logging.info(f"[HiBench] data loading (seconds) takes {end - start}")
 
-        exit_code = os.system(f'timeout {self.timeout} ssh {p.MASTER_ADDRESS} "bash --noprofile --norc -c scripts/run_wk/run_{self.workload}.sh"')
+        # The time limit is enforced on the master node, so a killed run does not keep occupying the cluster.
+        # timeout(1) signals the whole process group of the run, including spark-submit.
+        limit = self.timeout if self.cutoff is None else self.cutoff
+        self.run_limit = limit
+        exit_code = self.transport.run(
+            f'timeout {limit} bash --noprofile --norc -c scripts/run_wk/run_{self.workload}.sh',
+            timeout=limit + 60,
+        ).returncode
+        
+        # 124 is the exit code of timeout(1)
+        self.censored_flag = exit_code == 124 and limit < self.timeout
 
-        if exit_code > 0:
+        if self.censored_flag:
+            logging.info(f"✂️ Terminated the run early after {limit:.1f} s")
+            self.fail_conf_flag = False
+        elif exit_code > 0:
             logging.warning("💀Failed benchmarking!!")
             logging.warning("UNVALID CONFIGURATION!!")
             self.fail_conf_flag = True
@@ -111,12 +200,16 @@ class SparkEnv:
                         
     def _get_results(self) -> float:
         logging.info("Getting result files..")
-        if self.fail_conf_flag:
-            duration = 10000
+        if self.censored_flag:
+            # The run did not finish, its duration is only known to be longer than the limit it was killed at
+            duration = self.run_limit
+            tps = 0.1
+        elif self.fail_conf_flag:
+            duration = p.FAILED_RESULT
             tps = 0.1
         else:
-            os.system(f'ssh {p.MASTER_ADDRESS} "bash --noprofile --norc -c scripts/report_transport.sh"')
-            f = open(p.HIBENCH_REPORT_PATH, 'r')
+            self._fetch_report()
+            f = open(self.hibench_report_path, 'r')
             report = f.readlines()
             f.close()
             
@@ -126,12 +219,18 @@ class SparkEnv:
 
         return float(duration)
     
+    def _fetch_report(self):
+        if self.remote_report_path is None:
+            self.transport.run('bash --noprofile --norc -c scripts/report_transport.sh')
+        else:
+            self.transport.get(self.remote_report_path, self.hibench_report_path)
+    
     # Clear hdfs storages in the remote Spark nodes
     def clear_spark_storage(self):
         if self.debugging:
             logging.info("[Google Cloud Platform|Dataproc] 🛑 Skipping cleaning Spark storage!!")
         else:
-            exit_code = os.system(f'ssh {p.MASTER_ADDRESS} "bash --noprofile --norc -c scripts/clear_hibench.sh"')
+            exit_code = self.transport.run('bash --noprofile --norc -c scripts/clear_hibench.sh').returncode
             if exit_code > 0:
                 logging.warning("💀Failed cleaning Spark Storage!!")
             else:
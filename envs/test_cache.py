@@ -0,0 +1,129 @@
+import json
+import os
+
+import pytest
+import torch
+
+import envs.cache as cache_module
+from bounce.spark_benchmark import SparkTuning
+from envs.cache import EvaluationCache, get_cache
+
+
+class FakeSparkEnv:
+    """
+    The interface of `SparkEnv` used by `SparkTuning`, without a cluster. Each run returns the next of the given
+    results, and the runs given in `censored` and `failed` are flagged as such.
+    """
+
+    def __init__(self, config_path: str, results: list[float], censored=(), failed=()):
+        self.config_path = config_path
+        self.workload = "join"
+        self.workload_size = "large"
+        nan = float("nan")
+        self.dict_data = {
+            "spark.shuffle.compress": dict(type="binary", min=0, max=1, unit=nan, range="false,true"),
+            "spark.memory.fraction": dict(type="continuous", min=0.5, max=0.9, unit=nan, range=nan),
+            "spark.io.compression.codec": dict(type="categorical", min=0, max=2, unit=nan, range="lz4,lzf,snappy"),
+        }
+        self.results = list(results)
+        self.censored = set(censored)
+        self.failed = set(failed)
+        self.n_runs = 0
+        self.n_applied = 0
+        self.censored_flag = False
+        self.fail_conf_flag = False
+
+    def set_workload_size(self, workload_size: str):
+        self.workload_size = workload_size
+
+    def apply_configuration(self):
+        self.n_applied += 1
+
+    def run_configuration(self, load: bool):
+        self.censored_flag = self.n_runs in self.censored
+        self.fail_conf_flag = self.n_runs in self.failed
+        self.n_runs += 1
+
+    def get_results(self) -> float:
+        return self.results[self.n_runs - 1]
+
+
+def _tuning(tmp_path, results: list[float], **kwargs) -> tuple[SparkTuning, FakeSparkEnv, EvaluationCache]:
+    env = FakeSparkEnv(config_path=str(tmp_path / "tuned.conf"), results=results, **kwargs)
+    cache = EvaluationCache(path=str(tmp_path / "cache.json"))
+    return SparkTuning(env=env, cache=cache), env, cache
+
+
+def _x() -> torch.Tensor:
+    # shuffle compression on, memory fraction 0.6, snappy
+    return torch.tensor([[1.0, 0.6, 0.0, 0.0, 1.0]])
+
+
+def test_key_ignores_the_order_and_whitespace_of_the_lines(tmp_path):
+    a, b, c = tmp_path / "a.conf", tmp_path / "b.conf", tmp_path / "c.conf"
+    a.write_text("spark.executor.cores=2\nspark.memory.fraction=0.6\n")
+    b.write_text("\n  spark.memory.fraction = 0.6 \nspark.executor.cores=2\n\n")
+    c.write_text("spark.executor.cores=2\nspark.memory.fraction=0.7\n")
+
+    assert EvaluationCache.key(str(a), "join", "large") == EvaluationCache.key(str(b), "join", "large")
+    assert EvaluationCache.key(str(a), "join", "large") != EvaluationCache.key(str(c), "join", "large")
+    # the same configuration on another workload or size is another entry
+    assert EvaluationCache.key(str(a), "join", "large") != EvaluationCache.key(str(a), "join", "small")
+    assert EvaluationCache.key(str(a), "join", "large") != EvaluationCache.key(str(a), "sort", "large")
+
+
+def test_cache_is_saved_atomically_and_reloaded(tmp_path, monkeypatch):
+    path = tmp_path / "cache" / "evaluations.json"
+    cache = EvaluationCache(path=str(path))
+    cache.add("a", 1.0)
+    cache.add("a", 2.0)
+    cache.add("b", 3.0)
+
+    reloaded = EvaluationCache(path=str(path))
+    assert len(reloaded) == 2
+    assert reloaded.lookup("a") == [1.0, 2.0]
+    assert reloaded.lookup("c") == []
+
+    # a write that is interrupted leaves the previous cache and no temporary file behind
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(cache_module.json, "dump", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        cache.add("b", 4.0)
+    assert os.listdir(path.parent) == ["evaluations.json"]
+    with open(path) as f:
+        assert json.load(f) == {"a": {"results": [1.0, 2.0]}, "b": {"results": [3.0]}}
+
+
+def test_get_cache_shares_one_cache_per_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert get_cache("cache.json") is get_cache(str(tmp_path / "cache.json"))
+    assert get_cache("cache.json") is not get_cache("other.json")
+
+
+def test_cached_runs_are_reused_and_only_missing_repetitions_are_run(tmp_path):
+    tuning, env, cache = _tuning(tmp_path, results=[12.0, 13.0, 14.0])
+    tuning.save_configuration_file(_x().squeeze())
+    cache.add(cache.key(env.config_path, env.workload, env.workload_size), 10.0)
+
+    assert tuning(_x(), repeat=3).tolist() == [[10.0, 12.0, 13.0]]
+    assert env.n_runs == 2 and env.n_applied == 1
+
+    # all repetitions are cached now, the configuration is neither applied nor run again
+    assert tuning(_x(), repeat=3).tolist() == [[10.0, 12.0, 13.0]]
+    assert tuning(_x(), repeat=1).tolist() == [[10.0]]
+    assert env.n_runs == 2 and env.n_applied == 1
+
+
+def test_censored_and_failed_runs_are_not_cached(tmp_path):
+    tuning, env, cache = _tuning(tmp_path, results=[12.0, 10000.0, 5.0, 13.0, 14.0], failed={1}, censored={2})
+
+    tuning(_x(), repeat=3)
+    key = cache.key(env.config_path, env.workload, env.workload_size)
+    assert cache.lookup(key) == [12.0]
+    assert tuning.last_failed.tolist() == [[False, True, False]]
+
+    # the failed and the censored runs are benchmarked again
+    assert tuning(_x(), repeat=3).tolist() == [[12.0, 13.0, 14.0]]
+    assert cache.lookup(key) == [12.0, 13.0, 14.0]
@@ -0,0 +1,59 @@
+import time
+
+import torch
+
+from envs.engine import EvaluationEngine, FakeCluster, wait_first
+
+
+def test_workers_evaluate_in_parallel():
+    engine = EvaluationEngine([FakeCluster(objective=lambda x: x.sum(), delay=0.3) for _ in range(3)])
+
+    start = time.time()
+    futures = engine.map(torch.arange(6, dtype=torch.float64).reshape(3, 2))
+    results = [future.result() for future in futures]
+    elapsed = time.time() - start
+    engine.shutdown()
+
+    # three runs of 0.3 s each on three clusters take about 0.3 s, not 0.9 s
+    assert elapsed < 0.75
+    assert [r.item() for r in results] == [1.0, 5.0, 9.0]
+    assert len({future.worker for future in futures}) == 3
+
+
+def test_results_complete_in_the_order_of_their_duration():
+    # the first coordinate of a configuration is the duration of its run
+    engine = EvaluationEngine([FakeCluster(objective=lambda x: x[1], delay=lambda x: x[0].item()) for _ in range(3)])
+
+    xs = torch.tensor([[0.6, 0.0], [0.05, 1.0], [0.3, 2.0]])
+    pending = {future: i for i, future in enumerate(engine.map(xs))}
+    order = list()
+    while pending:
+        done, _ = wait_first(list(pending))
+        for future in sorted(done, key=lambda f: pending[f]):
+            i = pending.pop(future)
+            # every result belongs to its own configuration
+            assert future.result().item() == xs[i, 1].item()
+            order.append(i)
+    engine.shutdown()
+
+    assert order == [1, 2, 0]
+
+
+def test_failing_worker_records_the_configuration_as_failed():
+    def objective(x):
+        if x[0] < 0:
+            raise ConnectionError("the cluster is gone")
+        return x[0]
+
+    engine = EvaluationEngine([FakeCluster(objective=objective)], failure_value=1234)
+    failed = engine.submit(torch.tensor([-1.0, 0.0]), repeat=3)
+    ok = engine.submit(torch.tensor([2.0, 0.0]), repeat=3)
+
+    assert torch.equal(failed.result(), torch.full((1, 3), 1234.0))
+    assert failed.last_failed.all() and not failed.last_censored.any()
+    assert isinstance(failed.error, ConnectionError)
+
+    # the worker keeps serving the queue
+    assert torch.equal(ok.result(), torch.full((1, 3), 2.0))
+    assert ok.error is None
+    engine.shutdown()
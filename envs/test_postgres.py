@@ -0,0 +1,40 @@
+import os
+import stat
+
+import pytest
+
+from envs.postgres import PostgresEnv
+from envs.transport import LocalTransport
+
+
+@pytest.fixture
+def postgres_env(tmp_path):
+    csv_path = tmp_path / "parameters.csv"
+    csv_path.write_text(",type,min,max,unit,range\nshared_buffers,numerical,16,1024,MB,\n")
+    env = PostgresEnv(csv_path=str(csv_path), workload="ycsb-a", transport=LocalTransport(root=str(tmp_path)))
+    # the "remote" server is a directory with the YCSB scripts
+    env.remote_dbms_path = str(tmp_path)
+    return env
+
+
+def _script(path, content):
+    with open(path, "w") as f:
+        f.write("#!/bin/bash\n" + content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def test_run_through_local_transport(tmp_path, postgres_env):
+    _script(
+        tmp_path / "run_workloada.sh",
+        "echo '[OVERALL], RunTime(ms), 60000'\necho '[OVERALL], Throughput(ops/sec), 1523.5'\n",
+    )
+    postgres_env.run_configuration(load=False)
+    assert not postgres_env.fail_conf_flag
+    assert postgres_env.get_results() == 1523.5
+
+
+def test_failed_run_through_local_transport(tmp_path, postgres_env):
+    _script(tmp_path / "run_workloada.sh", "echo '[UPDATE], Return=ERROR, 3'\n")
+    postgres_env.run_configuration(load=False)
+    assert postgres_env.fail_conf_flag
+    assert postgres_env.get_results() == 0.1
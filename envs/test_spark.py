@@ -0,0 +1,67 @@
+import os
+import stat
+
+import pytest
+
+import envs.params as p
+from envs.spark import SparkEnv
+from envs.transport import LocalTransport
+
+
+def _script(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("#!/bin/bash\n" + content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def spark_env(tmp_path, monkeypatch):
+    # the "remote" master node is a directory with the HiBench scripts
+    monkeypatch.setattr(p, "GCP_DATAPROC_START_COMMAND", "true")
+    os.makedirs(tmp_path / "conf")
+    config_path = tmp_path / "tuned.conf"
+    config_path.write_text("spark.executor.cores=2\n")
+    return SparkEnv(
+        config_path=str(config_path),
+        workload="join",
+        workload_size="large",
+        alter=False,
+        master_conf_path="conf",
+        hibench_report_path=str(tmp_path / "hibench.report"),
+        remote_report_path="report/hibench.report",
+        transport=LocalTransport(root=str(tmp_path)),
+    )
+
+
+def test_run_through_local_transport(tmp_path, spark_env):
+    _script(
+        tmp_path / "scripts/run_wk/run_join.sh",
+        "mkdir -p report\n"
+        "echo 'Type Date Time Input_data_size Duration(s) Throughput(bytes/s) Throughput/node' > report/hibench.report\n"
+        "echo 'ScalaSparkJoin 2024-01-01 00:00:00 1000 12.5 80 40' >> report/hibench.report\n",
+    )
+    spark_env.apply_configuration()
+    assert (tmp_path / "conf/add-spark.conf").read_text() == "spark.executor.cores=2\n"
+
+    spark_env.run_configuration(load=False)
+    assert not spark_env.fail_conf_flag and not spark_env.censored_flag
+    assert spark_env.get_results() == 12.5
+
+
+def test_failed_run_through_local_transport(tmp_path, spark_env):
+    _script(tmp_path / "scripts/run_wk/run_join.sh", "exit 1\n")
+    spark_env.run_configuration(load=False)
+    assert spark_env.fail_conf_flag
+    assert spark_env.get_results() == p.FAILED_RESULT
+
+
+def test_censored_run_records_the_limit_it_was_killed_at(tmp_path, spark_env):
+    _script(tmp_path / "scripts/run_wk/run_join.sh", "sleep 5\n")
+    spark_env.set_cutoff(incumbent=0.1, factor=1.0, min_cutoff=0.5)
+    spark_env.run_configuration(load=False)
+    assert spark_env.censored_flag
+
+    # the incumbent improves while the result is read, e.g., on another cluster in the asynchronous mode
+    spark_env.set_cutoff(incumbent=0.1, factor=1.0, min_cutoff=0.2)
+    assert spark_env.get_results() == 0.5
@@ -0,0 +1,48 @@
+import subprocess
+
+import envs.transport as transport
+from envs.transport import LocalTransport, SSHTransport
+
+
+def test_failed_open_leaves_the_transport_closed(monkeypatch, caplog):
+    calls = list()
+
+    def fake_run(args, **kwargs):
+        calls.append(args)
+        kwargs["stderr"].write("Permission denied (publickey).\n")
+        return subprocess.CompletedProcess(args, 255)
+
+    monkeypatch.setattr(transport.subprocess, "run", fake_run)
+    ssh = SSHTransport(host="user@spark-master")
+    ssh.open()
+    assert not ssh._opened
+    assert "Permission denied" in caplog.text
+
+    # the next call tries to open the session again
+    ssh.open()
+    assert len(calls) == 2
+
+
+def test_successful_open_is_done_once(monkeypatch):
+    calls = list()
+
+    def fake_run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0)
+
+    monkeypatch.setattr(transport.subprocess, "run", fake_run)
+    ssh = SSHTransport(host="user@spark-master")
+    ssh.open()
+    ssh.open()
+    assert ssh._opened
+    assert len(calls) == 1
+
+
+def test_local_transport(tmp_path):
+    local = LocalTransport(root=str(tmp_path))
+    (tmp_path / "a.txt").write_text("a")
+
+    assert local.put(str(tmp_path / "a.txt"), "b.txt") == 0
+    assert (tmp_path / "b.txt").read_text() == "a"
+    assert local.run("cat b.txt", capture_output=True).stdout == "a"
+    assert local.run("sleep 5", timeout=0.1).returncode == 124
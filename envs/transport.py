@@ -0,0 +1,269 @@
+import os
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Optional
+
+
+class SSHTransport:
+    """
+    Runs commands and copies files on a remote host over one persistent, authenticated SSH session.
+
+    The session is an OpenSSH control master: it is opened once with a full handshake and every later `ssh`/`scp`
+    call is multiplexed over its control socket, so no further handshakes are needed for the whole tuning run.
+    If the master is gone (e.g., the network dropped) or could not be opened (e.g., the authentication failed), the
+    calls fall back to a normal connection and the next call tries to open the master again.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        password: Optional[str] = None,
+        control_dir: Optional[str] = None,
+    ):
+        """
+
+        Args:
+            host: the remote host, anything ssh accepts (e.g., "user@address" or an alias in ~/.ssh/config)
+            password: if given, authenticate with sshpass
+            control_dir: the directory for the control socket, defaults to the temp directory
+        """
+        self.host = host
+        self.password = password
+        control_dir = tempfile.gettempdir() if control_dir is None else control_dir
+        # %C is a hash of the connection parameters, which keeps the socket path short and unique per host
+        self.control_path = os.path.join(control_dir, "nortune-ssh-%C")
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def _prefix(self, program: str) -> list[str]:
+        prefix = ["sshpass", "-p", self.password] if self.password is not None else []
+        return prefix + [program, "-o", f"ControlPath={self.control_path}"]
+
+    @property
+    def is_open(self) -> bool:
+        """
+
+        Returns:
+            whether the control master for the host is running
+
+        """
+        check = subprocess.run(
+            self._prefix("ssh") + ["-O", "check", self.host],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return check.returncode == 0
+
+    def open(self) -> None:
+        """
+        Open the control master unless this transport has already opened it. A failure is logged and the transport
+        stays closed, so the next call tries again.
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            if self._opened:
+                return
+            logging.info(f"🔐 Opening a persistent SSH session to {self.host}")
+            # -f -N: authenticate, then go to the background without running a command.
+            # The output streams are not pipes, otherwise callers that capture output would wait for the master.
+            # stderr goes to a file to report why the session could not be opened.
+            with tempfile.TemporaryFile(mode="w+") as stderr:
+                master = subprocess.run(
+                    self._prefix("ssh")
+                    + ["-f", "-N", "-o", "ControlMaster=yes", "-o", "ControlPersist=yes", self.host],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=stderr,
+                )
+                if master.returncode != 0:
+                    stderr.seek(0)
+                    logging.warning(
+                        f"🔐 Could not open a persistent SSH session to {self.host} "
+                        f"(exit code {master.returncode}): {stderr.read().strip()}"
+                    )
+                    return
+            self._opened = True
+
+    def close(self) -> None:
+        """
+        Stop the control master.
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            if self._opened and self.is_open:
+                logging.info(f"🔐 Closing the persistent SSH session to {self.host}")
+                subprocess.run(
+                    self._prefix("ssh") + ["-O", "exit", self.host],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            self._opened = False
+
+    def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        capture_output: bool = False,
+    ) -> subprocess.CompletedProcess:
+        """
+        Run a command on the remote host.
+
+        Args:
+            command: the command, interpreted by the remote shell
+            timeout: kill the command after this many seconds. The return code is 124 then, as with `timeout`.
+            capture_output: whether to capture stdout and stderr as text
+
+        Returns:
+            the completed process
+
+        """
+        self.open()
+        return _run(self._prefix("ssh") + [self.host, command], timeout, capture_output)
+
+    def put(self, local_path: str, remote_path: str) -> int:
+        """
+        Copy a local file to the remote host.
+
+        Args:
+            local_path: the local file
+            remote_path: the destination on the remote host
+
+        Returns:
+            the return code of scp
+
+        """
+        self.open()
+        return _run(self._prefix("scp") + ["-q", local_path, f"{self.host}:{remote_path}"]).returncode
+
+    def get(self, remote_path: str, local_path: str) -> int:
+        """
+        Copy a file from the remote host.
+
+        Args:
+            remote_path: the file on the remote host
+            local_path: the local destination
+
+        Returns:
+            the return code of scp
+
+        """
+        self.open()
+        return _run(self._prefix("scp") + ["-q", f"{self.host}:{remote_path}", local_path]).returncode
+
+
+class LocalTransport:
+    """
+    Runs the commands as local subprocesses and copies files locally. Has the interface of `SSHTransport` and is used
+    to test the environments without a remote host.
+    """
+
+    def __init__(self, host: str = "localhost", root: Optional[str] = None):
+        """
+
+        Args:
+            host: a name for the fake host
+            root: the working directory of the commands. Relative "remote" paths are resolved against it.
+        """
+        self.host = host
+        self.root = os.getcwd() if root is None else root
+
+    @property
+    def is_open(self) -> bool:
+        return True
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, os.path.expanduser(path))
+
+    def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        capture_output: bool = False,
+    ) -> subprocess.CompletedProcess:
+        return _run(["bash", "-c", command], timeout, capture_output, cwd=self.root)
+
+    def put(self, local_path: str, remote_path: str) -> int:
+        shutil.copy(local_path, self._path(remote_path))
+        return 0
+
+    def get(self, remote_path: str, local_path: str) -> int:
+        shutil.copy(self._path(remote_path), local_path)
+        return 0
+
+
+def _run(
+    args: list[str],
+    timeout: Optional[float] = None,
+    capture_output: bool = False,
+    cwd: Optional[str] = None,
+) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(
+            args,
+            timeout=timeout,
+            capture_output=capture_output,
+            text=capture_output,
+            cwd=cwd,
+        )
+    except subprocess.TimeoutExpired as e:
+        logging.warning(f"⏰ Command timed out after {timeout} s")
+        stdout, stderr = None, None
+        if capture_output:
+            stdout, stderr = [
+                s.decode() if isinstance(s, bytes) else (s or "") for s in (e.stdout, e.stderr)
+            ]
+        return subprocess.CompletedProcess(args, 124, stdout=stdout, stderr=stderr)
+
+
+_TRANSPORTS: dict[str, SSHTransport] = dict()
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+def get_transport(host: str, password: Optional[str] = None) -> SSHTransport:
+    """
+    Get the transport for a host. All environments talking to the same host share one transport and hence one
+    SSH session.
+
+    Args:
+        host: the remote host
+        password: if given, authenticate with sshpass
+
+    Returns:
+        the transport for the host
+
+    """
+    with _TRANSPORTS_LOCK:
+        if host not in _TRANSPORTS:
+            _TRANSPORTS[host] = SSHTransport(host=host, password=password)
+        return _TRANSPORTS[host]
+
+
+@atexit.register
+def close_all_transports() -> None:
+    """
+    Close all SSH sessions opened by `get_transport`.
+
+    Returns:
+        None
+
+    """
+    with _TRANSPORTS_LOCK:
+        for transport in _TRANSPORTS.values():
+            transport.close()
+        _TRANSPORTS.clear()
@@ -14,12 +14,15 @@ from others.benchmarks import Benchmark
 
 from envs.utils import get_logger
 from envs.spark import SparkEnv
+from envs.engine import make_spark_engine
+from envs.cache import get_cache
 
 from envs.params import print_params
 from envs.params import BOUNCE_PARAM as bp
+from envs.params import SPARK_CLUSTERS, SURROGATE_PARAM, CANDIDATE_PARAM
 
-logger = get_logger('logs')
-os.system('clear')
+# Set up in __main__ only, processes spawned by the optimizers (e.g., for fitting the GP) import this module again
+logger = logging.getLogger()
 DEBUGGING_MODE = False
 
 def main():
@@ -100,7 +103,7 @@ def main():
         "--acquisition",
         type=str,
         default='ei',
-        choices=['ei', 'aei'],
+        choices=['ei', 'aei', 'logaei', 'qaei'],
         help='[Noise] Define which acquisition function is used.'
     )
     parser.add_argument(
@@ -108,12 +111,70 @@ def main():
         action='store_true',
         help='[DEBUGGING] If you want to debug the entire code without running benchmarking, trigger this'
     )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help='[Parallel] the number of Spark clusters (defined in SPARK_CLUSTERS on params.py) used to benchmark in parallel'
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help='[Parallel] the number of configurations proposed per iteration, set it to n_workers to keep all clusters busy'
+    )
+    parser.add_argument(
+        "--asynchronous",
+        action='store_true',
+        help='[Parallel] propose a new configuration as soon as any cluster becomes idle (needs n_workers > 1)'
+    )
+    parser.add_argument(
+        "--early_termination",
+        action='store_true',
+        help='[Spark] kill runs that take much longer than the best configuration so far and record them as censored'
+    )
+    parser.add_argument(
+        "--racing",
+        action='store_true',
+        help='[Noise] stop repeating a configuration once it is clearly worse than the best configuration so far'
+    )
+    parser.add_argument(
+        "--fidelities",
+        type=str,
+        nargs='+',
+        default=None,
+        choices=["tiny", "small", "large", "huge", "gigantic"],
+        help='[Multi-fidelity] workload sizes from the cheapest to the target size (= workload_size), e.g., small large'
+    )
+    parser.add_argument(
+        "--refit_every",
+        type=int,
+        default=SURROGATE_PARAM["refit_every"],
+        help='[Surrogate] fit the GP hyperparameters every k iterations and only add the new observations in between'
+    )
+    parser.add_argument(
+        "--candidate_budget",
+        type=float,
+        default=CANDIDATE_PARAM["latency_budget"],
+        help='[Candidates] seconds per proposal for sampling and scoring discrete candidates, sizes the candidate pool'
+    )
+    parser.add_argument(
+        "--cache",
+        action='store_true',
+        help='[Spark] reuse the results of configurations benchmarked before (stored in EVALUATION_CACHE_PATH on params.py)'
+    )
     parser.add_argument(
         "--q_factor",
         type=int,
         default=None,
         help='[LlamaTune] adjusting quantization factor (configuration space bucketization)'
     )   
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        help='[Bounce/NSBO] continue the run whose results (and checkpoint.pt) are in this directory'
+    )
     # ========================================================
     
     args = parser.parse_args()
@@ -148,6 +209,8 @@ def main():
     logger.info("*************************************")
 
     env = None
+    evaluator = None
+    cache = get_cache() if args.cache else None
     
     match args.optimizer_method:
         case "bounce":
@@ -156,7 +219,7 @@ def main():
                 workload_size=args.workload_size,
                 debugging=args.debugging
                 )
-            benchmark = SparkTuning(env=env)
+            benchmark = SparkTuning(env=env, cache=cache)
             tuner = Bounce(benchmark=benchmark)
         case "random":            
             benchmark = SparkBench(
@@ -172,7 +235,18 @@ def main():
                 workload_size=args.workload_size,
                 debugging=args.debugging
                 )
-            benchmark = SparkTuning(env=env)
+            benchmark = SparkTuning(env=env, cache=cache)
+            if args.n_workers > 1:
+                assert args.n_workers <= len(SPARK_CLUSTERS), "Define more clusters in SPARK_CLUSTERS on params.py"
+                # The first cluster is the one of `env`
+                evaluator = make_spark_engine(
+                    workload=args.workload,
+                    workload_size=args.workload_size,
+                    debugging=args.debugging,
+                    clusters=SPARK_CLUSTERS[1:args.n_workers],
+                    cache=cache,
+                )
+                evaluator.register(benchmark)
             tuner = NSBO(
                 benchmark=benchmark, 
                 initial_target_dimensionality=args.target_dim,
@@ -184,6 +258,14 @@ def main():
                 noise_threshold=args.noise_threshold,
                 acquisition=args.acquisition,
             #   gp_mode=args.gp
+                evaluator=evaluator,
+                batch_size=args.batch_size,
+                asynchronous=args.asynchronous,
+                early_termination=args.early_termination,
+                racing=args.racing,
+                fidelities=args.fidelities,
+                refit_every=args.refit_every,
+                candidate_latency_budget=args.candidate_budget,
                 )
         case "smac":
             benchmark = Benchmark(
@@ -193,6 +275,7 @@ def main():
                 embed_adapter_alias=args.embedding_method,
                 target_dim=args.target_dim,
                 quantization_factor=args.q_factor,
+                cache=cache,
                 )
             tuner = Baselines(
                 optimizer_method=args.optimizer_method,
@@ -206,6 +289,7 @@ def main():
                                   embed_adapter_alias=args.embedding_method,
                                   target_dim=args.target_dim,
                                   quantization_factor=args.q_factor,
+                                  cache=cache,
                                   )
             tuner = Baselines(
                 optimizer_method=args.optimizer_method,
@@ -216,12 +300,22 @@ def main():
         case _:
             assert False, "The method is not defined.. Choose in [bounce, random]"
     
+    if args.resume is not None:
+        assert hasattr(tuner, "load_checkpoint"), f"{args.optimizer_method} cannot be resumed"
+        tuner.load_checkpoint(args.resume)
+    
     then = time.time()
     tuner.run()
     
     now = time.time()
     logger.info(f"Total time: {now - then:.2f} seconds")
     
+    if evaluator is not None:
+        evaluator.shutdown()
+        for worker in evaluator.workers:
+            if worker.env is not env:
+                worker.env.clear_spark_storage()
+    
     if env is not None:
         env.clear_spark_storage()
         env.stop_dataproc()
@@ -233,6 +327,8 @@ def main():
 
 
 if __name__ == "__main__":
+    logger = get_logger('logs')
+    os.system('clear')
     try:
         main()
     except:
@@ -19,11 +19,9 @@ from envs.postgres import PostgresEnv
 from envs.params import print_params
 from envs.params import BOUNCE_PARAM as bp
 
-logger = get_logger('logs')
-os.system('clear')
 DEBUGGING_MODE = False
 
-def main():
+def main(logger: logging.Logger):
     parser = argparse.ArgumentParser(
         prog=BOUNCE_NAME,
     )
@@ -93,7 +91,7 @@ def main():
         "--acquisition",
         type=str,
         default='ei',
-        choices=['ei', 'aei'],
+        choices=['ei', 'aei', 'logaei', 'qaei'],
         help='[Noise] Define which acquisition function is used.'
     )
     parser.add_argument(
@@ -101,6 +99,11 @@ def main():
         action='store_true',
         help='[NSBO] Using the alleviating version for calculating evaluation budgets for target dimensionality.'
     )    
+    parser.add_argument(
+        "--racing",
+        action='store_true',
+        help='[Noise] stop repeating a configuration once it is clearly worse than the best configuration so far'
+    )
     parser.add_argument(
         "--debugging",
         action='store_true',
@@ -124,6 +127,12 @@ def main():
         action='store_true',
         help='[Metrics] If tuning tps, trigger this.'
     )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        help='[Bounce/NSBO] continue the run whose results (and checkpoint.pt) are in this directory'
+    )
     
     
     args = parser.parse_args()
@@ -195,6 +204,7 @@ def main():
                 noise_threshold=args.noise_threshold,
                 acquisition=args.acquisition,
                 alleviate_budget=args.alleviate_budget,
+                racing=args.racing,
                 )
         case "smac":
             benchmark = PostgresBenchmark(
@@ -230,6 +240,10 @@ def main():
         case _:
             assert False, "The method is not defined.. Choose in [bounce, random]"
     
+    if args.resume is not None:
+        assert hasattr(tuner, "load_checkpoint"), f"{args.optimizer_method} cannot be resumed"
+        tuner.load_checkpoint(args.resume)
+    
     then = time.time()
     tuner.run()
     
@@ -239,8 +253,11 @@ def main():
 
 
 if __name__ == "__main__":
+    # Set up in __main__ only, processes spawned by the optimizers (e.g., for fitting the GP) import this module again
+    logger = get_logger('logs')
+    os.system('clear')
     try:
-        main()
+        main(logger)
     except:
         logger.exception("ERROR!!")
 
@@ -1,12 +1,53 @@
+import functools
 import torch
 from torch import Tensor
-from typing import Union
-from botorch.acquisition import AnalyticAcquisitionFunction
+from typing import Callable, Optional, Union
+from botorch.acquisition import AnalyticAcquisitionFunction, MCAcquisitionFunction
+from botorch.acquisition.analytic import _log_ei_helper
+from botorch.acquisition.objective import MCAcquisitionObjective, PosteriorTransform
+from botorch.sampling.base import MCSampler
 from botorch.utils.probability.utils import (ndtr as Phi, phi)
+from botorch.utils.transforms import concatenate_pending_points, t_batch_mode_transform
 from botorch.models.model import Model
 import logging
 
-class AugmentedExpectedImprovement(AnalyticAcquisitionFunction):
+class _NoiseLevelMixin:
+    """
+    The noise level of the model, read from the likelihood once per model instead of on every evaluation. The model
+    can be replaced, e.g., by the conditioned model of the Kriging believer, then the noise level is read again.
+    """
+
+    def _init_noise_level(self):
+        self._noise_model_id = id(self.model)
+        self._noise_level = self.model.likelihood.noise_covar.noise.detach()
+
+    @property
+    def noise_level(self) -> Tensor:
+        if self._noise_model_id != id(self.model):
+            self._init_noise_level()
+        return self._noise_level
+
+    def _noise_factor(self, sigma: Tensor) -> Tensor:
+        """Returns the AEI penalty `1 - noise / sqrt(sigma^2 + noise^2)`, in (0, 1]."""
+        noise_level = self.noise_level.to(sigma)
+        return 1 - (noise_level / torch.sqrt(sigma**2 + noise_level**2))
+
+
+def _points_or_t_batch(forward: Callable) -> Callable:
+    """
+    Like `t_batch_mode_transform(expected_q=1)`, but a 2-D input (n x d) holds n points with one value each, as the
+    analytic acquisition functions have always been called, instead of a single batch of n points.
+    """
+    transformed = t_batch_mode_transform(expected_q=1)(forward)
+
+    @functools.wraps(forward)
+    def decorated(acqf, X: Tensor) -> Tensor:
+        return transformed(acqf, X.unsqueeze(-2) if X.dim() == 2 else X)
+
+    return decorated
+
+
+class AugmentedExpectedImprovement(_NoiseLevelMixin, AnalyticAcquisitionFunction):
     def __init__(self, 
                 model: Model,
                 best_f: Union[float, Tensor],
@@ -16,17 +57,83 @@ class AugmentedExpectedImprovement(AnalyticAcquisitionFunction):
         super().__init__(model)
         self.best_f = best_f
         self.maximize = maximize
+        self._init_noise_level()
         
+    @_points_or_t_batch
     def forward(self, X):
         mean, sigma = self._mean_and_sigma(X)
         u = _scaled_improvement(mean, sigma, self.best_f, self.maximize)
         ei = sigma * _ei_helper(u)
         
-        noise_level = self.model.likelihood.noise_covar.noise
-        aei = ei * (1 - (noise_level / torch.sqrt(sigma**2 + noise_level**2)))
+        aei = ei * self._noise_factor(sigma)
         
         return aei
-    
+
+
+class LogAugmentedExpectedImprovement(_NoiseLevelMixin, AnalyticAcquisitionFunction):
+    """
+    The logarithm of AEI. EI is computed in log space (with erfcx, see `_log_ei_helper`), so it does not underflow to
+    zero far from the incumbent and its gradients stay informative there. The maximizer is the same as for AEI.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        best_f: Union[float, Tensor],
+        maximize: bool = True,
+        **kwargs,
+    ):
+        super().__init__(model)
+        self.best_f = best_f
+        self.maximize = maximize
+        self._init_noise_level()
+
+    @_points_or_t_batch
+    def forward(self, X):
+        mean, sigma = self._mean_and_sigma(X)
+        u = _scaled_improvement(mean, sigma, self.best_f, self.maximize)
+        log_ei = _log_ei_helper(u) + sigma.log()
+        noise_level = self.noise_level.to(sigma)
+        return log_ei + torch.log1p(-(noise_level / torch.sqrt(sigma**2 + noise_level**2)))
+
+
+class qAugmentedExpectedImprovement(_NoiseLevelMixin, MCAcquisitionFunction):
+    """
+    Monte-Carlo AEI of a batch of q points: the expected maximum over the batch of the improvement of each point,
+    penalized by the AEI factor of its marginal posterior standard deviation. For q = 1, it estimates AEI.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        best_f: Union[float, Tensor],
+        sampler: Optional[MCSampler] = None,
+        objective: Optional[MCAcquisitionObjective] = None,
+        posterior_transform: Optional[PosteriorTransform] = None,
+        X_pending: Optional[Tensor] = None,
+        **kwargs,
+    ):
+        super().__init__(
+            model=model,
+            sampler=sampler,
+            objective=objective,
+            posterior_transform=posterior_transform,
+            X_pending=X_pending,
+        )
+        self.register_buffer("best_f", torch.as_tensor(best_f, dtype=float))
+        self._init_noise_level()
+
+    @concatenate_pending_points
+    @t_batch_mode_transform()
+    def forward(self, X: Tensor) -> Tensor:
+        posterior = self.model.posterior(X=X, posterior_transform=self.posterior_transform)
+        samples = self.get_posterior_samples(posterior)
+        obj = self.objective(samples, X=X)
+        improvement = (obj - self.best_f.unsqueeze(-1).to(obj)).clamp_min(0)
+        sigma = posterior.variance.clamp_min(1e-12).sqrt().squeeze(-1)
+        return (improvement * self._noise_factor(sigma)).max(dim=-1)[0].mean(dim=0)
+
+
 def _scaled_improvement(
     mean: Tensor, sigma: Tensor, best_f: Tensor, maximize: bool
 ) -> Tensor:
@@ -41,7 +148,104 @@ def _ei_helper(u: Tensor) -> Tensor:
     """
     return phi(u) + u * Phi(u)
 
-def get_best_fx(model: Model, xs:Tensor, alpha: float=1.0, effective: bool = False):
+class PosteriorCache:
+    """
+    Caches the posterior mean and standard deviation of a model at a set of points, e.g., at the observations.
+
+    Within an iteration, the posterior at the observations is needed by every interleaved step (the center of the
+    trust region, the incumbent of the acquisition function) and once more to adjust the trust region, always for the
+    same model and points. An entry is keyed on the identity of the model and the points and is only reused while
+    neither has changed: the hyperparameters of the model and the version counters of the training data and the points
+    must match.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        """
+
+        Args:
+            max_entries: the number of entries to keep, the oldest entry is dropped first
+        """
+        self.max_entries = max_entries
+        self._entries: dict[tuple[int, int], tuple] = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _version(model: Model, xs: Tensor) -> tuple:
+        tensors = list(getattr(model, "train_inputs", None) or ())
+        if getattr(model, "train_targets", None) is not None:
+            tensors.append(model.train_targets)
+        return tuple((id(t), t._version) for t in tensors) + ((xs._version, xs.data_ptr(), tuple(xs.shape)),)
+
+    @staticmethod
+    def _hyperparameters(model: Model) -> Tensor:
+        # compared by value, the setters of gpytorch (e.g., `kernel.outputscale = 1`) write to `.data` and leave the
+        # version counters of the parameters unchanged
+        with torch.no_grad():
+            return torch.cat([torch.zeros(0, dtype=torch.float64)] + [
+                p.detach().flatten().to(torch.float64) for p in model.parameters()
+            ])
+
+    def mean_and_sigma(self, model: Model, xs: Tensor) -> tuple[Tensor, Tensor]:
+        """
+        The posterior mean and standard deviation of the model at xs, computed once per model and points.
+
+        Args:
+            model: the GP model, set to eval mode
+            xs: the points
+
+        Returns:
+            the posterior mean and standard deviation, both detached
+
+        """
+        model.eval()
+        model.likelihood.eval()
+        key = (id(model), id(xs))
+        version = self._version(model, xs)
+        hyperparameters = self._hyperparameters(model)
+        entry = self._entries.get(key)
+        # the entry holds references to the model and the points, so their ids cannot be reused while it is cached
+        if (
+            entry is not None
+            and entry[0] is model
+            and entry[1] is xs
+            and entry[2] == version
+            and torch.equal(entry[3], hyperparameters)
+        ):
+            self.hits += 1
+            return entry[4], entry[5]
+        self.misses += 1
+        with torch.no_grad():
+            posterior = model.posterior(xs)
+            mean = posterior.mean
+            sigma = posterior.variance.sqrt()
+        self._entries.pop(key, None)
+        self._entries[key] = (model, xs, version, hyperparameters, mean, sigma)
+        while len(self._entries) > self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+        return mean, sigma
+
+    def clear(self):
+        """
+        Drop all entries, e.g., at the start of an iteration.
+
+        Returns:
+            None
+
+        """
+        self._entries = dict()
+
+
+def _mean_and_sigma(model: Model, xs: Tensor, posterior_cache: Optional[PosteriorCache]) -> tuple[Tensor, Tensor]:
+    if posterior_cache is not None:
+        return posterior_cache.mean_and_sigma(model, xs)
+    model.eval()
+    model.likelihood.eval()
+    posterior = model.posterior(xs)
+    return posterior.mean, posterior.variance.sqrt()
+
+
+def get_best_fx(model: Model, xs:Tensor, alpha: float=1.0, effective: bool = False, posterior_cache: Optional[PosteriorCache] = None):
     '''
         model : Model
         x : torch.Tensor
@@ -49,18 +253,15 @@ def get_best_fx(model: Model, xs:Tensor, alpha: float=1.0, effective: bool = Fal
         
         If effective is True, get the effective best solution.
             ref) Huang, Deng, et al. "Global optimization of stochastic black-box systems via sequential kriging meta-models." Journal of global optimization 34 (2006): 441-466.
+        posterior_cache : PosteriorCache, reuses the posterior at xs if given
     '''
-    model.eval()
-    model.likelihood.eval()
-    posterior = model.posterior(xs)
-    mean = posterior.mean
-    sigma = posterior.variance.sqrt()
+    mean, sigma = _mean_and_sigma(model, xs, posterior_cache)
     # sign = np.random.choice([-1, 1])
     # alpha *= sign
     
     return mean.max() if effective else (mean + sigma * alpha).max()
 
-def get_best_x(model: Model, xs: Tensor, fxs: Tensor=None, alpha: float=1.0, noisy: bool = True, effective: bool = False):
+def get_best_x(model: Model, xs: Tensor, fxs: Tensor=None, alpha: float=1.0, noisy: bool = True, effective: bool = False, posterior_cache: Optional[PosteriorCache] = None):
 # def get_best_x(model: Model, xs: Tensor, fxs: Tensor, alpha: float=1.0, noisy: bool = True, effective: bool = False, maximize: bool = True):
     '''
         model : Model
@@ -69,16 +270,13 @@ def get_best_x(model: Model, xs: Tensor, fxs: Tensor=None, alpha: float=1.0, noi
         
         If effective is True, get the effective best solution.
             ref) Huang, Deng, et al. "Global optimization of stochastic black-box systems via sequential kriging meta-models." Journal of global optimization 34 (2006): 441-466.
+        posterior_cache : PosteriorCache, reuses the posterior at xs if given
     '''
     
     # maximize = True if effective else False
     
     if noisy or effective:
-        model.eval()
-        model.likelihood.eval()
-        posterior = model.posterior(xs)    
-        mean = posterior.mean
-        sigma = posterior.variance.sqrt()
+        mean, sigma = _mean_and_sigma(model, xs, posterior_cache)
         
         fxs = mean + sigma * alpha if effective else mean
         
@@ -1,3 +1,4 @@
+import copy
 import logging
 from typing import Optional
 from random import sample, uniform
@@ -8,17 +9,20 @@ import torch
 from botorch import fit_gpytorch_mll
 from botorch.exceptions import ModelFittingError
 from botorch.models import SingleTaskGP, FixedNoiseGP
+from botorch.models.transforms.input import InputTransform
 from gpytorch import ExactMarginalLogLikelihood
 from gpytorch.kernels import ScaleKernel
 from gpytorch.likelihoods import GaussianLikelihood
 from torch import Tensor
 
 from bounce import settings
+from bounce.gaussian_process import fit_mll_multistart
 from bounce.kernel.categorical_mixture import MixtureKernel
 from bounce.projection import AxUS
 from bounce.util.benchmark import ParameterType
 
 from envs.params import GP_PARAM as p
+from envs.params import SURROGATE_PARAM
 
 def get_gp(
     axus: AxUS,
@@ -35,6 +39,9 @@ def get_gp(
     discrete_ard: bool = False,
     continuous_ard: bool = True,
     noise: bool = True, # If using AEI, it should be True
+    censored: Optional[Tensor] = None,
+    target_fidelity: Optional[float] = None,
+    hyperparameters: Optional[dict] = None,
 ) -> tuple[SingleTaskGP, Tensor, Tensor]:
     """
     Define the GP model.
@@ -52,21 +59,31 @@ def get_gp(
         lamda: the parameter for the weighted average in the mixturekernel. trainable if set to None
         discrete_ard: whether to use ARD for discrete parameters
         continuous_ard: whether to use ARD for continuous parameters
+        noise: whether to learn the observation noise with a prior
+        censored: whether each function value is censored, i.e., only an upper bound of the true value (e.g., runs
+            terminated early or failed runs). The censored values are imputed with `impute_censored`.
+        target_fidelity: if given, the last column of x is the fidelity of each observation (e.g., the workload size),
+            and the posterior of the model is taken at target_fidelity for inputs without that column
+        hyperparameters: the hyperparameters of a fitted model (its state dict), used by `impute_censored` instead of
+            fitting the GP on the uncensored values
+
 
     Returns:
-        the GP model, the input points, and the function values at the input points
+        the GP model, the input points, and the function values at the input points (imputed if censored)
 
     """
 
     assert not discrete_ard, "ARD for discrete parameters is not supported yet"
     assert continuous_ard, "ARD for continuous parameters is always used"
-    continuous_type = axus.bins_and_indices_of_type(ParameterType.CONTINUOUS) +\
-                        axus.bins_and_indices_of_type(ParameterType.NUMERICAL)
-    continuous_dims = np.array([ i.item() for ( _, i ) in continuous_type])
+    continuous_dims = axus.continuous_indices.numpy()
     # continuous_dims = np.asarray(
     #     [i.item() for b, i in axus.bins_and_indices_of_type(ParameterType.CONTINUOUS)]
     # )
-    discrete_dims = np.setdiff1d(np.arange(axus.target_dim), continuous_dims)
+    discrete_dims = axus.discrete_indices.numpy()
+
+    if target_fidelity is not None:
+        assert len(discrete_dims) > 0 and len(continuous_dims) > 0, "Multi-fidelity needs a mixed space"
+        assert x.shape[-1] == axus.target_dim + 1, "The last column of x must be the fidelity"
 
     if len(discrete_dims) == 0:
         kernel = gpytorch.kernels.MaternKernel(
@@ -97,6 +114,10 @@ def get_gp(
                 lengthscale_prior_shape, lengthscale_prior_rate
             ),
             lamda=lamda,
+            fidelity_dims=[axus.target_dim] if target_fidelity is not None else None,
+            fidelity_lengthscale_prior=gpytorch.priors.GammaPrior(
+                lengthscale_prior_shape, lengthscale_prior_rate
+            ) if target_fidelity is not None else None,
         )
 
     covar_module = ScaleKernel(
@@ -109,6 +130,16 @@ def get_gp(
     )
 
     train_x = x.detach().clone()
+    if censored is not None and censored.any():
+        fx = impute_censored(
+            axus=axus,
+            x=x,
+            fx=fx,
+            censored=censored,
+            noise=noise,
+            target_fidelity=target_fidelity,
+            hyperparameters=hyperparameters,
+        )
     train_fx = fx[:, None].detach().clone()
 
     if noise:
@@ -125,6 +156,8 @@ def get_gp(
             train_Y=train_fx,
             covar_module=covar_module,
             likelihood=likelihood,
+            input_transform=TargetFidelity(dim=axus.target_dim, fidelity=target_fidelity)
+            if target_fidelity is not None else None,
         )
         
     return model, train_x, train_fx
@@ -136,6 +169,8 @@ def fit_mll(
     train_fx: Tensor,
     max_cholesky_size: int = 1000,
     use_scipy_lbfgs: bool = True,
+    n_restarts: int = p["mll_restarts"],
+    n_workers: int = p["mll_workers"],
 ) -> None:
     """
     Fit the GP model. If the LBFGS optimizer fails, use the Adam optimizer.
@@ -146,11 +181,25 @@ def fit_mll(
         train_fx: the function values at the input points
         max_cholesky_size: the maximum size of the Cholesky decomposition
          use_scipy_lbfgs: whether to use the scipy LBFGS optimizer, otherwise use the Adam optimizer
+        n_restarts: the number of starting points of the fit, see `bounce.gaussian_process.fit_mll_multistart`
+        n_workers: the number of processes fitting the starting points in parallel
 
     Returns:
         None
 
     """
+    if n_restarts > 1:
+        fit_mll_multistart(
+            fit=fit_mll,
+            model=model,
+            train_x=train_x,
+            train_fx=train_fx,
+            n_restarts=n_restarts,
+            n_workers=n_workers,
+            max_cholesky_size=max_cholesky_size,
+            use_scipy_lbfgs=use_scipy_lbfgs,
+        )
+        return
     # Set model to training mode
     model.train()
     model.likelihood.train()
@@ -185,3 +234,277 @@ def fit_mll(
 
     model.eval()
     model.likelihood.eval()
+
+
+def impute_censored(
+    axus: AxUS,
+    x: Tensor,
+    fx: Tensor,
+    censored: Tensor,
+    noise: bool = True,
+    target_fidelity: Optional[float] = None,
+    hyperparameters: Optional[dict] = None,
+) -> Tensor:
+    """
+    Impute censored function values by the mean of the truncated posterior of a GP fitted on the uncensored values.
+    If the hyperparameters of a fitted model are given (e.g., of the previous iteration), the GP on the uncensored
+    values uses them instead of being fitted.
+
+    The GP maximizes, so a censored value c is an upper bound of the true value f. With the posterior N(mu, sigma^2)
+    at the censored point, f is imputed as E[f | f <= c] = mu - sigma * phi(b) / Phi(b) with b = (c - mu) / sigma.
+    This is always below c, and close to mu if the GP already predicts the point to be much worse than c.
+
+    Args:
+        axus: the AxUS object
+        x: the input points
+        fx: the function values at the input points
+        censored: whether each function value is censored
+        noise: whether to learn the observation noise with a prior
+        target_fidelity: see `get_gp`
+        hyperparameters: the hyperparameters (state dict) of a fitted model on the same embedding, if any
+
+    Returns:
+        the function values with the censored values imputed
+
+    """
+    censored = censored.to(device=fx.device, dtype=torch.bool)
+    if (~censored).sum() < 2:
+        # Too few exact observations to fit a GP, keep the bounds
+        return fx.clone()
+
+    model, train_x, train_fx = get_gp(
+        axus=axus, x=x[~censored], fx=fx[~censored], noise=noise, target_fidelity=target_fidelity
+    )
+    if not load_hyperparameters(model, hyperparameters):
+        fit_mll(model=model, train_x=train_x, train_fx=train_fx)
+    model.eval()
+    model.likelihood.eval()
+
+    fx = fx.clone()
+    fx[censored] = truncated_posterior_mean(model=model, x=x[censored], bound=fx[censored])
+    logging.info(f"🔒 Imputed {censored.sum().item()} censored function values")
+    return fx
+
+
+def load_hyperparameters(model: SingleTaskGP, hyperparameters: Optional[dict]) -> bool:
+    """
+    Initialize the hyperparameters of a model with the ones of another model, as far as their shapes match.
+
+    Args:
+        model: the model
+        hyperparameters: the state dict of the other model, if any
+
+    Returns:
+        whether all hyperparameters of the model were loaded
+
+    """
+    if hyperparameters is None:
+        return False
+    state = model.state_dict()
+    compatible = {k: v for k, v in hyperparameters.items() if k in state and state[k].shape == v.shape}
+    model.load_state_dict(compatible, strict=False)
+    return len(compatible) == len(state)
+
+
+def truncated_posterior_mean(model: SingleTaskGP, x: Tensor, bound: Tensor) -> Tensor:
+    """
+    The mean of the posterior of the model at x truncated to values below bound, see `impute_censored`.
+
+    Args:
+        model: the fitted GP model
+        x: the censored input points
+        bound: the censored function values, i.e., upper bounds of the true values
+
+    Returns:
+        E[f(x) | f(x) <= bound], at most bound
+
+    """
+    with torch.no_grad():
+        posterior = model.posterior(x)
+        mu = posterior.mean.squeeze(-1)
+        sigma = posterior.variance.clamp_min(1e-12).sqrt().squeeze(-1)
+        b = (bound - mu) / sigma
+        # phi(b) / Phi(b) in log space, Phi(b) underflows for b << 0
+        log_phi = -0.5 * b**2 - 0.5 * np.log(2 * np.pi)
+        imputed = mu - sigma * torch.exp(log_phi - torch.special.log_ndtr(b))
+    return torch.minimum(imputed, bound)
+
+
+class SurrogateManager:
+    """
+    Keeps the GP across the iterations of an optimizer instead of fitting a new one on all observations every time.
+
+    A full fit (`record` after `get_gp` and `fit_mll`) starts from the hyperparameters of the previous full fit
+    (`warm_start`) and freezes the standardization of the function values. Until the next full fit, new observations
+    are added with `update`, which conditions the previous model on them. This updates the cached Cholesky factor of
+    the training covariance with a low-rank update and keeps the hyperparameters fixed. A full fit is needed every
+    `refit_every` iterations, and whenever the training inputs changed in another way than by appending points, e.g.,
+    after a split of the embedding.
+    """
+
+    def __init__(self, refit_every: int = SURROGATE_PARAM["refit_every"]):
+        """
+
+        Args:
+            refit_every: the number of iterations between two full fits, 1 fits the GP in every iteration
+        """
+        assert refit_every >= 1, "refit_every must be positive"
+        self.refit_every = refit_every
+        self.model: Optional[SingleTaskGP] = None
+        """
+        the latest model, either fully fitted or conditioned on the observations added since
+        """
+        self.mean: Optional[Tensor] = None
+        """
+        the mean used to standardize the function values at the last full fit
+        """
+        self.std: Optional[Tensor] = None
+        """
+        the standard deviation used to standardize the function values at the last full fit
+        """
+        self._train_x: Optional[Tensor] = None
+        self._n_updates = 0
+        self._hyperparameters: Optional[dict] = None
+
+    @property
+    def hyperparameters(self) -> Optional[dict]:
+        """
+
+        Returns:
+            the hyperparameters (state dict) of the last full fit, None if there is none on the current embedding
+
+        """
+        return self._hyperparameters
+
+    def needs_refit(self, x: Tensor) -> bool:
+        """
+
+        Args:
+            x: all training inputs of the next model
+
+        Returns:
+            whether the next model needs a full fit, otherwise `update` can be used
+
+        """
+        return (
+            self.model is None
+            or self._n_updates + 1 >= self.refit_every
+            or x.shape[-1] != self._train_x.shape[-1]
+            or len(x) < len(self._train_x)
+            or not torch.equal(x[: len(self._train_x)], self._train_x)
+        )
+
+    def warm_start(self, model: SingleTaskGP) -> None:
+        """
+        Initialize the hyperparameters of a new model with the ones of the last full fit, if their shapes match.
+
+        Args:
+            model: the new model, before fitting
+
+        Returns:
+            None
+
+        """
+        load_hyperparameters(model, self._hyperparameters)
+
+    def record(self, model: SingleTaskGP, x: Tensor, mean: Tensor, std: Tensor) -> None:
+        """
+        Store a fully fitted model.
+
+        Args:
+            model: the fitted model
+            x: the training inputs of the model
+            mean: the mean used to standardize the function values
+            std: the standard deviation used to standardize the function values
+
+        Returns:
+            None
+
+        """
+        self.model = model
+        self.mean, self.std = mean, std
+        self._train_x = x.detach().clone()
+        self._n_updates = 0
+        self._hyperparameters = copy.deepcopy(model.state_dict())
+
+    def update(self, x: Tensor, fx: Tensor, censored: Optional[Tensor] = None) -> SingleTaskGP:
+        """
+        Condition the latest model on the observations added since.
+
+        Args:
+            x: all training inputs, the first ones are the training inputs of the latest model
+            fx: all function values, standardized with `mean` and `std` and in the sign of the model
+            censored: whether each function value is censored, see `get_gp`. New censored values are imputed with
+                the latest model.
+
+        Returns:
+            the updated model
+
+        """
+        n_train = len(self._train_x)
+        x_new, fx_new = x[n_train:], fx[n_train:].clone()
+        self._n_updates += 1
+        if len(x_new) == 0:
+            return self.model
+        if censored is not None and censored[n_train:].any():
+            new_censored = censored[n_train:].to(device=fx_new.device, dtype=torch.bool)
+            fx_new[new_censored] = truncated_posterior_mean(
+                model=self.model, x=x_new[new_censored], bound=fx_new[new_censored]
+            )
+
+        self.model.eval()
+        self.model.likelihood.eval()
+        # The hyperparameters are fixed, so the caches are built without a graph. Otherwise, every backward pass of the
+        # acquisition function would go through (and free) the graph of the Cholesky update.
+        with torch.no_grad():
+            # fills the prediction caches (e.g., the Cholesky factor), which the conditioning updates
+            self.model.posterior(x_new[:1])
+            self.model = self.model.condition_on_observations(
+                X=self.model.transform_inputs(x_new), Y=fx_new.unsqueeze(-1)
+            )
+        self._train_x = x.detach().clone()
+        logging.info(f"🧩 Conditioned the GP on {len(x_new)} new observations without refitting")
+        return self.model
+
+    def invalidate(self) -> None:
+        """
+        Forget the model and the hyperparameters, e.g., after a split of the embedding.
+
+        Returns:
+            None
+
+        """
+        self.model = None
+        self._train_x = None
+        self._hyperparameters = None
+        self._n_updates = 0
+
+
+class TargetFidelity(InputTransform, torch.nn.Module):
+    """
+    Appends the target fidelity as the last column to inputs that do not have a fidelity column yet.
+
+    The training inputs of a multi-fidelity GP carry the fidelity they were observed at, while the candidates are
+    points of the embedding only. With this transform, the posterior at a candidate is the posterior at the target
+    fidelity, so the acquisition functions and candidate generation work unchanged.
+    """
+
+    def __init__(self, dim: int, fidelity: float):
+        """
+
+        Args:
+            dim: the dimensionality of the inputs without the fidelity column
+            fidelity: the target fidelity
+        """
+        super().__init__()
+        self.dim = dim
+        self.fidelity = fidelity
+        self.transform_on_train = True
+        self.transform_on_eval = True
+        self.transform_on_fantasize = True
+
+    def transform(self, X: Tensor) -> Tensor:
+        if X.shape[-1] == self.dim + 1:
+            return X
+        fidelity = torch.full(X.shape[:-1] + (1,), self.fidelity, dtype=X.dtype, device=X.device)
+        return torch.cat((X, fidelity), dim=-1)
@@ -1,16 +1,25 @@
+import functools
 import logging
 import lzma
 import os.path
+from typing import Optional
 import numpy as np
 import torch
 from torch import Size
 from tqdm import tqdm
 
 from bounce.bounce import Bounce
+from bounce.util.point_index import PointIndex
 from bounce.util.printing import BColors
+from bounce.util.results import ResultsLog
 from bounce.benchmarks import Benchmark
 from bounce.projection import Bin
-from bounce.candidates import create_candidates_continuous, create_candidates_discrete
+from bounce.candidates import (
+    AcquisitionOptimizer,
+    CandidatePool,
+    create_candidates_continuous,
+    create_candidates_discrete,
+)
 from botorch.acquisition import ExpectedImprovement, NoisyExpectedImprovement
 from botorch.sampling import SobolQMCNormalSampler
 from bounce.trust_region import TrustRegion, update_tr_state
@@ -25,10 +34,19 @@ from bounce.util.data_handling import (
     sample_numerical,
 )
 
-from nsbo.gaussian_process import fit_mll, get_gp
-from nsbo.acquisition import AugmentedExpectedImprovement, get_best_fx, get_best_x
+from nsbo.gaussian_process import fit_mll, get_gp, SurrogateManager
+from nsbo.acquisition import (
+    AugmentedExpectedImprovement,
+    LogAugmentedExpectedImprovement,
+    PosteriorCache,
+    qAugmentedExpectedImprovement,
+    get_best_fx,
+    get_best_x,
+)
 from envs.params import BENCHMARKING_REPETITION, RANDOM_SEED, CONF_PATH
 from envs.params import NOISE_PARAM as n
+from envs.params import RACING_PARAM, FIDELITY_PARAM, SURROGATE_PARAM, CANDIDATE_PARAM
+from envs.engine import EvaluationEngine, wait_first
 
 class NSBO(Bounce):
     def __init__(self,
@@ -41,12 +59,31 @@ class NSBO(Bounce):
                  noise_threshold: float = 1,
                  acquisition: str = 'ei',
                  alleviate_budget: bool = False,
+                 evaluator: Optional[EvaluationEngine] = None,
+                 batch_size: int = 1,
+                 asynchronous: bool = False,
+                 early_termination: bool = False,
+                 racing: bool = False,
+                 fidelities: Optional[list[str]] = None,
+                 refit_every: int = SURROGATE_PARAM["refit_every"],
+                 candidate_latency_budget: Optional[float] = CANDIDATE_PARAM["latency_budget"],
                  ):
     
         self.benchmark = benchmark
+        # If given, configurations are benchmarked in parallel on the clusters of the evaluator.
+        # With batch_size > 1, batch_size configurations are proposed per GP fit, which keeps several clusters busy.
+        self.evaluator = evaluator
+        # If True, a new configuration is proposed as soon as any evaluation finishes, see `_run_asynchronous`.
+        self.asynchronous = asynchronous
+        assert not self.asynchronous or self.evaluator is not None, "The asynchronous mode needs an evaluator"
+        # If True, runs longer than a multiple of the incumbent duration are killed and recorded as censored.
+        self.early_termination = early_termination
+        # If True, the repetitions of a configuration stop once it is clearly worse than the incumbent,
+        # see `_should_stop_repeating`. The skipped repetitions are NaN in fx_repeated.
+        self.racing = racing
         self.noise_threshold = noise_threshold
         self.acquisition = acquisition
-        self.effective = True if self.acquisition == 'aei' else False
+        self.effective = True if self.acquisition in ('aei', 'logaei', 'qaei') else False
         self.alleviate_budget = alleviate_budget
 
         self.device = torch.device("cpu")
@@ -60,8 +97,12 @@ class NSBO(Bounce):
                          number_initial_points=n_init,
                          maximum_number_evaluations=max_eval,
                          maximum_number_evaluations_until_input_dim=max_eval_until_input,
-                         results_dir=results_dir
+                         batch_size=batch_size,
+                         results_dir=results_dir,
+                         n_interleaved=CANDIDATE_PARAM["max_interleaved_steps"],
                          )
+        # If set, the interleaved rounds of a proposal stop early once the proposal does not move anymore
+        self.interleave_tolerance = CANDIDATE_PARAM["interleave_tolerance"]
         
         f = open(os.path.join(self.results_dir, 'workload.txt'), 'w')
         f.writelines(f"{self.benchmark.env.workload} {self.benchmark.env.workload_size}")
@@ -71,6 +112,32 @@ class NSBO(Bounce):
         self.x_repeated = torch.empty(
             0, self.benchmark.representation_dim, dtype=self.dtype, device=self.device
         )
+        # Whether the function value of each point in the trust region is censored, i.e., only a lower bound
+        self.censored_tr = torch.empty(0, dtype=torch.bool)
+        # Whether the evaluation of each point in the trust region failed, e.g., the configuration crashed the cluster
+        self.failed_tr = torch.empty(0, dtype=torch.bool)
+
+        # Multi-fidelity: the HiBench workload sizes from the cheapest to the target size. Proposals are screened on the
+        # cheapest size and promoted size by size, see `_evaluate_multi_fidelity`.
+        self.fidelities = fidelities
+        if self.fidelities is not None:
+            assert len(self.fidelities) > 1, "Define at least one size below the target size"
+            assert self.fidelities[-1] == self.benchmark.env.workload_size, "The last fidelity must be the target size"
+            assert hasattr(self.benchmark.env, "set_workload_size"), "The environment has no workload sizes"
+            assert not self.asynchronous, "The asynchronous mode does not support multi-fidelity yet"
+        # The fidelity of each point in the trust region, in [0, 1] where 1 is the target size
+        self.fidelity_tr = torch.empty(0, dtype=self.dtype)
+
+        # Keeps the GP between iterations and fits its hyperparameters only every refit_every iterations
+        self.surrogate = SurrogateManager(refit_every=refit_every)
+        # Optimizes the acquisition function over the continuous parameters, see CANDIDATE_PARAM
+        self.acquisition_optimizer = AcquisitionOptimizer()
+        # The posterior at the observations, shared by the interleaved steps and the trust region update of an iteration
+        self.posterior_cache = PosteriorCache()
+        # Sizes the pool of discrete candidates to the latency budget of a proposal, split over the interleaved steps
+        self.candidate_pool = CandidatePool(
+            latency_budget=None if candidate_latency_budget is None else candidate_latency_budget / self.n_interleaved
+        )
 
     def _split_budget(self, target_dimensionality: int) -> int:
         """
@@ -121,12 +188,7 @@ class NSBO(Bounce):
         for parameter_type in self.benchmark.unique_parameter_types:
             # find number of parameters of type parameter_type
             bins_of_type: list[Bin] = self.random_embedding.bins_of_type(parameter_type)
-            indices_of_type = torch.concat(
-                [
-                    self.random_embedding.bins_and_indices_of_type(parameter_type)[i][1]
-                    for i in range(len(bins_of_type))
-                ]
-            ).to(self.device)
+            indices_of_type = self.random_embedding.indices_of_type(parameter_type).to(self.device)
             match parameter_type:
                 case ParameterType.BINARY:
                     _x_init = sample_binary(
@@ -211,13 +273,24 @@ class NSBO(Bounce):
         fx_inits = torch.Tensor()
         
         logging.info("🎁#🎁#🎁#🎁 Start Sampling 🎁#🎁#🎁#🎁")
-        for _ in range(x_init_up.size(0)): # x_init_up: [n_init, num_params]
-            logging.info(f"[Sampling Iteration: {_}]")
-            _fx = self.benchmark(x_init_up[_].unsqueeze(0), repeat=BENCHMARKING_REPETITION)
-            
-            fx_inits = torch.concat([fx_inits, _fx])
+        if self.evaluator is not None:
+            logging.info(f"[Sampling {x_init_up.size(0)} points on {self.evaluator.n_workers} clusters]")
+            futures = self.evaluator.map(x_init_up, repeat=BENCHMARKING_REPETITION, stop_rule=self._stop_rule)
+            fx_inits = torch.concat([future.result() for future in futures])
+            censored_init, failed_init = [torch.concat(m) for m in zip(*[self._last_masks(future) for future in futures])]
+        else:
+            censored_init = torch.empty(0, dtype=torch.bool)
+            failed_init = torch.empty(0, dtype=torch.bool)
+            for _ in range(x_init_up.size(0)): # x_init_up: [n_init, num_params]
+                logging.info(f"[Sampling Iteration: {_}]")
+                _fx = self.benchmark(x_init_up[_].unsqueeze(0), repeat=BENCHMARKING_REPETITION, stop_rule=self._stop_rule)
+                
+                fx_inits = torch.concat([fx_inits, _fx])
+                _censored, _failed = self._last_masks(self.benchmark)
+                censored_init = torch.concat([censored_init, _censored])
+                failed_init = torch.concat([failed_init, _failed])
         
-        fx_init = fx_inits.mean(1)
+        fx_init = fx_inits.nanmean(1)
         
         self._add_data_to_tr_observations(
             xs_down=x_init, # [n, target_dim] target configs converted from original configs
@@ -225,9 +298,12 @@ class NSBO(Bounce):
             fxs=fx_init,
             repeated_fxs=fx_inits,
             repeated_xs_down=unique_x_init,
+            censored=censored_init,
+            failed=failed_init,
         )
         
         self._n_evals += self.number_initial_points
+        self._update_cutoff()
         logging.info("🎁#🎁#🎁#🎁 Finished Sampling 🎁#🎁#🎁#🎁")
         
     def run(self):
@@ -238,156 +314,60 @@ class NSBO(Bounce):
             None
 
         """
-        self.sample_init()
+        if self._n_evals == 0:
+            # Not resumed from a checkpoint
+            self.sample_init()
+            self.save_checkpoint()
+
+        if self.asynchronous:
+            model = self._run_asynchronous()
+        else:
+            model = self._run_synchronous()
+        if model is None:
+            # Resumed after the budget was used up, e.g., the run crashed while evaluating the best solution
+            model = self._fit_gp()[0]
+
+        # with lzma.open(os.path.join(self.results_dir, f"fx_best_from_mean.csv.xz"), "a") as f:
+        #     np.savetxt(f, fx_best_stack, delimiter=",")
+
+        # self.benchmark.env.calculate_improvement_from_default(best_fx=best_fx)
         
-        while self._n_evals <= self.maximum_number_evaluations:
-            axus = self.random_embedding
-            
-            x = self.x_tr
-            fx = self.fx_tr
-            
-            # Preprocessing failed data #######################
-            fx_ = fx[fx != torch.tensor(10000)]
-            std_ = torch.std(fx_)
-            
-            fx[fx==torch.tensor(10000)] = fx_.max() + std_
-            
-            fx_ = fx[fx != torch.tensor(0)]
-            std_ = torch.std(fx_)
-            
-            fx[fx==torch.tensor(0)] = fx_.min() + std_
-            ####################################################          
+        self.get_best_solution(model=model)        
 
-            # normalize data
-            mean = torch.mean(fx)
-            std = torch.std(fx)
-            if std == 0:
-                std += 1
-            fx_scaled = (fx - mean) / std
-            
-            x_scaled = (x + 1) / 2
+    def _run_synchronous(self):
+        """
+        Runs the optimization loop, proposing and benchmarking batch_size configurations per iteration.
 
-            if self.device == "cuda":
-                x_scaled = x_scaled.to(self.device)
-                fx_scaled = fx_scaled.to(self.device)
-                # fx_var_scaled = fx_var_scaled.to(self.device)
+        Returns:
+            the last fitted GP model, None if the budget was already used up
 
-            # Select the kernel
-            model, train_x, train_fx = get_gp(
-                axus=axus,
-                x=x_scaled,
-                fx=-fx_scaled,
-                noise=self.effective,
-            )
-            model = model.to(self.device)
-            
-            use_scipy_lbfgs = self.use_scipy_lbfgs and (
-                self.max_lbfgs_iters is None or len(train_x) <= self.max_lbfgs_iters
-            )
-            fit_mll(
-                model=model,
-                train_x=train_x,
-                train_fx=-train_fx,
-                max_cholesky_size=self.max_cholesky_size,
-                use_scipy_lbfgs=use_scipy_lbfgs,
-            )
-            acquisition_function = None
-            sampler = None
-
-            if self.batch_size > 1:
-                # we don't set the acquisition function here, because it needs to be redefined
-                # for each batch item to be able to condition on the earlier batch items
-                # note that this is the only place where we don't use the acquisition function
-                sampler = SobolQMCNormalSampler(Size([1024]), seed=RANDOM_SEED)
-            else:
-                # use analytical EI for batch size 1
-                # acquisition_function = ExpectedImprovement(
-                #     model=model, best_f=(-fx_scaled).max().item()
-                # )
-                if self.acquisition == 'ei':
-                    acquisition_function = ExpectedImprovement(
-                        model=model, best_f=(-fx_scaled).max().item()
-                    )
-                elif self.acquisition == 'aei':
-                    acquisition_function = AugmentedExpectedImprovement(
-                        model=model, 
-                        best_f=get_best_fx(model, x_scaled, effective=True).item(),
-                    )
+        """
+        model = None
+        while self._n_evals <= self.maximum_number_evaluations:
+            model, x_scaled, fx_scaled, mean, std = self._fit_gp()
 
-            continuous_type = axus.bins_and_indices_of_type(ParameterType.CONTINUOUS) + \
-                                axus.bins_and_indices_of_type(ParameterType.NUMERICAL) 
-            continuous_indices = torch.tensor([ i for ( _, i ) in continuous_type])
+            # The last iteration may propose fewer points than batch_size to stay within the budget
+            batch_size = max(1, min(self.batch_size, self.maximum_number_evaluations - self._n_evals))
 
-            #########################################
-            x_best = None
-            for _ in tqdm(range(self.n_interleaved), desc="☯ Interleaved steps"):
-                x_best, fx_best, tr_state = create_candidates_discrete(
-                    x_scaled=x_scaled,
-                    fx_scaled=fx_scaled,
-                    axus=axus,
-                    model=model,
-                    trust_region=self.trust_region,
-                    device=self.device,
-                    batch_size=self.batch_size,
-                    x_bests=x_best,  # expects [-1, 1],
-                    acquisition_function=acquisition_function,
-                    sampler=sampler,
-                    effective=self.effective,
-                )
-                x_best = x_best.reshape(-1, axus.target_dim)
-                
-                true_center = get_best_x(
-                    model=model,
-                    xs=x_scaled,
-                    fxs=fx_scaled,
-                    noisy=True,
-                    effective=self.effective,
-                    )
-                    
-                x_best[:, continuous_indices] = true_center[continuous_indices].to(
-                    device=x_best.device
-                )
-                x_best, fx_best, tr_state = create_candidates_continuous(
-                    x_scaled=x_scaled,
-                    fx_scaled=fx_scaled,
-                    axus=axus,
-                    trust_region=self.trust_region,
-                    device=self.device,
-                    indices_to_optimize=continuous_indices,
-                    x_bests=x_best,  # expects [-1, 1]
-                    acquisition_function=acquisition_function,
-                    model=model,
-                    batch_size=self.batch_size,
-                    sampler=sampler,
-                    effective=self.effective,
-                )
-                fx_best = fx_best * std + mean
-                x_best = x_best.reshape(-1, axus.target_dim)
-            x_best = x_best
-
-            # get the GP hyperparameters as a dictionary
-            # if self.noise_free:
-            #     pass
-            # else:
-            #     logging.info("🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳🍳")
-            #     fx_best_stack = torch.vstack((fx_best_stack, fx_best))
-            #     tr_state['center_posterior_mean_fx'] = fx_best_stack
-            #     fx_best_clone = fx_best.clone()
-            
-            # self.save_tr_state(tr_state)
-            minimum_xs = x_best.detach().cpu()
-            minimum_fxs = fx_best.detach().cpu()
+            minimum_xs, minimum_fxs, tr_state = self._propose_batch(
+                model=model,
+                x_scaled=x_scaled,
+                fx_scaled=fx_scaled,
+                batch_size=batch_size,
+            )
+            minimum_xs = minimum_xs.detach().cpu()
+            minimum_fxs = minimum_fxs.detach().cpu() * std + mean
 
             fx_batches = minimum_fxs
 
             cand_batch = torch.empty(
-                (self.batch_size, self.benchmark.representation_dim), dtype=self.dtype
+                (batch_size, self.benchmark.representation_dim), dtype=self.dtype
             )
 
             xs_low_dim = list()
             xs_high_dim = list()
 
-            for batch_index in range(self.batch_size):
+            for batch_index in range(batch_size):
                 # Find the row (tr index) and column (batch index) of the minimum
                 col = torch.where(fx_batches == fx_batches.min())[0]
                 # Find the point that gave the minimum
@@ -412,171 +392,880 @@ class NSBO(Bounce):
                 fx_batches[col[0]] = torch.inf
 
             # Sample on the candidate points
-            y_nexts = None
-            unique_x_init = None
-
-            # elif self.noise_mode == n['NOISE_MEAN']:
-            # _fx = self.benchmark(x_init_up[_].unsqueeze(0), repeat=BENCHMARKING_REPETITION)
-            y_nexts = self.benchmark(cand_batch.unsqueeze(0), repeat=BENCHMARKING_REPETITION)
-            # y_nexts = torch.concat([ 
-            #     self.benchmark(cand_batch.unsqueeze(0), load=False if r > 0 else True).unsqueeze(1) 
-            #     for r in range(BENCHMARKING_REPETITION)], 
-            #                     dim=1).to(self.device)
-            # y_nexts = torch.concat([self.benchmark(cand_batch).unsqueeze(1) for _ in range(BENCHMARKING_REPETITION)], dim=1)
-            # y_nexts = torch.concat(y_nexts, dim=1)
-            y_next = y_nexts.mean(1)
-            
-            model.eval()
-            model.likelihood.eval()
-            
-            min_y_next = torch.min(-model.posterior(torch.vstack(xs_low_dim)).mean * std + mean).to(self.device) # [1, 1]
-            
-            pred_fx_by_gp = -model.posterior(x_scaled).mean * std + mean
-            best_idx = pred_fx_by_gp.argmin()
-            
-            best_pred_fx_by_gp = pred_fx_by_gp[best_idx]
-            best_real_fxs = self.fx_repeated[best_idx]
-                        
-            tr_state['best_fx_from_poster_mean'] = best_real_fxs.unsqueeze(0) if best_real_fxs.dim() == 1 else best_real_fxs
-            best_fx = best_pred_fx_by_gp
+            fidelity = None
+            if self.fidelities is None:
+                y_nexts, censored, failed = self._evaluate_batch(cand_batch)
+            else:
+                xs_low_dim, xs_high_dim, y_nexts, censored, failed, fidelity = self._evaluate_multi_fidelity(
+                    xs_low_dim=xs_low_dim,
+                    xs_high_dim=xs_high_dim,
+                )
 
-            if min_y_next < best_fx:
-                logging.info(
-                    # f"✨ Iteration {self._n_evals}: {BColors.OKGREEN}New incumbent function value {y_next.min().item():.3f}{BColors.ENDC}"
-                    f"[✨ Iteration {self._n_evals}] New incumbent function value {min_y_next.item():.3f}{BColors.ENDC} with {best_real_fxs}"
+            self._tell(
+                model=model,
+                x_scaled=x_scaled,
+                xs_low_dim=xs_low_dim,
+                xs_high_dim=xs_high_dim,
+                y_nexts=y_nexts,
+                tr_state=tr_state,
+                mean=mean,
+                std=std,
+                censored=censored,
+                failed=failed,
+                fidelity=fidelity,
+            )
+
+        return model
+
+    def _run_asynchronous(self):
+        """
+        Runs the optimization loop asynchronously on the clusters of the evaluator.
+
+        Every idle cluster gets a configuration right away. Whenever an evaluation finishes, its result is added to the
+        observations, the GP is refit on all completed evaluations, and a new configuration is proposed for the idle
+        cluster. The configurations that are still running are fantasized with the Kriging believer heuristic, so they
+        are not proposed again and the new configuration is placed away from them. Fast configurations therefore never
+        wait for slow ones to finish.
+
+        Returns:
+            the GP model fitted on all evaluations
+
+        """
+        # future -> (x in the target space, x in the representation space, trust region state of the proposal)
+        pending = dict()
+        n_submitted = self._n_evals
+
+        model, x_scaled, fx_scaled, mean, std = self._fit_gp()
+        while True:
+            # Same budget as in the synchronous loop, which runs while _n_evals <= maximum_number_evaluations
+            n_new = min(
+                self.evaluator.n_workers - len(pending),
+                self.maximum_number_evaluations + 1 - n_submitted,
+            )
+            if n_new > 0:
+                x_pending = torch.vstack([x for x, _, _ in pending.values()]) if pending else None
+                xs_down, _, tr_state = self._propose_batch(
+                    model=model,
+                    x_scaled=x_scaled,
+                    fx_scaled=fx_scaled,
+                    batch_size=n_new,
+                    x_pending=x_pending,
                 )
-            else:
-                logging.info(
-                    f"[🚀 Iteration {self._n_evals}] No improvement. Best function value {best_fx.item():.3f} with {best_real_fxs}"
+                for x_down in xs_down.detach().cpu():
+                    x_down = x_down.unsqueeze(0)
+                    x_up = from_1_around_origin(
+                        self.random_embedding.project_up(x_down.T).T,
+                        lb=self.benchmark.lb_vec,
+                        ub=self.benchmark.ub_vec,
+                    )
+                    future = self.evaluator.submit(x_up, repeat=BENCHMARKING_REPETITION, stop_rule=self._stop_rule)
+                    pending[future] = (x_down, x_up, tr_state)
+                n_submitted += n_new
+                logging.info(f"⏳ {len(pending)} configurations are running, {n_submitted} submitted so far")
+
+            if len(pending) == 0:
+                break
+
+            done, _ = wait_first(list(pending))
+            for future in done:
+                x_down, x_up, tr_state = pending.pop(future)
+                censored, failed = self._last_masks(future)
+                index_mapping = self._tell(
+                    model=model,
+                    x_scaled=x_scaled,
+                    xs_low_dim=[x_down],
+                    xs_high_dim=[x_up],
+                    y_nexts=future.result(),
+                    tr_state=tr_state,
+                    mean=mean,
+                    std=std,
+                    censored=censored,
+                    failed=failed,
                 )
-                
-            self.save_tr_state(tr_state)    
+                if index_mapping is not None:
+                    # move the running configurations to the new embedding as well
+                    pending = {
+                        f: (join_data(x, index_mapping), x_up_, tr_state_)
+                        for f, (x, x_up_, tr_state_) in pending.items()
+                    }
+                    model, x_scaled, fx_scaled, mean, std = self._fit_gp()
+            model, x_scaled, fx_scaled, mean, std = self._fit_gp()
+
+        return model
+
+    def _fit_gp(self):
+        """
+        Fit the GP on the observations in the trust region.
+
+        Returns:
+            the fitted GP model, the scaled points and function values it was fitted on, and the mean and standard
+            deviation used to standardize the function values
+
+        """
+        axus = self.random_embedding
+        # a new iteration, the posteriors of the previous model are not needed anymore
+        self.posterior_cache.clear()
+        
+        x = self.x_tr
+        fx = self.fx_tr.clone()
+        
+        # Failed runs have no meaningful value, they are known to be at least as bad as the worst finished run.
+        # Together with the runs terminated early, they are modeled as censored observations by the GP.
+        censored = self.censored_tr | self.failed_tr
+        if (~censored).any():
+            fx[self.failed_tr] = fx[~censored].max()
+
+        x_scaled = (x + 1) / 2
+
+        # Between two full fits, the new observations are added to the previous GP (multi-fidelity: always refit)
+        incremental = self.fidelities is None and not self.surrogate.needs_refit(x_scaled)
+
+        # normalize data
+        if incremental:
+            # the standardization is frozen until the next full fit
+            mean, std = self.surrogate.mean, self.surrogate.std
+            fx_scaled = (fx - mean) / std
+        elif self.fidelities is None:
+            mean = torch.mean(fx)
+            std = torch.std(fx)
+            if std == 0:
+                std += 1
+            fx_scaled = (fx - mean) / std
+        else:
+            # Each workload size has its own scale, the mean and std of the target size are returned
+            fx_scaled = torch.empty_like(fx)
+            for value in self.fidelity_tr.unique():
+                group = self.fidelity_tr == value
+                mean = torch.mean(fx[group])
+                std = torch.std(fx[group]) if group.sum() > 1 else torch.ones_like(mean)
+                if not std > 0:
+                    std = torch.ones_like(mean)
+                fx_scaled[group] = (fx[group] - mean) / std
+            target = self.fidelity_tr == 1
+            mean = torch.mean(fx[target])
+            std = torch.std(fx[target]) if target.sum() > 1 else torch.ones_like(mean)
+            if not std > 0:
+                std = torch.ones_like(mean)
+
+        if self.device == "cuda":
+            x_scaled = x_scaled.to(self.device)
+            fx_scaled = fx_scaled.to(self.device)
+            # fx_var_scaled = fx_var_scaled.to(self.device)
+
+        if incremental:
+            model = self.surrogate.update(x=x_scaled, fx=-fx_scaled, censored=censored)
+            return model, x_scaled, fx_scaled, mean, std
+
+        # Select the kernel
+        model, train_x, train_fx = get_gp(
+            axus=axus,
+            x=x_scaled if self.fidelities is None else torch.hstack(
+                (x_scaled, self.fidelity_tr.unsqueeze(1).to(x_scaled))
+            ),
+            fx=-fx_scaled,
+            noise=self.effective,
+            censored=censored,
+            target_fidelity=None if self.fidelities is None else 1.0,
+            # the censored values are imputed with the hyperparameters of the last fit instead of fitting another GP
+            hyperparameters=self.surrogate.hyperparameters,
+        )
+        model = model.to(self.device)
+        self.surrogate.warm_start(model)
+        
+        use_scipy_lbfgs = self.use_scipy_lbfgs and (
+            self.max_lbfgs_iters is None or len(train_x) <= self.max_lbfgs_iters
+        )
+        fit_mll(
+            model=model,
+            train_x=train_x,
+            train_fx=-train_fx,
+            max_cholesky_size=self.max_cholesky_size,
+            use_scipy_lbfgs=use_scipy_lbfgs,
+        )
+        self.surrogate.record(model=model, x=train_x, mean=mean, std=std)
+        return model, x_scaled, fx_scaled, mean, std
+
+    def _tell(
+        self,
+        model,
+        x_scaled: torch.Tensor,
+        xs_low_dim: list[torch.Tensor],
+        xs_high_dim: list[torch.Tensor],
+        y_nexts: torch.Tensor,
+        tr_state: dict,
+        mean: torch.Tensor,
+        std: torch.Tensor,
+        censored: Optional[torch.Tensor] = None,
+        failed: Optional[torch.Tensor] = None,
+        fidelity: Optional[torch.Tensor] = None,
+    ) -> Optional[torch.Tensor]:
+        """
+        Add the evaluated points to the observations, adjust the trust region, and split it if it terminated.
+
+        Args:
+            model: the GP model the points were proposed with
+            x_scaled: the scaled points the model was fitted on
+            xs_low_dim: the evaluated points in the target space
+            xs_high_dim: the evaluated points in the representation space
+            y_nexts: the repeated function values of the points, shape (n, BENCHMARKING_REPETITION)
+            tr_state: the trust region state of the proposal
+            mean: the mean used to standardize the function values
+            std: the standard deviation used to standardize the function values
+            censored: whether the function values of the points are censored by early termination, shape (n,)
+            failed: whether the evaluations of the points failed, shape (n,)
+            fidelity: the fidelities the points were evaluated at, shape (n,), the target fidelity if None
+
+        Returns:
+            the index mapping of the split if the trust region was split, otherwise None
+
+        """
+        # In the multi-fidelity mode, a point may be evaluated at several fidelities but is screened exactly once. The
+        # trust region adapts once per proposed point, the budget counts the evaluations at the target size only.
+        batch_size = len(xs_low_dim) if fidelity is None else int((fidelity == 0).sum())
+        n_evals = len(xs_low_dim) if fidelity is None else int((fidelity == 1).sum())
+        y_next = y_nexts.nanmean(1)
+        unique_x_init = None
+        index_mapping = None
+
+        model.eval()
+        model.likelihood.eval()
+        
+        min_y_next = torch.min(-model.posterior(torch.vstack(xs_low_dim)).mean * std + mean).to(self.device) # [1, 1]
+        
+        pred_fx_by_gp = -self.posterior_cache.mean_and_sigma(model, x_scaled)[0] * std + mean
+        best_idx = pred_fx_by_gp.argmin()
+        
+        best_pred_fx_by_gp = pred_fx_by_gp[best_idx]
+        best_real_fxs = self.fx_repeated[best_idx]
+                    
+        tr_state['best_fx_from_poster_mean'] = best_real_fxs.unsqueeze(0) if best_real_fxs.dim() == 1 else best_real_fxs
+        best_fx = best_pred_fx_by_gp
+
+        if min_y_next < best_fx:
+            logging.info(
+                # f"✨ Iteration {self._n_evals}: {BColors.OKGREEN}New incumbent function value {y_next.min().item():.3f}{BColors.ENDC}"
+                f"[✨ Iteration {self._n_evals}] New incumbent function value {min_y_next.item():.3f}{BColors.ENDC} with {best_real_fxs}"
+            )
+        else:
+            logging.info(
+                f"[🚀 Iteration {self._n_evals}] No improvement. Best function value {best_fx.item():.3f} with {best_real_fxs}"
+            )
             
-            # if torch.min(y_next) < best_fx:
+        self.save_tr_state(tr_state)    
+        
+        # if torch.min(y_next) < best_fx:
+
+        
+        # Calculate the estimated trust region dimensionality
+        tr_dim = self._forecasted_tr_dim
+        # Number of times this trust region has been selected
+        # Remaining budget for this trust region
+        remaining_budget = self._all_split_budgets[tr_dim]
+        remaining_budget = min(
+            remaining_budget, self.maximum_number_evaluations - self._n_evals
+        )
+        remaining_budget = max(remaining_budget, 1)
+        tr = self.trust_region
+        factor = (tr.length_min_discrete / tr.length_discrete_continuous) ** (
+            1 / remaining_budget
+        )
+        factor **= batch_size
+        factor = np.clip(factor, a_min=1e-10, a_max=None)
+        logging.info(
+            f"🔎 Adjusting trust region by factor {factor.item():.3f}. Remaining budget: {remaining_budget}"
+        )
+        update_tr_state(
+            trust_region=self.trust_region,
+            # fx_next=y_next.min(),
+            # fx_incumbent=self.fx_tr.min(),
+            fx_next=min_y_next,
+            fx_incumbent=best_fx,
+            adjustment_factor=factor,
+        )
+
+        logging.info(
+            f"📏 Trust region has length {tr.length_discrete_continuous:.3f} and minium l {tr.length_min_discrete:.3f}"
+        )
+
+        self._all_split_budgets[tr_dim] = (
+            self._all_split_budgets[tr_dim] - n_evals
+        )
+        self._n_evals += n_evals
+
+        
+        self._add_data_to_tr_observations(
+            xs_down=torch.vstack(xs_low_dim), # if self.noise_mode > 1 else torch.vstack(xs_low_dim).repeat(BENCHMARKING_REPETITION, 1),
+            xs_up=torch.vstack(xs_high_dim), # if self.noise_mode > 1 else torch.vstack(xs_high_dim).repeat(BENCHMARKING_REPETITION, 1),
+            fxs=y_next.reshape(-1), # self.fx_tr
+            repeated_fxs=y_nexts,
+            repeated_xs_down=unique_x_init,
+            censored=censored,
+            failed=failed,
+            fidelity=fidelity,
+        )
+        self._update_cutoff()
 
+        # Splitting trust regions that terminated
+        if self.trust_region.terminated:
+            if self.random_embedding.target_dim < self.benchmark.representation_dim:
+                # Full dim is not reached yet
+                logging.info(f"✂️ Splitting trust region")
             
-            # Calculate the estimated trust region dimensionality
-            tr_dim = self._forecasted_tr_dim
-            # Number of times this trust region has been selected
-            # Remaining budget for this trust region
-            remaining_budget = self._all_split_budgets[tr_dim]
-            remaining_budget = min(
-                remaining_budget, self.maximum_number_evaluations - self._n_evals
+                index_mapping = self.random_embedding.split(
+                    self.number_new_bins_on_split
+                )
+
+                # move data to higher-dimensional space
+                self.x_tr = join_data(self.x_tr, index_mapping)
+                self.x_global = join_data(self.x_global, index_mapping)
+                self.x_tr_index = PointIndex((self.x_tr + 1) / 2)
+                
+                self.trust_region = TrustRegion(
+                    dimensionality=self.random_embedding.target_dim
+                )
+                # The GP of the previous embedding cannot be updated
+                self.surrogate.invalidate()
+                if self.tr_splits < self._n_splits:
+                    self.tr_splits += 1
+
+                self.split_budget = self._split_budget(
+                    self.initial_target_dimensionality
+                    * (self.number_new_bins_on_split + 1) ** self.tr_splits
+                )
+            else:
+                # Full dim is reached
+                logging.info("🏁 Finished")
+                # logging.info(
+                #     f"🏁 Reached full dimensionality. Restarting with new random samples."
+                # )
+                # self.split_budget = self._split_budget(
+                #     self.random_embedding.input_dim
+                # )
+                # # Reset the last split budget
+                # self._all_split_budgets[self._forecasted_tr_dim] = self.split_budget
+
+                # # empty tr data, does not delete the global data
+                # self._reset_local_data()
+
+                # # reset the trust region
+                # self.trust_region.reset()
+
+                # self.sample_init()
+        self.save_checkpoint()
+        return index_mapping
+
+        
+    # The GP is refit after resuming instead, the logs are opened again in the results directory
+    _checkpoint_exclude = Bounce._checkpoint_exclude + ("surrogate", "posterior_cache", "_repeated_results_log")
+
+    def _open_logs(self):
+        """
+        Open the logs in the results directory, see `Bounce._open_logs`, and the log of the repeated results.
+
+        Returns:
+            None
+
+        """
+        super()._open_logs()
+        self._repeated_results_log = ResultsLog(
+            os.path.join(self.results_dir, "repeated_results"), n_columns=BENCHMARKING_REPETITION
+        )
+
+    def load_checkpoint(self, results_dir: str):
+        """
+        Restore the state of the optimizer from the checkpoint in results_dir, see `Bounce.load_checkpoint`.
+        Configurations that were still running when the checkpoint was written are proposed again.
+
+        Args:
+            results_dir: the results directory of the run to resume
+
+        Returns:
+            None
+
+        """
+        super().load_checkpoint(results_dir)
+        assert not self.asynchronous or self.evaluator is not None, "The asynchronous mode needs an evaluator"
+        if self.fx_repeated is not None:
+            # the screenings at smaller workload sizes are not logged
+            self._repeated_results_log.truncate(int((self.fidelity_tr == 1).sum()))
+        # The cutoff lives in the environments, which are not part of the checkpoint
+        self._update_cutoff()
+
+    def _get_acquisition_function(self, model, x_scaled: torch.Tensor, fx_scaled: torch.Tensor):
+        """
+        Define the acquisition function given by `self.acquisition`.
+
+        Args:
+            model: the fitted GP model
+            x_scaled: the observed points, in [0, 1]^d
+            fx_scaled: the standardized function values of the observed points
+
+        Returns:
+            the acquisition function
+
+        """
+        if self.acquisition == 'ei':
+            if self.fidelities is not None:
+                # the incumbent is taken at the target size, the smaller sizes are standardized on their own scale
+                fx_scaled = fx_scaled[self.fidelity_tr.to(fx_scaled.device) == 1]
+            return ExpectedImprovement(
+                model=model, best_f=(-fx_scaled).max().item()
             )
-            remaining_budget = max(remaining_budget, 1)
-            tr = self.trust_region
-            factor = (tr.length_min_discrete / tr.length_discrete_continuous) ** (
-                1 / remaining_budget
+        elif self.acquisition == 'aei':
+            return AugmentedExpectedImprovement(
+                model=model, 
+                best_f=get_best_fx(model, x_scaled, effective=True, posterior_cache=self.posterior_cache).item(),
             )
-            factor **= self.batch_size
-            factor = np.clip(factor, a_min=1e-10, a_max=None)
-            logging.info(
-                f"🔎 Adjusting trust region by factor {factor.item():.3f}. Remaining budget: {remaining_budget}"
+        elif self.acquisition == 'logaei':
+            # AEI in log space, which does not vanish far from the incumbent
+            return LogAugmentedExpectedImprovement(
+                model=model,
+                best_f=get_best_fx(model, x_scaled, effective=True, posterior_cache=self.posterior_cache).item(),
             )
-            update_tr_state(
+        elif self.acquisition == 'qaei':
+            # Monte-Carlo AEI, scores a point jointly with the pending points of the batch (see `_propose_batch`)
+            return qAugmentedExpectedImprovement(
+                model=model,
+                best_f=get_best_fx(model, x_scaled, effective=True, posterior_cache=self.posterior_cache).item(),
+            )
+        else:
+            assert False, f"The acquisition function {self.acquisition} is not defined.. Choose in [ei, aei, logaei, qaei]"
+
+    def _propose(
+        self,
+        model,
+        acquisition_function,
+        x_scaled: torch.Tensor,
+        fx_scaled: torch.Tensor,
+        x_pending: Optional[torch.Tensor] = None,
+    ) -> tuple[torch.Tensor, torch.Tensor, dict]:
+        """
+        Propose one point by optimizing the discrete and the continuous parameters in interleaved steps.
+
+        Args:
+            model: the GP model
+            acquisition_function: the acquisition function to optimize
+            x_scaled: the observed points, in [0, 1]^d
+            fx_scaled: the standardized function values of the observed points
+            x_pending: the points that are proposed but not evaluated yet, in [0, 1]^d
+
+        Returns:
+            the proposed point in [-1, 1]^d with shape (1, d), its acquisition value, and the trust region state
+
+        """
+        axus = self.random_embedding
+        continuous_indices = axus.continuous_indices
+        # the interleaved steps of this proposal share the raw samples of the continuous optimization
+        self.acquisition_optimizer.reset()
+
+        x_best = None
+        x_previous = None
+        n_rounds = 0
+        for _ in tqdm(range(self.n_interleaved), desc="☯ Interleaved steps"):
+            n_rounds += 1
+            x_best, fx_best, tr_state = create_candidates_discrete(
+                x_scaled=x_scaled,
+                fx_scaled=fx_scaled,
+                axus=axus,
+                model=model,
                 trust_region=self.trust_region,
-                # fx_next=y_next.min(),
-                # fx_incumbent=self.fx_tr.min(),
-                fx_next=min_y_next,
-                fx_incumbent=best_fx,
-                adjustment_factor=factor,
+                device=self.device,
+                batch_size=1,
+                x_bests=x_best,  # expects [-1, 1],
+                acquisition_function=acquisition_function,
+                effective=self.effective,
+                x_pending=x_pending,
+                x_index=self.x_tr_index,
+                candidate_pool=self.candidate_pool,
+                posterior_cache=self.posterior_cache,
+            )
+            x_best = x_best.reshape(-1, axus.target_dim)
+            
+            true_center = get_best_x(
+                model=model,
+                xs=x_scaled,
+                fxs=fx_scaled,
+                noisy=True,
+                effective=self.effective,
+                posterior_cache=self.posterior_cache,
+                )
+                
+            x_best[:, continuous_indices] = true_center[continuous_indices].to(
+                device=x_best.device
             )
+            x_best, fx_best, tr_state = create_candidates_continuous(
+                x_scaled=x_scaled,
+                fx_scaled=fx_scaled,
+                axus=axus,
+                trust_region=self.trust_region,
+                device=self.device,
+                indices_to_optimize=continuous_indices,
+                x_bests=x_best,  # expects [-1, 1]
+                acquisition_function=acquisition_function,
+                model=model,
+                batch_size=1,
+                effective=self.effective,
+                posterior_cache=self.posterior_cache,
+                acquisition_optimizer=self.acquisition_optimizer,
+            )
+            x_best = x_best.reshape(-1, axus.target_dim)
+            if x_previous is not None and self._interleaving_converged(x_previous, x_best):
+                break
+            x_previous = x_best.clone()
+        logging.info(f"☯ Interleaving took {n_rounds}/{self.n_interleaved} rounds")
+        timings = self.acquisition_optimizer.timings
+        logging.info(
+            f"⏱ Continuous acquisition optimization took {sum(t['scoring'] + t['optimizing'] for t in timings):.2f}s "
+            f"in {len(timings)} steps"
+        )
+        return x_best, fx_best, tr_state
 
-            logging.info(
-                f"📏 Trust region has length {tr.length_discrete_continuous:.3f} and minium l {tr.length_min_discrete:.3f}"
+    def _interleaving_converged(self, x_previous: torch.Tensor, x_best: torch.Tensor) -> bool:
+        """
+        Whether another round of discrete and continuous optimization would not change the proposal, i.e., the last
+        round kept the discrete parameters and moved the continuous parameters by at most `interleave_tolerance`. Without
+        a tolerance (None or 0), all `n_interleaved` rounds are run.
+
+        Args:
+            x_previous: the proposal of the previous round, in [-1, 1]^d
+            x_best: the proposal of the last round, in [-1, 1]^d
+
+        Returns:
+            whether the rounds can stop
+
+        """
+        if not self.interleave_tolerance:
+            return False
+        axus = self.random_embedding
+        discrete_indices = axus.discrete_indices.to(device=x_best.device)
+        continuous_indices = axus.continuous_indices.to(device=x_best.device)
+        if not torch.equal(x_previous[:, discrete_indices], x_best[:, discrete_indices]):
+            return False
+        if len(continuous_indices) == 0:
+            return True
+        movement = (x_previous[:, continuous_indices] - x_best[:, continuous_indices]).abs().max()
+        return bool(movement <= self.interleave_tolerance)
+
+    def _propose_batch(
+        self,
+        model,
+        x_scaled: torch.Tensor,
+        fx_scaled: torch.Tensor,
+        batch_size: int,
+        x_pending: Optional[torch.Tensor] = None,
+    ) -> tuple[torch.Tensor, torch.Tensor, dict]:
+        """
+        Propose batch_size distinct points with the Kriging believer heuristic.
+
+        After each proposed point, the GP is conditioned on a fantasy observation at that point which equals its
+        posterior mean. This shrinks the posterior variance around the point, so the next point is proposed elsewhere.
+        Points that are still being evaluated (x_pending) are fantasized the same way before the first proposal.
+
+        With the acquisition function 'qaei', the batch is built greedily instead: each point maximizes the Monte-Carlo
+        AEI of the point together with the points proposed before and the pending points, without fantasies.
+
+        Args:
+            model: the fitted GP model
+            x_scaled: the observed points, in [0, 1]^d
+            fx_scaled: the standardized function values of the observed points
+            batch_size: the number of points to propose
+            x_pending: the points that are proposed but not evaluated yet, in [-1, 1]^d
+
+        Returns:
+            the proposed points in [-1, 1]^d with shape (batch_size, d), their acquisition values, and the trust region
+            state of the last proposal
+
+        """
+        # The incumbent is fixed by the real observations, the fantasies only change the posterior variance
+        acquisition_function = self._get_acquisition_function(model, x_scaled, fx_scaled)
+        joint = isinstance(acquisition_function, qAugmentedExpectedImprovement)
+        believer = model
+        pending = None if x_pending is None or len(x_pending) == 0 else (x_pending.to(dtype=x_scaled.dtype) + 1) / 2
+        if pending is not None:
+            if joint:
+                acquisition_function.set_X_pending(pending)
+            else:
+                believer = self._condition_on_believed_observations(believer, pending)
+                acquisition_function.model = believer
+
+        xs_best, fxs_best = list(), list()
+        for batch_index in range(batch_size):
+            if batch_size > 1:
+                logging.info(f"🧮 Proposing point {batch_index + 1}/{batch_size} of the batch")
+            x_best, fx_best, tr_state = self._propose(
+                model=believer,
+                acquisition_function=acquisition_function,
+                x_scaled=x_scaled,
+                fx_scaled=fx_scaled,
+                x_pending=pending,
             )
+            xs_best.append(x_best)
+            fxs_best.append(fx_best.reshape(-1))
+
+            if batch_index < batch_size - 1:
+                x_new = (x_best.detach() + 1) / 2
+                pending = x_new if pending is None else torch.vstack((pending, x_new))
+                if joint:
+                    acquisition_function.set_X_pending(pending)
+                else:
+                    believer = self._condition_on_believed_observations(believer, x_new)
+                    acquisition_function.model = believer
+
+        return torch.vstack(xs_best), torch.cat(fxs_best), tr_state
+
+    @staticmethod
+    def _condition_on_believed_observations(model, x: torch.Tensor):
+        """
+        Condition the GP on fantasy observations at x equal to the posterior mean (Kriging believer).
+
+        Args:
+            model: the GP model
+            x: the points to condition on, in [0, 1]^d
+
+        Returns:
+            the conditioned GP model
+
+        """
+        model.eval()
+        model.likelihood.eval()
+        with torch.no_grad():
+            believed_fx = model.posterior(x).mean
+        # condition_on_observations does not apply the input transform (e.g., appending the target fidelity)
+        return model.condition_on_observations(X=model.transform_inputs(x), Y=believed_fx)
+
+    def _evaluate_batch(self, xs_up: torch.Tensor, workload_size: Optional[str] = None) -> torch.Tensor:
+        """
+        Benchmark the points. If an evaluator is given, the points are benchmarked in parallel on its clusters.
+
+        Args:
+            xs_up: the points in the representation space, shape (n, representation_dim)
+            workload_size: if given, the workload size to benchmark on
 
-            self._all_split_budgets[tr_dim] = (
-                self._all_split_budgets[tr_dim] - self.batch_size
+        Returns:
+            the repeated function values, shape (n, BENCHMARKING_REPETITION), whether they are censored, shape (n,),
+            and whether the evaluations failed, shape (n,)
+
+        """
+        kwargs = dict(repeat=BENCHMARKING_REPETITION, stop_rule=self._stop_rule)
+        if workload_size is not None:
+            kwargs["workload_size"] = workload_size
+        if self.evaluator is not None and len(xs_up) > 1:
+            logging.info(f"[Benchmarking {len(xs_up)} points on {self.evaluator.n_workers} clusters]")
+            futures = self.evaluator.map(xs_up, **kwargs)
+            fxs = torch.concat([future.result() for future in futures])
+            censored, failed = [torch.concat(m) for m in zip(*[self._last_masks(future) for future in futures])]
+            return fxs, censored, failed
+        fxs, censored, failed = list(), list(), list()
+        for x_up in xs_up:
+            fxs.append(self.benchmark(x_up.unsqueeze(0), **kwargs))
+            _censored, _failed = self._last_masks(self.benchmark)
+            censored.append(_censored)
+            failed.append(_failed)
+        return torch.concat(fxs), torch.concat(censored), torch.concat(failed)
+
+    def _evaluate_multi_fidelity(
+        self,
+        xs_low_dim: list[torch.Tensor],
+        xs_high_dim: list[torch.Tensor],
+    ) -> tuple[list[torch.Tensor], list[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Screen the points on the cheapest workload size and promote the promising ones size by size up to the target
+        size. A point is promoted if its result is among the best FIDELITY_PARAM["promotion_quantile"] of the results
+        observed at the same size.
+
+        Args:
+            xs_low_dim: the points in the target space
+            xs_high_dim: the points in the representation space
+
+        Returns:
+            the evaluated points in the target space and in the representation space (one row per evaluation), the
+            repeated function values, whether they are censored, whether the evaluations failed, and the fidelities
+
+        """
+        active = list(range(len(xs_low_dim)))
+        rows_low_dim, rows_high_dim = list(), list()
+        fxs, censored, failed, fidelity = list(), list(), list(), list()
+        for level, workload_size in enumerate(self.fidelities):
+            value = self._fidelity_value(workload_size)
+            y, c, f = self._evaluate_batch(
+                torch.vstack([xs_high_dim[i] for i in active]), workload_size=workload_size
             )
-            self._n_evals += self.batch_size
+            rows_low_dim += [xs_low_dim[i] for i in active]
+            rows_high_dim += [xs_high_dim[i] for i in active]
+            fxs.append(y)
+            censored.append(c)
+            failed.append(f)
+            fidelity.append(torch.full((len(active),), value, dtype=self.dtype))
 
-            
-            self._add_data_to_tr_observations(
-                xs_down=torch.vstack(xs_low_dim), # if self.noise_mode > 1 else torch.vstack(xs_low_dim).repeat(BENCHMARKING_REPETITION, 1),
-                xs_up=torch.vstack(xs_high_dim), # if self.noise_mode > 1 else torch.vstack(xs_high_dim).repeat(BENCHMARKING_REPETITION, 1),
-                fxs=y_next.reshape(-1), # self.fx_tr
-                repeated_fxs=y_nexts,
-                repeated_xs_down=unique_x_init,
+            if level == len(self.fidelities) - 1:
+                break
+            active = [
+                i for j, i in enumerate(active)
+                if not (c[j] or f[j]) and self._promote(y[j].nanmean().item(), value)
+            ]
+            logging.info(
+                f"🔬 Promoted {len(active)} configurations from {workload_size} to {self.fidelities[level + 1]}"
             )
+            if len(active) == 0:
+                break
+        return (
+            rows_low_dim,
+            rows_high_dim,
+            torch.concat(fxs),
+            torch.concat(censored),
+            torch.concat(failed),
+            torch.concat(fidelity),
+        )
 
-            # Splitting trust regions that terminated
-            if self.trust_region.terminated:
-                if self.random_embedding.target_dim < self.benchmark.representation_dim:
-                    # Full dim is not reached yet
-                    logging.info(f"✂️ Splitting trust region")
-                
-                    index_mapping = self.random_embedding.split(
-                        self.number_new_bins_on_split
-                    )
+    def _fidelity_value(self, workload_size: str) -> float:
+        """
 
-                    # move data to higher-dimensional space
-                    self.x_tr = join_data(self.x_tr, index_mapping)
-                    self.x_global = join_data(self.x_global, index_mapping)
-                    
-                    self.trust_region = TrustRegion(
-                        dimensionality=self.random_embedding.target_dim
-                    )
-                    if self.tr_splits < self._n_splits:
-                        self.tr_splits += 1
+        Args:
+            workload_size: one of the sizes in self.fidelities
 
-                    self.split_budget = self._split_budget(
-                        self.initial_target_dimensionality
-                        * (self.number_new_bins_on_split + 1) ** self.tr_splits
-                    )
-                else:
-                    # Full dim is reached
-                    logging.info("🏁 Finished")
-                    # logging.info(
-                    #     f"🏁 Reached full dimensionality. Restarting with new random samples."
-                    # )
-                    # self.split_budget = self._split_budget(
-                    #     self.random_embedding.input_dim
-                    # )
-                    # # Reset the last split budget
-                    # self._all_split_budgets[self._forecasted_tr_dim] = self.split_budget
-
-                    # # empty tr data, does not delete the global data
-                    # self._reset_local_data()
-
-                    # # reset the trust region
-                    # self.trust_region.reset()
-
-                    # self.sample_init()
-            with lzma.open(os.path.join(self.results_dir, f"results.csv.xz"), "w") as f:
-                np.savetxt(
-                    f,
-                    np.hstack(
-                        (
-                            self.x_up_global.detach().cpu().numpy(),
-                            self.fx_global.detach().cpu().numpy().reshape(-1, 1),
-                        )
-                    ),
-                    delimiter=",",
-                )
-            
-            if self.fx_repeated is not None:
-                with lzma.open(os.path.join(self.results_dir, f"repeated_results.csv.xz"), "w") as f:
-                    np.savetxt(f, self.fx_repeated, delimiter=",")
-               
-        # with lzma.open(os.path.join(self.results_dir, f"fx_best_from_mean.csv.xz"), "a") as f:
-        #     np.savetxt(f, fx_best_stack, delimiter=",")
+        Returns:
+            the fidelity of the size in [0, 1], 0 for the cheapest and 1 for the target size
+
+        """
+        return self.fidelities.index(workload_size) / (len(self.fidelities) - 1)
+
+    def _promote(self, fx: float, fidelity: float) -> bool:
+        """
+
+        Args:
+            fx: the result of a configuration at the fidelity
+            fidelity: the fidelity the configuration was evaluated at
+
+        Returns:
+            whether the configuration should be evaluated at the next fidelity
+
+        """
+        valid = (self.fidelity_tr == fidelity) & ~(self.censored_tr | self.failed_tr)
+        observed = self.fx_tr[valid]
+        if len(observed) < FIDELITY_PARAM["min_observations"]:
+            return True
+        return (observed < fx).double().mean().item() <= FIDELITY_PARAM["promotion_quantile"]
+
+    @property
+    def _stop_rule(self):
+        """
+        The stop rule passed with a submission. The statistics of the incumbent are read here, on the main thread,
+        because the rule runs on the threads of the evaluator while `_tell` adds new observations.
+        """
+        if not self.racing:
+            return None
+        return functools.partial(self._should_stop_repeating, incumbent=self._incumbent_statistics())
+
+    def _incumbent_statistics(self) -> Optional[tuple[float, float, int]]:
+        """
+        The statistics the racing stop rule compares a configuration with.
+
+        The noise of a single run is estimated from the repeated results of all configurations, so the test can already
+        be done after the first run.
+
+        Returns:
+            the pooled standard deviation of a single run, the mean of the incumbent, and its number of runs, or None
+            if there are too few repeated results to race
+
+        """
+        fx_repeated, fx_tr = self.fx_repeated, self.fx_tr
+        valid = ~(self.censored_tr | self.failed_tr) & (self.fidelity_tr == 1)
+        if fx_repeated is None or len(fx_repeated) != len(valid) or not valid.any():
+            return None
+
+        n_runs = (~torch.isnan(fx_repeated)).sum(1)
+        repeated = n_runs > 1
+        if not repeated.any():
+            return None
+        # pooled standard deviation of a single run, skipped repetitions are NaN
+        centered = fx_repeated - fx_repeated.nanmean(dim=1, keepdim=True)
+        variances = torch.nansum(centered**2, dim=1)[repeated] / (n_runs[repeated] - 1)
+        sigma = variances.mean().sqrt()
+        if not sigma > 0:
+            return None
+
+        incumbent = torch.where(valid, fx_tr, torch.inf).argmin()
+        return sigma.item(), fx_tr[incumbent].item(), int(n_runs[incumbent].clamp_min(1).item())
+
+    @staticmethod
+    def _should_stop_repeating(results: list[float], incumbent: Optional[tuple[float, float, int]]) -> bool:
+        """
+        Race a configuration against the incumbent: stop repeating it once its mean is worse than the mean of the
+        incumbent by more than RACING_PARAM["z_threshold"] standard errors.
+
+        Args:
+            results: the results of the configuration so far
+            incumbent: the statistics of the incumbent when the configuration was submitted, see
+                `_incumbent_statistics`
+
+        Returns:
+            whether the remaining repetitions should be skipped
+
+        """
+        if incumbent is None:
+            return False
+        sigma, incumbent_mean, incumbent_runs = incumbent
+        standard_error = sigma * np.sqrt(1 / len(results) + 1 / incumbent_runs)
+        z = (np.mean(results) - incumbent_mean) / standard_error
+        return z > RACING_PARAM["z_threshold"]
+
+    @staticmethod
+    def _last_masks(source) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Get whether the result of the last evaluation is censored and whether it failed. A point is censored (failed)
+        if any of its repetitions is censored (failed).
+
+        Args:
+            source: the benchmark after the evaluation or the future of the evaluator
+
+        Returns:
+            the censored mask and the failed mask, shape (1,) each
+
+        """
+        masks = list()
+        for name in ("last_censored", "last_failed"):
+            mask = getattr(source, name, None)
+            if mask is None or mask.numel() == 0:
+                masks.append(torch.zeros(1, dtype=torch.bool))
+            else:
+                masks.append(mask.reshape(1, -1).any(dim=1))
+        return masks[0], masks[1]
+
+    def _update_cutoff(self):
+        """
+        Set the cutoff for early termination on all environments, relative to the best uncensored function value.
+
+        Returns:
+            None
+
+        """
+        if not self.early_termination:
+            return
+        uncensored = self.fx_tr[~(self.censored_tr | self.failed_tr) & (self.fidelity_tr == 1)]
+        incumbent = uncensored.min().item() if len(uncensored) > 0 else None
+        workers = [self.benchmark] + (self.evaluator.workers if self.evaluator is not None else [])
+        envs = {id(worker.env): worker.env for worker in workers if hasattr(getattr(worker, "env", None), "set_cutoff")}
+        for env in envs.values():
+            env.set_cutoff(incumbent)
 
-        # self.benchmark.env.calculate_improvement_from_default(best_fx=best_fx)
-        
-        self.get_best_solution(model=model)        
-        
     def get_best_solution(self, model):
         logging.info(f"✨✨✨ Evaluating best x... # of repetitions = {BENCHMARKING_REPETITION} ✨✨✨")
         
         x_scaled = (self.x_tr + 1) / 2
-        
+
+        if model.train_inputs[0].shape[-1] != x_scaled.shape[-1]:
+            # The trust region was split after the last fit, so the model lives in the previous embedding
+            model = self._fit_gp()[0]
+
         model.eval()
         model.likelihood.eval()
-        
+
         best_x = self.x_up_tr[model.posterior(x_scaled).mean.argmax(), :]
 
-        best_ys = self.benchmark(best_x.unsqueeze(0), repeat=BENCHMARKING_REPETITION)
+        if self.fidelities is not None:
+            best_ys = self.benchmark(best_x.unsqueeze(0), repeat=BENCHMARKING_REPETITION, workload_size=self.fidelities[-1])
+        else:
+            best_ys = self.benchmark(best_x.unsqueeze(0), repeat=BENCHMARKING_REPETITION)
         best_ys = list(best_ys.flatten().cpu().numpy())
         best_ys = [_ * -1 if _ < 0 else _ for _ in best_ys]
         # best_ys = []
@@ -603,6 +1292,9 @@ class NSBO(Bounce):
         repeated_xs_down: torch.Tensor,
         fxs: torch.Tensor,
         repeated_fxs: torch.Tensor,
+        censored: Optional[torch.Tensor] = None,
+        failed: Optional[torch.Tensor] = None,
+        fidelity: Optional[torch.Tensor] = None,
     ):
         """
         Add data to the tr local observations and save the selected trust regions to disk.
@@ -611,11 +1303,22 @@ class NSBO(Bounce):
             xs_down: the low-dimensional points that were evaluated in the trust regions
             xs_up:  the high-dimensional points that were evaluated in the trust regions
             fxs:  the function values of the high-dimensional points that were evaluated in the trust regions
+            censored: whether the function values are censored by early termination, all False if None
+            failed: whether the evaluations failed, all False if None
+            fidelity: the fidelities of the evaluations, the target fidelity (1) if None. Only the evaluations at the
+                target fidelity are added to the global observations and the results logs
 
         Returns:
             None
 
         """
+        n_points = len(fxs.reshape(-1))
+        if fidelity is None:
+            fidelity = torch.ones(n_points, dtype=self.fidelity_tr.dtype)
+        # Only the evaluations at the target size go to the global observations and the results logs, the screenings
+        # at smaller sizes are only used by the GP of the trust region
+        target = fidelity.reshape(-1).cpu() == 1
+
         if repeated_fxs is not None:
             self.fx_repeated = torch.cat(
                 (
@@ -623,6 +1326,7 @@ class NSBO(Bounce):
                     repeated_fxs.detach().cpu(),
                 )
             )
+            self._repeated_results_log.append(repeated_fxs.detach().cpu()[target].numpy())
         else:
             self.fx_repeated = None
         
@@ -642,12 +1346,21 @@ class NSBO(Bounce):
                 fxs.reshape(-1).detach().cpu(),
             )
         )
+        if censored is None:
+            censored = torch.zeros(n_points, dtype=torch.bool)
+        if failed is None:
+            failed = torch.zeros(n_points, dtype=torch.bool)
+        self.censored_tr = torch.cat((self.censored_tr, censored.reshape(-1).cpu()))
+        self.failed_tr = torch.cat((self.failed_tr, failed.reshape(-1).cpu()))
+        self.fidelity_tr = torch.cat((self.fidelity_tr, fidelity.reshape(-1).to(self.fidelity_tr)))
         self.x_tr = torch.vstack(
             (
                 self.x_tr,
                 xs_down.detach().cpu(),
             )
         )
+        # index the new points as they are passed to the candidate generation, i.e., in [0, 1]^d
+        self.x_tr_index.add((self.x_tr[len(self.x_tr_index):] + 1) / 2)
         self.x_up_tr = torch.vstack(
             (
                 self.x_up_tr,
@@ -656,9 +1369,9 @@ class NSBO(Bounce):
         )
 
         self._add_data_to_global_observations(
-            xs_down=xs_down,
-            xs_up=xs_up,
-            fxs=fxs,
+            xs_down=xs_down.detach().cpu()[target],
+            xs_up=xs_up.detach().cpu()[target],
+            fxs=fxs.reshape(-1).detach().cpu()[target],
         )
 
 # from botorch.models.model import Model
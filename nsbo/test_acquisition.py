@@ -0,0 +1,128 @@
+import torch
+from botorch.models import SingleTaskGP
+
+from nsbo.acquisition import (
+    AugmentedExpectedImprovement,
+    LogAugmentedExpectedImprovement,
+    PosteriorCache,
+    qAugmentedExpectedImprovement,
+)
+
+
+def _model(n: int = 10) -> SingleTaskGP:
+    torch.manual_seed(0)
+    x = torch.rand(n, 2, dtype=torch.float64)
+    return SingleTaskGP(x, (x**2).sum(dim=1, keepdim=True))
+
+
+def test_posterior_cache_reuses_an_unchanged_model():
+    model = _model()
+    xs = torch.rand(5, 2, dtype=torch.float64)
+    cache = PosteriorCache()
+
+    mean, sigma = cache.mean_and_sigma(model, xs)
+    cached_mean, cached_sigma = cache.mean_and_sigma(model, xs)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cached_mean is mean and cached_sigma is sigma
+
+
+def test_posterior_cache_is_invalidated_by_a_model_change():
+    model = _model()
+    xs = torch.rand(5, 2, dtype=torch.float64)
+    cache = PosteriorCache()
+    _, sigma = cache.mean_and_sigma(model, xs)
+
+    # set through the setter of gpytorch, as in a fit
+    model.train()
+    model.covar_module.outputscale = 5 * model.covar_module.outputscale
+    _, rescaled_sigma = cache.mean_and_sigma(model, xs)
+    assert cache.hits == 0
+    assert torch.all(rescaled_sigma > sigma)
+
+    # loaded hyperparameters, e.g., warm-started from the last fit
+    model.train()
+    hyperparameters = {k: v.clone() for k, v in model.state_dict().items()}
+    hyperparameters["likelihood.noise_covar.raw_noise"] += 1
+    model.load_state_dict(hyperparameters)
+    cache.mean_and_sigma(model, xs)
+    assert cache.hits == 0
+
+    # another model with the same data
+    cache.mean_and_sigma(_model(), xs)
+    assert (cache.hits, cache.misses) == (0, 4)
+
+
+def test_posterior_cache_is_invalidated_by_a_training_data_change():
+    model = _model()
+    xs = torch.rand(5, 2, dtype=torch.float64)
+    cache = PosteriorCache()
+    mean, _ = cache.mean_and_sigma(model, xs)
+
+    train_x = torch.vstack((model.train_inputs[0], xs))
+    train_y = torch.hstack((model.train_targets, (xs**2).sum(dim=1)))
+    model.set_train_data(inputs=train_x, targets=train_y, strict=False)
+    new_mean, _ = cache.mean_and_sigma(model, xs)
+    assert cache.hits == 0
+    assert not torch.allclose(new_mean, mean)
+
+    # the training targets changed in place
+    model.train_targets.add_(1)
+    cache.mean_and_sigma(model, xs)
+    # the points changed in place
+    xs.mul_(0.5)
+    cache.mean_and_sigma(model, xs)
+    assert (cache.hits, cache.misses) == (0, 4)
+
+
+def test_log_aei_is_the_log_of_aei():
+    model = _model()
+    xs = torch.rand(20, 2, dtype=torch.float64)
+    best_f = model.train_targets.max().item()
+
+    aei = AugmentedExpectedImprovement(model=model, best_f=best_f)(xs.unsqueeze(-2))
+    log_aei = LogAugmentedExpectedImprovement(model=model, best_f=best_f)(xs.unsqueeze(-2))
+
+    assert torch.all(aei > 0)
+    assert torch.allclose(log_aei, aei.log())
+
+
+def test_log_aei_is_finite_where_aei_underflows():
+    model = _model()
+    xs = torch.rand(20, 2, dtype=torch.float64)
+    # far above anything the model predicts, EI is below the smallest float
+    best_f = model.train_targets.max().item() + 1e3
+
+    aei = AugmentedExpectedImprovement(model=model, best_f=best_f)(xs.unsqueeze(-2))
+    log_aei = LogAugmentedExpectedImprovement(model=model, best_f=best_f)(xs.unsqueeze(-2))
+
+    assert torch.all(aei == 0)
+    assert torch.all(torch.isfinite(log_aei))
+    # the points can still be told apart
+    assert len(torch.unique(log_aei)) == len(xs)
+
+
+def test_aei_takes_one_point_per_row():
+    model = _model()
+    xs = torch.rand(20, 2, dtype=torch.float64)
+    best_f = model.train_targets.max().item()
+
+    for acquisition_function in (
+        AugmentedExpectedImprovement(model=model, best_f=best_f),
+        LogAugmentedExpectedImprovement(model=model, best_f=best_f),
+    ):
+        values = acquisition_function(xs)
+        assert values.shape == (20,)
+        assert torch.allclose(values, acquisition_function(xs.unsqueeze(-2)))
+
+
+def test_qaei_of_one_point_estimates_aei():
+    model = _model()
+    xs = torch.rand(20, 1, 2, dtype=torch.float64)
+    best_f = model.train_targets.max().item()
+
+    aei = AugmentedExpectedImprovement(model=model, best_f=best_f)(xs)
+    qaei = qAugmentedExpectedImprovement(model=model, best_f=best_f)(xs)
+
+    assert qaei.shape == aei.shape
+    assert torch.allclose(qaei, aei, atol=0.02 * aei.max().item())
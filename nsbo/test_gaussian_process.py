@@ -0,0 +1,114 @@
+import pytest
+import torch
+
+import nsbo.gaussian_process as gp
+from bounce.projection import AxUS
+from bounce.util.benchmark import Parameter, ParameterType
+from nsbo.gaussian_process import SurrogateManager, fit_mll, get_gp, impute_censored
+
+
+def _axus() -> AxUS:
+    parameters = [
+        Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1) for i in range(3)
+    ] + [
+        Parameter(name=f"x{i}", type=ParameterType.CONTINUOUS, lower_bound=0, upper_bound=1) for i in range(3)
+    ]
+    return AxUS(parameters=parameters, n_bins=6)
+
+
+def _data(axus: AxUS, n: int = 20):
+    torch.manual_seed(0)
+    x = torch.rand(n, axus.target_dim, dtype=torch.float64)
+    x[:, axus.discrete_indices] = x[:, axus.discrete_indices].round()
+    duration = 1 + (x**2).sum(dim=1)
+    return x, duration
+
+
+def test_imputed_durations_are_above_the_censoring_bound():
+    axus = _axus()
+    x, duration = _data(axus)
+    censored = torch.zeros(len(x), dtype=torch.bool)
+    censored[-5:] = True
+    # the runs were killed at a limit below their true duration
+    bound = duration.clone()
+    bound[censored] = duration[censored] - 0.5
+
+    # the GP maximizes the negative duration, so a censored value is an upper bound
+    imputed = -impute_censored(axus=axus, x=x, fx=-bound, censored=censored)
+
+    assert torch.all(imputed[censored] >= bound[censored])
+    assert torch.equal(imputed[~censored], bound[~censored])
+
+
+def test_imputation_reuses_the_fitted_hyperparameters(monkeypatch):
+    axus = _axus()
+    x, duration = _data(axus)
+    censored = torch.zeros(len(x), dtype=torch.bool)
+    censored[-3:] = True
+
+    model, train_x, train_fx = get_gp(axus=axus, x=x, fx=-duration)
+    fit_mll(model=model, train_x=train_x, train_fx=train_fx)
+    hyperparameters = model.state_dict()
+
+    def no_fit(*args, **kwargs):
+        raise AssertionError("the GP on the uncensored values must not be fitted")
+
+    monkeypatch.setattr(gp, "fit_mll", no_fit)
+    imputed = -impute_censored(axus=axus, x=x, fx=-duration, censored=censored, hyperparameters=hyperparameters)
+    assert torch.all(imputed[censored] >= duration[censored])
+
+    # hyperparameters of another embedding do not fit and the GP is fitted
+    with pytest.raises(AssertionError):
+        impute_censored(
+            axus=axus,
+            x=x,
+            fx=-duration,
+            censored=censored,
+            hyperparameters={"likelihood.noise_covar.raw_noise": torch.zeros(2)},
+        )
+
+
+def _fit(axus: AxUS, x, duration, manager: SurrogateManager):
+    model, train_x, train_fx = get_gp(axus=axus, x=x, fx=-duration)
+    manager.warm_start(model)
+    fit_mll(model=model, train_x=train_x, train_fx=train_fx)
+    manager.record(model=model, x=train_x, mean=torch.tensor(0.0), std=torch.tensor(1.0))
+    return model
+
+
+def test_hyperparameters_are_refit_every_k_calls():
+    axus = _axus()
+    x, duration = _data(axus, n=16)
+    manager = SurrogateManager(refit_every=3)
+
+    refits = list()
+    for i, n in enumerate(range(10, 17)):
+        if manager.needs_refit(x[:n]):
+            refits.append(i)
+            _fit(axus, x[:n], duration[:n], manager)
+            hyperparameters = {k: v.clone() for k, v in manager.model.state_dict().items()}
+        else:
+            model = manager.update(x=x[:n], fx=-duration[:n])
+            # the new observations are conditioned on with the hyperparameters of the last fit
+            assert model.train_inputs[0].shape[-2] == n
+            assert all(torch.equal(v, model.state_dict()[k]) for k, v in hyperparameters.items())
+    assert refits == [0, 3, 6]
+
+
+def test_split_or_changed_inputs_force_a_refit():
+    axus = _axus()
+    x, duration = _data(axus, n=12)
+    manager = SurrogateManager(refit_every=10)
+    _fit(axus, x[:10], duration[:10], manager)
+    assert not manager.needs_refit(x[:11])
+
+    # a split adds dimensions to the embedding
+    assert manager.needs_refit(torch.hstack((x[:11], torch.zeros(11, 1, dtype=x.dtype))))
+    # the earlier inputs changed, e.g., they were moved to a new embedding
+    moved = x[:11].clone()
+    moved[0] = 1 - moved[0]
+    assert manager.needs_refit(moved)
+    # the trust region was split and the manager invalidated
+    manager.invalidate()
+    assert manager.needs_refit(x[:11])
+    assert manager.hyperparameters is None
@@ -0,0 +1,406 @@
+import os
+import shutil
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import pytest
+import torch
+
+import nsbo.nsbo as nsbo_module
+
+from bounce.benchmarks import Benchmark
+from bounce.util.benchmark import Parameter, ParameterType
+from bounce.util.data_handling import from_1_around_origin
+from bounce.util.results import read_results, read_tr_states
+from envs.engine import EvaluationEngine, FakeCluster
+from envs.params import BENCHMARKING_REPETITION
+from nsbo.nsbo import NSBO
+
+
+class ToyBenchmark(Benchmark):
+    """
+    A cheap mixed benchmark with the interface of `SparkTuning`, the duration is a noisy quadratic.
+    """
+
+    def __init__(self):
+        parameters = [
+            Parameter(name=f"b{i}", type=ParameterType.BINARY, lower_bound=0, upper_bound=1) for i in range(4)
+        ] + [
+            Parameter(name=f"x{i}", type=ParameterType.CONTINUOUS, lower_bound=0, upper_bound=1) for i in range(3)
+        ]
+        super().__init__(parameters=parameters, noise_std=None)
+        self.env = SimpleNamespace(debugging=True, workload="toy", workload_size="large")
+        self.n_calls = 0
+
+    def __call__(
+        self,
+        x: torch.Tensor,
+        repeat: int = 1,
+        load: bool = True,
+        stop_rule: Optional[Callable[[list[float]], bool]] = None,
+        workload_size: Optional[str] = None,
+    ) -> torch.Tensor:
+        self.n_calls += 1
+        fx = 10 + ((x - 0.3) ** 2).sum(dim=1, keepdim=True)
+        return fx + 0.01 * torch.randn(len(x), max(1, int(repeat)), dtype=fx.dtype)
+
+
+class SizedToyBenchmark(ToyBenchmark):
+    """
+    The toy benchmark with HiBench workload sizes, a run at a smaller size takes proportionally less time.
+    """
+
+    sizes = {"small": 0.1, "large": 1.0}
+
+    def __init__(self):
+        super().__init__()
+        self.env.set_workload_size = lambda workload_size: None
+
+    def __call__(self, x: torch.Tensor, repeat: int = 1, workload_size: Optional[str] = None, **kwargs) -> torch.Tensor:
+        fx = super().__call__(x, repeat=repeat, **kwargs)
+        return fx * self.sizes[workload_size or self.env.workload_size]
+
+
+def _nsbo(benchmark: Optional[ToyBenchmark] = None, **kwargs) -> NSBO:
+    kwargs = dict(
+        n_init=5, initial_target_dimensionality=4, max_eval=8, max_eval_until_input=8, acquisition="aei"
+    ) | kwargs
+    return NSBO(benchmark=ToyBenchmark() if benchmark is None else benchmark, **kwargs)
+
+
+@pytest.fixture
+def nsbo(tmp_path, monkeypatch):
+    # the results are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    torch.manual_seed(0)
+    tuner = _nsbo()
+    tuner.sample_init()
+    return tuner
+
+
+def test_batch_proposals_are_distinct_and_fantasies_do_not_leak(nsbo):
+    model, x_scaled, fx_scaled, mean, std = nsbo._fit_gp()
+    train_x, train_y = model.train_inputs[0].clone(), model.train_targets.clone()
+    x_tr = nsbo.x_tr.clone()
+
+    xs, fxs, _ = nsbo._propose_batch(model=model, x_scaled=x_scaled, fx_scaled=fx_scaled, batch_size=3)
+
+    assert xs.shape == (3, nsbo.random_embedding.target_dim)
+    assert len(torch.unique(xs, dim=0)) == 3
+    assert fxs.shape == (3,)
+    # the believed observations only live in the conditioned copies of the model
+    assert torch.equal(model.train_inputs[0], train_x)
+    assert torch.equal(model.train_targets, train_y)
+    assert torch.equal(nsbo.x_tr, x_tr)
+
+
+def test_joint_batch_proposals_with_qaei(nsbo):
+    nsbo.acquisition = "qaei"
+    model, x_scaled, fx_scaled, mean, std = nsbo._fit_gp()
+    train_x = model.train_inputs[0].clone()
+
+    xs, fxs, _ = nsbo._propose_batch(model=model, x_scaled=x_scaled, fx_scaled=fx_scaled, batch_size=3)
+
+    assert xs.shape == (3, nsbo.random_embedding.target_dim)
+    assert len(torch.unique(xs, dim=0)) == 3
+    assert torch.all(torch.isfinite(fxs))
+    assert torch.equal(model.train_inputs[0], train_x)
+
+
+def _count_rounds(nsbo, monkeypatch, moves: float) -> int:
+    """Propose one point with rounds whose continuous step moves the proposal by `moves`, count the rounds."""
+    model, x_scaled, fx_scaled, mean, std = nsbo._fit_gp()
+    x = torch.zeros(1, nsbo.random_embedding.target_dim, dtype=x_scaled.dtype)
+    rounds = list()
+
+    def discrete(x_bests, **kwargs):
+        return x.clone(), torch.zeros(1), dict()
+
+    def continuous(x_bests, indices_to_optimize, **kwargs):
+        x_best = x_bests.clone()
+        x_best[:, indices_to_optimize] = moves * len(rounds)
+        rounds.append(x_best)
+        return x_best, torch.zeros(1), dict()
+
+    monkeypatch.setattr(nsbo_module, "create_candidates_discrete", discrete)
+    monkeypatch.setattr(nsbo_module, "create_candidates_continuous", continuous)
+    nsbo._propose(model=model, acquisition_function=None, x_scaled=x_scaled, fx_scaled=fx_scaled)
+    return len(rounds)
+
+
+def test_interleaving_stops_once_the_proposal_does_not_move(nsbo, monkeypatch):
+    nsbo.n_interleaved = 5
+    nsbo.interleave_tolerance = 1e-3
+    assert _count_rounds(nsbo, monkeypatch, moves=0.0) == 2
+    assert _count_rounds(nsbo, monkeypatch, moves=0.1) == 5
+
+
+@pytest.mark.parametrize("tolerance", [None, 0])
+def test_interleaving_runs_all_rounds_without_a_tolerance(nsbo, monkeypatch, tolerance):
+    assert nsbo_module.CANDIDATE_PARAM["interleave_tolerance"] is None
+    nsbo.n_interleaved = 5
+    nsbo.interleave_tolerance = tolerance
+    assert _count_rounds(nsbo, monkeypatch, moves=0.0) == 5
+
+
+def test_racing_rule_uses_the_incumbent_at_submission(nsbo):
+    nsbo.racing = True
+    stop_rule = nsbo._stop_rule
+    incumbent = nsbo.fx_tr.min().item()
+
+    assert stop_rule([incumbent + 1.0])
+    assert not stop_rule([incumbent, incumbent])
+
+    # the main thread adds an observation while the rule runs on a worker thread
+    nsbo.fx_tr = torch.cat((nsbo.fx_tr, torch.tensor([incumbent - 5.0], dtype=nsbo.fx_tr.dtype)))
+    assert stop_rule([incumbent + 1.0])
+    assert not stop_rule([incumbent, incumbent])
+
+
+def test_no_racing_without_repeated_results(nsbo):
+    nsbo.racing = True
+    nsbo.fx_repeated = nsbo.fx_repeated[:, :1]
+    assert not nsbo._stop_rule([1e6])
+
+    nsbo.racing = False
+    assert nsbo._stop_rule is None
+
+
+def test_resume_after_the_budget_was_used_up(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "tuned.conf").write_text("b0=true\n")
+    monkeypatch.setattr(nsbo_module, "CONF_PATH", str(tmp_path / "tuned.conf"))
+    torch.manual_seed(0)
+
+    # the run is killed while it evaluates the best solution, after the last checkpoint
+    def killed(self, model):
+        raise KeyboardInterrupt()
+
+    tuner = _nsbo(max_eval=6, max_eval_until_input=6)
+    with monkeypatch.context() as m:
+        m.setattr(NSBO, "get_best_solution", killed)
+        with pytest.raises(KeyboardInterrupt):
+            tuner.run()
+    assert tuner._n_evals > tuner.maximum_number_evaluations
+
+    benchmark = ToyBenchmark()
+    resumed = _nsbo(benchmark=benchmark, max_eval=6, max_eval_until_input=6)
+    resumed.load_checkpoint(tuner.results_dir)
+    assert resumed._n_evals == tuner._n_evals
+    resumed.run()
+    # only the best solution is benchmarked again
+    assert benchmark.n_calls == 1
+
+
+def test_asynchronous_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    torch.manual_seed(0)
+    # the last (continuous) parameter sets how long a run takes, so the results come back out of order
+    clusters = [
+        FakeCluster(objective=lambda x: 10 + ((x - 0.3) ** 2).sum(), delay=lambda x: 0.002 + 0.02 * x[-1].item())
+        for _ in range(3)
+    ]
+    engine = EvaluationEngine(clusters)
+    tuner = _nsbo(evaluator=engine, asynchronous=True, max_eval=16, max_eval_until_input=12)
+    tuner.sample_init()
+    n_init = tuner._n_evals
+
+    proposals, submitted, in_flight_at_split = list(), list(), list()
+    running = dict()
+
+    propose_batch = NSBO._propose_batch
+
+    def recording_propose_batch(self, **kwargs):
+        xs, fxs, tr_state = propose_batch(self, **kwargs)
+        proposals.append((kwargs["x_pending"], xs))
+        return xs, fxs, tr_state
+
+    submit = engine.submit
+
+    def recording_submit(x, **kwargs):
+        # no duplicate is submitted while the configuration is in flight
+        assert not any(torch.equal(x, running_x) for running_x in running.values())
+        future = submit(x, **kwargs)
+        submitted.append(x)
+        running[future] = x
+        return future
+
+    update_tr_state = nsbo_module.update_tr_state
+
+    def splitting_update_tr_state(trust_region, **kwargs):
+        # split on the first result that comes in while other configurations are pending
+        update_tr_state(trust_region=trust_region, **kwargs)
+        if len(running) > 0 and len(in_flight_at_split) == 0:
+            trust_region.terminated = True
+
+    tell = NSBO._tell
+
+    def checking_tell(self, xs_low_dim, xs_high_dim, **kwargs):
+        # the point in the target space still belongs to the configuration that was run, also after a split
+        x_up = from_1_around_origin(
+            self.random_embedding.project_up(xs_low_dim[0].T).T,
+            lb=self.benchmark.lb_vec,
+            ub=self.benchmark.ub_vec,
+        )
+        assert torch.allclose(x_up, xs_high_dim[0])
+        for future, x in list(running.items()):
+            if torch.equal(x, xs_high_dim[0]) and future.done():
+                running.pop(future)
+                break
+        index_mapping = tell(self, xs_low_dim=xs_low_dim, xs_high_dim=xs_high_dim, **kwargs)
+        if index_mapping is not None:
+            in_flight_at_split.append(len(running))
+        return index_mapping
+
+    monkeypatch.setattr(NSBO, "_propose_batch", recording_propose_batch)
+    monkeypatch.setattr(engine, "submit", recording_submit)
+    monkeypatch.setattr(NSBO, "_tell", checking_tell)
+    monkeypatch.setattr(nsbo_module, "update_tr_state", splitting_update_tr_state)
+    tuner._run_asynchronous()
+    engine.shutdown()
+
+    # the budget is enforced on the submissions, as in the synchronous loop
+    assert len(submitted) == tuner.maximum_number_evaluations + 1 - n_init
+    assert tuner._n_evals == tuner.maximum_number_evaluations + 1
+    # the proposals are placed away from the configurations that are still running
+    for x_pending, xs in proposals:
+        assert len(torch.unique(xs, dim=0)) == len(xs)
+        if x_pending is not None:
+            assert not any(torch.equal(x, p) for x in xs for p in x_pending)
+    assert any(x_pending is not None for x_pending, _ in proposals)
+    # the trust region was split while other configurations were pending
+    assert in_flight_at_split and in_flight_at_split[0] > 0
+
+
+@pytest.fixture
+def multi_fidelity_nsbo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    torch.manual_seed(0)
+    tuner = _nsbo(benchmark=SizedToyBenchmark(), fidelities=["small", "large"])
+    tuner.sample_init()
+    return tuner
+
+
+def _screen(tuner, fxs: list[float]):
+    """Add screenings at the smallest size with the given results."""
+    n = len(fxs)
+    tuner._add_data_to_tr_observations(
+        xs_down=torch.rand(n, tuner.random_embedding.target_dim, dtype=tuner.dtype) * 2 - 1,
+        xs_up=torch.rand(n, tuner.benchmark.representation_dim, dtype=tuner.dtype),
+        fxs=torch.tensor(fxs, dtype=tuner.dtype),
+        repeated_fxs=torch.tensor(fxs, dtype=tuner.dtype).unsqueeze(1).repeat(1, BENCHMARKING_REPETITION),
+        repeated_xs_down=None,
+        fidelity=torch.zeros(n),
+    )
+
+
+def test_promotion_of_the_screened_configurations(multi_fidelity_nsbo, monkeypatch):
+    tuner = multi_fidelity_nsbo
+    # always promoted until enough configurations are screened at the size
+    assert tuner._promote(100.0, 0.0)
+    _screen(tuner, [1.0, 2.0, 3.0, 4.0, 5.0])
+    assert tuner._promote(1.5, 0.0)
+    assert not tuner._promote(4.5, 0.0)
+
+    # the first point is among the best screenings, the second is not
+    results = {"small": torch.tensor([[1.2, 1.2, 1.2], [4.5, 4.5, 4.5]], dtype=tuner.dtype), "large": None}
+
+    def evaluate_batch(xs_up, workload_size=None):
+        fxs = results[workload_size]
+        if fxs is None:
+            fxs = torch.full((len(xs_up), BENCHMARKING_REPETITION), 12.0, dtype=tuner.dtype)
+        return fxs[: len(xs_up)], torch.zeros(len(xs_up), dtype=torch.bool), torch.zeros(len(xs_up), dtype=torch.bool)
+
+    monkeypatch.setattr(tuner, "_evaluate_batch", evaluate_batch)
+    xs_low_dim = [torch.full((1, tuner.random_embedding.target_dim), v, dtype=tuner.dtype) for v in (0.1, 0.2)]
+    xs_high_dim = [torch.full((1, tuner.benchmark.representation_dim), v, dtype=tuner.dtype) for v in (0.1, 0.2)]
+    rows_low_dim, rows_high_dim, fxs, censored, failed, fidelity = tuner._evaluate_multi_fidelity(
+        xs_low_dim=xs_low_dim, xs_high_dim=xs_high_dim
+    )
+
+    assert fidelity.tolist() == [0.0, 0.0, 1.0]
+    assert torch.equal(rows_high_dim[2], xs_high_dim[0])
+    assert fxs[:, 0].tolist() == [1.2, 4.5, 12.0]
+
+
+def test_fidelities_are_standardized_separately(multi_fidelity_nsbo):
+    tuner = multi_fidelity_nsbo
+    _screen(tuner, [1.0, 1.1, 1.3, 0.9])
+
+    model, x_scaled, fx_scaled, mean, std = tuner._fit_gp()
+
+    for value in (0.0, 1.0):
+        group = tuner.fidelity_tr == value
+        assert torch.isclose(fx_scaled[group].mean(), torch.tensor(0.0, dtype=fx_scaled.dtype), atol=1e-9)
+        assert torch.isclose(fx_scaled[group].std(), torch.tensor(1.0, dtype=fx_scaled.dtype))
+    target = tuner.fidelity_tr == 1
+    assert torch.isclose(mean, tuner.fx_tr[target].mean())
+    assert torch.isclose(std, tuner.fx_tr[target].std())
+
+    # the incumbent of EI is taken at the target size
+    tuner.acquisition = "ei"
+    acquisition_function = tuner._get_acquisition_function(model, x_scaled, fx_scaled)
+    assert acquisition_function.best_f.item() == pytest.approx((-fx_scaled[target]).max().item())
+
+
+def test_only_evaluations_at_the_target_size_count_and_are_logged(multi_fidelity_nsbo):
+    tuner = multi_fidelity_nsbo
+    n_evals, n_global, n_tr = tuner._n_evals, len(tuner.fx_global), len(tuner.fx_tr)
+    assert tuner._results_log.n_rows == n_global == n_evals
+
+    model, x_scaled, fx_scaled, mean, std = tuner._fit_gp()
+    # two configurations were screened, one of them was promoted to the target size
+    x_down = torch.zeros(2, tuner.random_embedding.target_dim, dtype=tuner.dtype)
+    x_up = torch.full((2, tuner.benchmark.representation_dim), 0.5, dtype=tuner.dtype)
+    tuner._tell(
+        model=model,
+        x_scaled=x_scaled,
+        xs_low_dim=[x_down[0:1], x_down[1:2], x_down[0:1]],
+        xs_high_dim=[x_up[0:1], x_up[1:2], x_up[0:1]],
+        y_nexts=torch.tensor([[1.0] * 3, [1.5] * 3, [10.0] * 3], dtype=tuner.dtype),
+        tr_state=dict(),
+        mean=mean,
+        std=std,
+        fidelity=torch.tensor([0.0, 0.0, 1.0]),
+    )
+
+    # the GP of the trust region sees all three evaluations
+    assert len(tuner.fx_tr) == n_tr + 3
+    assert tuner.fidelity_tr[-3:].tolist() == [0.0, 0.0, 1.0]
+    # the budget, the global observations, and the logs only the one at the target size
+    assert tuner._n_evals == n_evals + 1
+    assert len(tuner.fx_global) == n_global + 1
+    assert tuner.fx_global[-1].item() == 10.0
+    assert tuner._results_log.n_rows == n_global + 1
+    assert tuner._repeated_results_log.n_rows == n_global + 1
+
+
+def test_resume_from_a_moved_results_directory(tmp_path, monkeypatch):
+    (tmp_path / "tuned.conf").write_text("b0=true\n")
+    monkeypatch.setattr(nsbo_module, "CONF_PATH", str(tmp_path / "tuned.conf"))
+    os.makedirs(tmp_path / "first")
+    monkeypatch.chdir(tmp_path / "first")
+    torch.manual_seed(0)
+    tuner = _nsbo(max_eval=7, max_eval_until_input=7)
+    tuner.sample_init()
+    tuner.save_checkpoint()
+    n_evals = tuner._n_evals
+    # the results directory is relative to the working directory of the first run
+    assert not os.path.isabs(tuner.results_dir)
+
+    moved = tmp_path / "moved"
+    shutil.move(tuner.results_dir, moved)
+    os.makedirs(tmp_path / "second")
+    monkeypatch.chdir(tmp_path / "second")
+    resumed = _nsbo(max_eval=7, max_eval_until_input=7)
+    resumed.load_checkpoint(str(moved))
+    resumed.run()
+
+    # all logs are written to the moved directory and nothing to the old path
+    assert resumed._n_evals > n_evals
+    assert not os.path.exists(tmp_path / "first" / tuner.results_dir)
+    assert not os.path.exists(tmp_path / "second" / tuner.results_dir)
+    assert read_results(str(moved / "results")).shape[0] == len(resumed.fx_global)
+    assert read_results(str(moved / "repeated_results")).shape[0] == len(resumed.fx_repeated)
+    # one trust region state per proposal of the resumed run
+    assert len(read_tr_states(str(moved / "tr_state.jsonl"))) == resumed._n_evals - n_evals
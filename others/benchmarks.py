@@ -3,6 +3,7 @@ from ConfigSpace import Configuration, ConfigurationSpace
 from random_search.benchmarks import SparkBench, PostgresBench
 from others.adapters.low_embeddings import LinearEmbeddingConfigSpace
 from envs.params import BENCHMARKING_REPETITION
+from envs.cache import EvaluationCache
 from others.adapters.bias_sampling import PostgresBiasSampling
 
 class Benchmark(SparkBench):
@@ -15,10 +16,13 @@ class Benchmark(SparkBench):
         alter: bool = True,
         debugging: bool = False,
         quantization_factor: int = None,
+        cache: EvaluationCache = None,
     ):
         self.embed_adapter_alias = embed_adapter_alias
         self.target_dim = target_dim
         self._quantization_factor = quantization_factor
+        # If given, completed runs are stored and reused for identical configuration files
+        self.cache = cache
         
         assert self.embed_adapter_alias in ['rembo', 'hesbo', 'ddpg', 'none'], "embed_adapter_alias should be defined to 'rembo', 'hesbo', or 'ddpg'."
         
@@ -51,18 +55,29 @@ class Benchmark(SparkBench):
             sample = self.embedding_adapter.unproject_point(sample)
         
         self.save_configuration_file(sample)
+        
+        key, res = None, []
+        if self.cache is not None:
+            key = self.cache.key(self.config_path, self.workload, self.workload_size)
+            res = self.cache.lookup(key)[:BENCHMARKING_REPETITION if repeat else 1]
+            if len(res) > 0:
+                logging.info(f"🗃 Reusing {len(res)} cached results")
     
         if repeat:
-            res = []
-            self.apply_configuration()
-            for _ in range(BENCHMARKING_REPETITION):
+            if len(res) < BENCHMARKING_REPETITION:
+                self.apply_configuration()
+            for _ in range(len(res), BENCHMARKING_REPETITION):
                 self.run_configuration(load)
                 res_ = self.get_results()
                 res.append(res_)
                 load = False
-        else:
+                if key is not None and not self.censored_flag and not self.fail_conf_flag:
+                    self.cache.add(key, res_)
+        elif len(res) == 0:
             self.apply_and_run_configuration(load)
             res = self.get_results()
+            if key is not None and not self.censored_flag and not self.fail_conf_flag:
+                self.cache.add(key, res)
             res = list(res)
             
         return res # [3] or [1]